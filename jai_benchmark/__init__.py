@@ -27,10 +27,24 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import os
+import importlib
 
-from . import pipelines, datasets, preprocess, sessions, postprocess, metrics, utils, tools
 from . import constants
-from . import config_settings
+
+
+# the sub-packages are imported when they are used for the first time (PEP 562) - so that tools such as
+# generate_report or package_artifacts, and each ParallelRun worker, import only what they need.
+# 'from jai_benchmark import *' still imports all of them.
+__all__ = ['pipelines', 'datasets', 'preprocess', 'sessions', 'postprocess', 'metrics', 'utils', 'tools',
+           'constants', 'config_dict', 'config_settings', 'get_settings_file']
+
+
+def __getattr__(name):
+    if name in __all__:
+        # importing the sub-module also sets it as an attribute of this package
+        return importlib.import_module(f'.{name}', __name__)
+    #
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def get_settings_file(target_device='pc', with_model_import=False):
@@ -118,6 +118,42 @@ class ConfigDict(dict):
         # but the size of the list determines the number of parallel processes
         # if you have gpu's these wil be used for CUDA_VISIBLE_DEVICES. eg. [0,1,2,3,0,1,2,3]
         self.parallel_devices = None #[0,1,2,3,0,1,2,3]
+        # number of times a model is run again if its process crashes (eg. segfault) during parallel execution
+        self.parallel_max_retries = 1
+        # for parallel execution - if this is also given (a list like parallel_devices), import and inference run as
+        # separate tasks: import in the processes of parallel_devices and inference in the processes of this.
+        # the inference of a model then runs while the next models are being imported. None runs both in one task.
+        self.parallel_inference_devices = None
+        # number of workers that read and preprocess the frames ahead of inference (and the calibration frames in import).
+        # 0 disables prefetching.
+        # when prefetching is enabled, postprocess of a frame also overlaps with the inference of the next frame.
+        self.prefetch_workers = 0
+        # type of prefetch workers - 'thread' or 'process'
+        self.prefetch_worker_type = 'thread'
+        # max number of preprocessed frames kept ready. if None, it will be twice of prefetch_workers
+        self.prefetch_frames = None
+        # folder to cache the preprocessed input tensors of classification models - these are shared across models
+        # that use the same preprocessing, so that the images need not be decoded again. None disables the cache.
+        self.preprocess_cache_path = None
+        # folder to cache the preprocessed calibration tensors - these are shared across models that use the same
+        # calibration dataset and preprocessing. it must be different from preprocess_cache_path. None disables the cache.
+        self.calibration_cache_path = None
+        # folder to cache the compiled artifacts of tvmdlr models - keyed by the model, runtime_options and
+        # calibration data, so that import of an unchanged configuration skips the build. None disables the cache.
+        self.build_cache_path = None
+        # folder to store the file lists of the datasets as memory-mapped files - the processes of a parallel run
+        # (parallel_devices) then share them, instead of each having a copy. None disables it.
+        self.dataset_index_path = None
+        # number of frames given to the runtime in one call during inference. 1 (default) infers one frame at a time.
+        # more than 1 can improve the throughput of accuracy runs on pc, but then the inference time is not per frame.
+        # if the runtime or the model cannot run batched, the frames are inferred one at a time - as is the case for
+        # models offloaded to TIDL (tidl_offload), since their artifacts are compiled for a batch of 1.
+        self.inference_batch_size = 1
+        # compression of the packaged model artifacts - 'gz' (.tar.gz) or 'zst' (.tar.zst - needs the zstandard package)
+        self.package_compression = 'gz'
+        # number of model artifacts packaged in parallel. if None, it will be the number of cpus.
+        # the cpus that are not used by the parallel packaging are used for multi-threaded compression of each package.
+        self.package_workers = None
         # quantization bit precision
         self.tensor_bits = 8 #8 #16 #32
         # runtime_options can be specified as a dict. eg {'accuracy_level': 0}
@@ -55,4 +55,6 @@ MODEL_TYPES = [MODEL_TYPE_ONNX, MODEL_TYPE_TFLITE, MODEL_TYPE_MXNET]
 SESSION_NAME_TVMDLR = 'tvmdlr'
 SESSION_NAME_TFLITERT = 'tflitert'
 SESSION_NAME_ONNXRT = 'onnxrt'
-SESSION_NAMES = [SESSION_NAME_TVMDLR, SESSION_NAME_TFLITERT, SESSION_NAME_ONNXRT]
+# mock session that does not need a runtime - to measure the overhead of the benchmark harness
+SESSION_NAME_MOCK = 'mock'
+SESSION_NAMES = [SESSION_NAME_TVMDLR, SESSION_NAME_TFLITERT, SESSION_NAME_ONNXRT, SESSION_NAME_MOCK]
@@ -26,58 +26,79 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from .image_cls import *
-from .image_seg import *
-from .image_det import *
+import sys
+from .. import utils
+from .dataset_base import *
 
-from .coco_det import *
-from .coco_seg import *
-from .imagenet import *
-from .imagenetv2 import *
-from .cityscapes import *
-from .ade20k import *
-from .voc_seg import *
-from .nyudepthv2 import *
-from .modelmaker_datasets import *
 
-from .kitti_lidar_det import *
+# the dataset modules import their dependencies (eg. pycocotools, xtcocotools, h5py, scipy)
+# so they are imported only when a dataset type from them is used.
+_dataset_modules = {
+    'image_cls': '.image_cls', 'ImageClassification': '.image_cls', 'ImageClassificationEvaluator': '.image_cls',
+    'image_seg': '.image_seg', 'ImageSegmentation': '.image_seg',
+    'image_det': '.image_det', 'ImageDetection': '.image_det',
+    'coco_det': '.coco_det', 'COCODetection': '.coco_det',
+    'coco_det_label_offset_80to90': '.coco_det', 'coco_det_label_offset_90to90': '.coco_det',
+    'coco_seg': '.coco_seg', 'COCOSegmentation': '.coco_seg',
+    'imagenet': '.imagenet', 'BaseImageNetCls': '.imagenet', 'ImageNetCls': '.imagenet',
+    'TinyImageNet200Cls': '.imagenet', 'ImageNetResized64x64Cls': '.imagenet',
+    'ImageNetDogs120Cls': '.imagenet', 'ImageNetPseudo120Cls': '.imagenet',
+    'imagenetv2': '.imagenetv2', 'ImageNetV2': '.imagenetv2', 'ImageNetV2A': '.imagenetv2',
+    'ImageNetV2B': '.imagenetv2', 'ImageNetV2C': '.imagenetv2',
+    'cityscapes': '.cityscapes', 'CityscapesSegmentation': '.cityscapes',
+    'ade20k': '.ade20k', 'ADE20KSegmentation': '.ade20k',
+    'voc_seg': '.voc_seg', 'VOC2012Segmentation': '.voc_seg',
+    'nyudepthv2': '.nyudepthv2', 'NYUDepthV2': '.nyudepthv2', 'NYUDepthV2Evaluator': '.nyudepthv2',
+    'modelmaker_datasets': '.modelmaker_datasets', 'ModelMakerDetectionDataset': '.modelmaker_datasets',
+    'kitti_lidar_det': '.kitti_lidar_det', 'KittiLidar3D': '.kitti_lidar_det',
+    'coco_kpts': '.coco_kpts', 'COCOKeypoints': '.coco_kpts', '_get_mapping_id_name': '.coco_kpts',
+}
 
-from .coco_kpts import *
 
+def __getattr__(name):
+    return utils.import_attr(__name__, _dataset_modules, name)
+
+
+def get_dataset_type(dataset_type):
+    '''dataset_type can be the dataset class or its name - the name is imported from this package'''
+    return getattr(sys.modules[__name__], dataset_type) if isinstance(dataset_type, str) else dataset_type
+
+
+# the type of each dataset is given by name - it is imported only when the dataset is created
 dataset_info_dict = {
     #------------------------image classification datasets--------------------------#
     # Original ImageNet
-    'imagenet':{'task_type':'classification', 'category':'imagenet', 'type':ImageNetCls, 'size':50000, 'split':'val'},
-    'imagenetv1':{'task_type':'classification', 'category':'imagenet', 'type':ImageNetCls, 'size':50000, 'split':'val'},
+    'imagenet':{'task_type':'classification', 'category':'imagenet', 'type':'ImageNetCls', 'size':50000, 'split':'val'},
+    'imagenetv1':{'task_type':'classification', 'category':'imagenet', 'type':'ImageNetCls', 'size':50000, 'split':'val'},
     # ImageNetV2 as explained in imagenet_v2.py
-    'imagenetv2c':{'task_type':'classification', 'category':'imagenet', 'type':ImageNetV2C, 'size':10000, 'split':'val'},
-    'imagenetv2b':{'task_type':'classification', 'category':'imagenet', 'type':ImageNetV2B, 'size':10000, 'split':'val'},
-    'imagenetv2a':{'task_type':'classification', 'category':'imagenet', 'type':ImageNetV2A, 'size':10000, 'split':'val'},
+    'imagenetv2c':{'task_type':'classification', 'category':'imagenet', 'type':'ImageNetV2C', 'size':10000, 'split':'val'},
+    'imagenetv2b':{'task_type':'classification', 'category':'imagenet', 'type':'ImageNetV2B', 'size':10000, 'split':'val'},
+    'imagenetv2a':{'task_type':'classification', 'category':'imagenet', 'type':'ImageNetV2A', 'size':10000, 'split':'val'},
     # smaller versions of the original ImageNet
-    'tiny-imagenet200':{'task_type':'classification', 'category':'imagenet', 'type':TinyImageNet200Cls, 'size':10000, 'split':'val'},
-    'imagenet-dogs120':{'task_type':'classification', 'category':'imagenet', 'type':ImageNetDogs120Cls, 'size':20580, 'split':'train'},
-    'imagenet-pseudo120':{'task_type':'classification', 'category':'imagenet', 'type':ImageNetPseudo120Cls, 'size':20580, 'split':'train'},
-    'imagenet-resized-64x64':{'task_type':'classification', 'category':'imagenet', 'type':ImageNetResized64x64Cls, 'size':50000, 'split':'val'},
+    'tiny-imagenet200':{'task_type':'classification', 'category':'imagenet', 'type':'TinyImageNet200Cls', 'size':10000, 'split':'val'},
+    'imagenet-dogs120':{'task_type':'classification', 'category':'imagenet', 'type':'ImageNetDogs120Cls', 'size':20580, 'split':'train'},
+    'imagenet-pseudo120':{'task_type':'classification', 'category':'imagenet', 'type':'ImageNetPseudo120Cls', 'size':20580, 'split':'train'},
+    'imagenet-resized-64x64':{'task_type':'classification', 'category':'imagenet', 'type':'ImageNetResized64x64Cls', 'size':50000, 'split':'val'},
     #------------------------object detection datasets--------------------------#
-    'coco': {'task_type':'detection', 'category':'coco', 'type':COCODetection, 'size':5000, 'split':'val2017'},
+    'coco': {'task_type':'detection', 'category':'coco', 'type':'COCODetection', 'size':5000, 'split':'val2017'},
     #------------------------semantic segmentation datasets--------------------------#
-    'ade20k32': {'task_type':'segmentation', 'category':'ade20k32', 'type':ADE20KSegmentation, 'size':2000, 'split':'validation'},
-    'ade20k': {'task_type':'segmentation', 'category':'ade20k', 'type':ADE20KSegmentation, 'size':2000, 'split':'validation'},
-    'voc2012': {'task_type':'segmentation', 'category':'voc2012', 'type':VOC2012Segmentation, 'size':1449, 'split':'val'},
-    'cocoseg21': {'task_type':'segmentation', 'category':'cocoseg21', 'type':COCOSegmentation, 'size':5000, 'split':'val2017'},
+    'ade20k32': {'task_type':'segmentation', 'category':'ade20k32', 'type':'ADE20KSegmentation', 'size':2000, 'split':'validation'},
+    'ade20k': {'task_type':'segmentation', 'category':'ade20k', 'type':'ADE20KSegmentation', 'size':2000, 'split':'validation'},
+    'voc2012': {'task_type':'segmentation', 'category':'voc2012', 'type':'VOC2012Segmentation', 'size':1449, 'split':'val'},
+    'cocoseg21': {'task_type':'segmentation', 'category':'cocoseg21', 'type':'COCOSegmentation', 'size':5000, 'split':'val2017'},
     #------------------------pose estimation datasets--------------------------#
-    'cocokpts': {'task_type':'keypoint_detection', 'category':'cocokpts', 'type':COCOKeypoints, 'size':5000, 'split':'val2017'},
+    'cocokpts': {'task_type':'keypoint_detection', 'category':'cocokpts', 'type':'COCOKeypoints', 'size':5000, 'split':'val2017'},
     #------------------------depth estimation datasets--------------------------#
-    'nyudepthv2': {'task_type':'depth_estimation', 'category':'nyudepthv2', 'type':NYUDepthV2, 'size':654, 'split':'val'},
+    'nyudepthv2': {'task_type':'depth_estimation', 'category':'nyudepthv2', 'type':'NYUDepthV2', 'size':654, 'split':'val'},
  }
 
 
 dataset_info_dict_experimental = {
     #------------------------semantic segmentation datasets--------------------------#
-    'cityscapes': {'task_type':'segmentation', 'category':'cityscapes', 'type':CityscapesSegmentation, 'size':500, 'split':'val'},
-    'ti-robokit_semseg_zed1hd': {'task_type':'segmentation', 'category':'ti-robokit_semseg_zed1hd', 'type':ImageSegmentation, 'size':49, 'split':'val'},
+    'cityscapes': {'task_type':'segmentation', 'category':'cityscapes', 'type':'CityscapesSegmentation', 'size':500, 'split':'val'},
+    'ti-robokit_semseg_zed1hd': {'task_type':'segmentation', 'category':'ti-robokit_semseg_zed1hd', 'type':'ImageSegmentation', 'size':49, 'split':'val'},
     #------------------------3D OD datasets--------------------------#
-    'kitti_lidar_det': {'task_type':'3d-detection', 'category':'kitti_lidar_det', 'type':KittiLidar3D, 'size':3769, 'split':'val'},
+    'kitti_lidar_det': {'task_type':'3d-detection', 'category':'kitti_lidar_det', 'type':'KittiLidar3D', 'size':3769, 'split':'val'},
  }
 
 
@@ -140,8 +161,8 @@ def get_datasets(settings, download=False):
         # what is provided is mechanism to select one of the imagenet variants
         # but only one is selected and assigned to the key imagenet
         # all the imagenet models will use this variant.
-        dataset_cache['imagenet']['calibration_dataset'] = ImageNetDataSetType(**imagenet_cls_calib_cfg, download=download)
-        dataset_cache['imagenet']['input_dataset'] = ImageNetDataSetType(**imagenet_cls_val_cfg, download=False)
+        dataset_cache['imagenet']['calibration_dataset'] = _get_dataset(ImageNetDataSetType, **imagenet_cls_calib_cfg, download=download)
+        dataset_cache['imagenet']['input_dataset'] = _get_dataset(ImageNetDataSetType, **imagenet_cls_val_cfg, download=False)
     #
     if in_dataset_loading(settings, 'cocokpts'):
         filter_imgs = False
@@ -160,8 +181,8 @@ def get_datasets(settings, download=False):
             name='cocokpts',
             filter_imgs=filter_imgs)
 
-        dataset_cache['cocokpts']['calibration_dataset'] = COCOKeypoints(**coco_kpts_calib_cfg, download=download)
-        dataset_cache['cocokpts']['input_dataset'] = COCOKeypoints(**coco_kpts_val_cfg, download=False)
+        dataset_cache['cocokpts']['calibration_dataset'] = _get_dataset('COCOKeypoints', **coco_kpts_calib_cfg, download=download)
+        dataset_cache['cocokpts']['input_dataset'] = _get_dataset('COCOKeypoints', **coco_kpts_val_cfg, download=False)
 
     if in_dataset_loading(settings, 'coco'):
         coco_det_calib_cfg = dict(
@@ -176,8 +197,8 @@ def get_datasets(settings, download=False):
             shuffle=False, # can be set to True as well, if needed
             num_frames=min(settings.num_frames,5000),
             name='coco')
-        dataset_cache['coco']['calibration_dataset'] = COCODetection(**coco_det_calib_cfg, download=download)
-        dataset_cache['coco']['input_dataset'] = COCODetection(**coco_det_val_cfg, download=False)
+        dataset_cache['coco']['calibration_dataset'] = _get_dataset('COCODetection', **coco_det_calib_cfg, download=download)
+        dataset_cache['coco']['input_dataset'] = _get_dataset('COCODetection', **coco_det_val_cfg, download=False)
     #
     if in_dataset_loading(settings, 'cocoseg21'):
         cocoseg21_calib_cfg = dict(
@@ -192,8 +213,8 @@ def get_datasets(settings, download=False):
             shuffle=True,
             num_frames=min(settings.num_frames,5000),
             name='cocoseg21')
-        dataset_cache['cocoseg21']['calibration_dataset'] = COCOSegmentation(**cocoseg21_calib_cfg, download=download)
-        dataset_cache['cocoseg21']['input_dataset'] = COCOSegmentation(**cocoseg21_val_cfg, download=False)
+        dataset_cache['cocoseg21']['calibration_dataset'] = _get_dataset('COCOSegmentation', **cocoseg21_calib_cfg, download=download)
+        dataset_cache['cocoseg21']['input_dataset'] = _get_dataset('COCOSegmentation', **cocoseg21_val_cfg, download=False)
     #
     if in_dataset_loading(settings, 'ade20k'):
         ade20k_seg_calib_cfg = dict(
@@ -208,8 +229,8 @@ def get_datasets(settings, download=False):
             shuffle=True,
             num_frames=min(settings.num_frames, 2000),
             name='ade20k')
-        dataset_cache['ade20k']['calibration_dataset'] = ADE20KSegmentation(**ade20k_seg_calib_cfg, download=download)
-        dataset_cache['ade20k']['input_dataset'] = ADE20KSegmentation(**ade20k_seg_val_cfg, download=False)
+        dataset_cache['ade20k']['calibration_dataset'] = _get_dataset('ADE20KSegmentation', **ade20k_seg_calib_cfg, download=download)
+        dataset_cache['ade20k']['input_dataset'] = _get_dataset('ADE20KSegmentation', **ade20k_seg_val_cfg, download=False)
     #
     if in_dataset_loading(settings, 'ade20k32'):
         ade20k_seg_calib_cfg = dict(
@@ -224,8 +245,8 @@ def get_datasets(settings, download=False):
             shuffle=True,
             num_frames=min(settings.num_frames, 2000),
             name='ade20k32')
-        dataset_cache['ade20k32']['calibration_dataset'] = ADE20KSegmentation(**ade20k_seg_calib_cfg, num_classes=32, download=download)
-        dataset_cache['ade20k32']['input_dataset'] = ADE20KSegmentation(**ade20k_seg_val_cfg, num_classes=32, download=False)
+        dataset_cache['ade20k32']['calibration_dataset'] = _get_dataset('ADE20KSegmentation', **ade20k_seg_calib_cfg, num_classes=32, download=download)
+        dataset_cache['ade20k32']['input_dataset'] = _get_dataset('ADE20KSegmentation', **ade20k_seg_val_cfg, num_classes=32, download=False)
     #
     if in_dataset_loading(settings, 'voc2012'):
         voc_seg_calib_cfg = dict(
@@ -240,8 +261,8 @@ def get_datasets(settings, download=False):
             shuffle=True,
             num_frames=min(settings.num_frames, 1449),
             name='voc2012')
-        dataset_cache['voc2012']['calibration_dataset'] = VOC2012Segmentation(**voc_seg_calib_cfg, download=download)
-        dataset_cache['voc2012']['input_dataset'] = VOC2012Segmentation(**voc_seg_val_cfg, download=False)
+        dataset_cache['voc2012']['calibration_dataset'] = _get_dataset('VOC2012Segmentation', **voc_seg_calib_cfg, download=download)
+        dataset_cache['voc2012']['input_dataset'] = _get_dataset('VOC2012Segmentation', **voc_seg_val_cfg, download=False)
     #
     if in_dataset_loading(settings, 'nyudepthv2'):
         filter_imgs = False
@@ -258,8 +279,8 @@ def get_datasets(settings, download=False):
             num_frames=min(settings.num_frames, 654),
             name='nyudepthv2')
 
-        dataset_cache['nyudepthv2']['calibration_dataset'] = NYUDepthV2(**nyudepthv2_calib_cfg, download=download)
-        dataset_cache['nyudepthv2']['input_dataset'] = NYUDepthV2(**nyudepthv2_val_cfg, download=False)
+        dataset_cache['nyudepthv2']['calibration_dataset'] = _get_dataset('NYUDepthV2', **nyudepthv2_calib_cfg, download=download)
+        dataset_cache['nyudepthv2']['input_dataset'] = _get_dataset('NYUDepthV2', **nyudepthv2_val_cfg, download=False)
     #
     # the following are datasets cannot be downloaded automatically
     # put it under the condition of experimental_models
@@ -277,8 +298,8 @@ def get_datasets(settings, download=False):
                 shuffle=True,
                 num_frames=min(settings.num_frames,500),
                 name='cityscapes')
-            dataset_cache['cityscapes']['calibration_dataset'] = CityscapesSegmentation(**cityscapes_seg_calib_cfg, download=False)
-            dataset_cache['cityscapes']['input_dataset'] = CityscapesSegmentation(**cityscapes_seg_val_cfg, download=False)
+            dataset_cache['cityscapes']['calibration_dataset'] = _get_dataset('CityscapesSegmentation', **cityscapes_seg_calib_cfg, download=False)
+            dataset_cache['cityscapes']['input_dataset'] = _get_dataset('CityscapesSegmentation', **cityscapes_seg_val_cfg, download=False)
         #
         if in_dataset_loading(settings, 'kitti_lidar_det'):
             dataset_calib_cfg = dict(
@@ -296,8 +317,8 @@ def get_datasets(settings, download=False):
                 shuffle=True,
                 num_frames=min(settings.num_frames,3769))
 
-            dataset_cache['kitti_lidar_det']['calibration_dataset'] = KittiLidar3D(**dataset_calib_cfg, download=False)
-            dataset_cache['kitti_lidar_det']['input_dataset'] = KittiLidar3D(**dataset_val_cfg, download=False)
+            dataset_cache['kitti_lidar_det']['calibration_dataset'] = _get_dataset('KittiLidar3D', **dataset_calib_cfg, download=False)
+            dataset_cache['kitti_lidar_det']['input_dataset'] = _get_dataset('KittiLidar3D', **dataset_val_cfg, download=False)
         #
         if in_dataset_loading(settings, 'ti-robokit_semseg_zed1hd'):
             dataset_calib_cfg = dict(
@@ -315,13 +336,33 @@ def get_datasets(settings, download=False):
                 shuffle=True,
                 num_frames=min(settings.num_frames,49))
 
-            dataset_cache['ti-robokit_semseg_zed1hd']['calibration_dataset'] = ImageSegmentation(**dataset_calib_cfg, download=False)
-            dataset_cache['ti-robokit_semseg_zed1hd']['input_dataset'] = ImageSegmentation(**dataset_val_cfg, download=False)
+            dataset_cache['ti-robokit_semseg_zed1hd']['calibration_dataset'] = _get_dataset('ImageSegmentation', **dataset_calib_cfg, download=False)
+            dataset_cache['ti-robokit_semseg_zed1hd']['input_dataset'] = _get_dataset('ImageSegmentation', **dataset_val_cfg, download=False)
+        #
+    #
+    # the file lists of the datasets are shared by the processes that use them, through the files in dataset_index_path
+    dataset_index_path = settings.get('dataset_index_path', None)
+    for dataset_entry in dataset_cache.values():
+        for dataset in dataset_entry.values():
+            if isinstance(dataset, LazyDataset):
+                dataset.shared_index_path = dataset_index_path
+            #
         #
     #
     return dataset_cache
 
 
+def _get_dataset(dataset_type, download=False, **kwargs):
+    # datasets are constructed when they are used for the first time, so that the annotations and file lists
+    # of the datasets that are not needed by the selected models are not loaded at all.
+    # construct it right away if it has to be downloaded.
+    if download:
+        return get_dataset_type(dataset_type)(download=download, **kwargs)
+    else:
+        return LazyDataset(dataset_type, download=download, **kwargs)
+    #
+
+
 def download_datasets(settings, download=True):
     # just creating the dataset classes with download=True will check of the dataset folders are present
     # if the dataset folders are missing, it will be downloaded and extracted
@@ -42,6 +42,7 @@ https://groups.csail.mit.edu/vision/datasets/ADE20K/, http://sceneparsing.csail.
 
 import os
 import glob
+import functools
 import random
 import numpy as np
 import PIL
@@ -171,24 +172,45 @@ class ADE20KSegmentation(DatasetBase):
         return label_img
 
     def evaluate(self, predictions, **kwargs):
+        evaluator = self.get_evaluator(**kwargs)
+        return utils.run_evaluator(evaluator, predictions, self.num_frames)
+
+    def get_evaluator(self, **kwargs):
         label_offset_target = kwargs.get('label_offset_target', 0)
         label_offset_pred = kwargs.get('label_offset_pred', 0)
-        cmatrix = None
-        num_frames = min(self.num_frames, len(predictions))
-        for n in range(num_frames):
-            image_file, label_file = self.__getitem__(n, with_label=True)
-            label_img = PIL.Image.open(label_file)
-            label_img = self.encode_segmap(label_img, label_offset_target=label_offset_target)
-            # reshape prediction is needed
-            output = predictions[n]+label_offset_pred
-            output = output.astype(np.uint8)
-            output = output[0] if (output.ndim > 2 and output.shape[0] == 1) else output
-            output = output[:2] if (output.ndim > 2 and output.shape[2] == 1) else output
-            # compute metric
-            cmatrix = utils.confusion_matrix(cmatrix, output, label_img, self.num_classes_)
+        if self.ignore_label is None:
+            # encode_segmap() is applied on the 8 bit label values - so it can be done with a lookup table
+            load_label = self._load_label
+            label_lut = self._create_lut(label_offset_target)
+        else:
+            load_label = functools.partial(self._load_encoded_label, label_offset_target=label_offset_target)
+            label_lut = None
+        #
+        return utils.SegmentationEvaluator(self.num_classes_, self.num_frames, load_label, label_lut=label_lut,
+                                           label_offset_pred=label_offset_pred)
+
+    def _load_label(self, frame_idx):
+        image_file, label_file = self.__getitem__(frame_idx, with_label=True)
+        label_img = PIL.Image.open(label_file)
+        label_img = label_img.convert('L')
+        return np.array(label_img)
+
+    def _load_encoded_label(self, frame_idx, label_offset_target=0):
+        image_file, label_file = self.__getitem__(frame_idx, with_label=True)
+        label_img = PIL.Image.open(label_file)
+        return self.encode_segmap(label_img, label_offset_target=label_offset_target)
+
+    def _create_lut(self, label_offset_target=0):
+        # same as encode_segmap() for each of the 8 bit label values
+        lut = np.arange(256) + label_offset_target
+        if 0 <= label_offset_target <= 255:
+            # label_img is uint8 - the addition wraps around
+            lut = lut % 256
+        #
+        if self.num_classes_ < 151:
+            lut[lut >= self.num_classes_] = 0
         #
-        accuracy = utils.segmentation_accuracy(cmatrix)
-        return accuracy
+        return lut
 
     def load_classes(self):
         #ade20k_150_classes_url = "https://raw.githubusercontent.com/CSAILVision/sceneparsing/master/objectInfo150.csv"
@@ -197,4 +219,3 @@ class ADE20KSegmentation(DatasetBase):
             self.classes_reverse = dict(zip([i for i in range(1,self.num_classes_+1)],list_ade20k_classes))
             self.classes = dict(zip(list_ade20k_classes,[i for i in range(1,self.num_classes_+1)]))
         #
-
@@ -147,23 +147,19 @@ class CityscapesSegmentation(DatasetBase):
         return self.evaluate(predictions, **kwargs)
 
     def evaluate(self, predictions, **kwargs):
-        cmatrix = None
-        num_frames = min(self.num_frames, len(predictions))
-        for n in range(num_frames):
-            image_file, label_file = self.__getitem__(n, with_label=True)
-            # image = PIL.Image.open(image_file)
-            label_img = PIL.Image.open(label_file)
-            label_img = self.encode_segmap(label_img)
-
-            output = predictions[n]
-            output = output.astype(np.uint8)
-            output = output[0] if (output.ndim > 2 and output.shape[0] == 1) else output
-            output = output[:2] if (output.ndim > 2 and output.shape[2] == 1) else output
-
-            cmatrix = utils.confusion_matrix(cmatrix, output, label_img, self.num_classes)
-        #
-        accuracy = utils.segmentation_accuracy(cmatrix)
-        return accuracy
+        evaluator = self.get_evaluator(**kwargs)
+        return utils.run_evaluator(evaluator, predictions, self.num_frames)
+
+    def get_evaluator(self, **kwargs):
+        # encode_segmap() is done by the evaluator, using label_lut
+        return utils.SegmentationEvaluator(self.num_classes, self.num_frames, self._load_label,
+                                           label_lut=self.label_lut)
+
+    def _load_label(self, frame_idx):
+        image_file, label_file = self.__getitem__(frame_idx, with_label=True)
+        label_img = PIL.Image.open(label_file)
+        label_img = label_img.convert('L')
+        return np.array(label_img)
 
     def encode_segmap(self, label_img):
         if not isinstance(label_img, np.ndarray):
@@ -106,16 +106,13 @@ https://arxiv.org/abs/1405.0312, https://cocodataset.org/
 import numbers
 import os
 import random
-import json
 import shutil
-import tempfile
 import numpy as np
 from colorama import Fore
-from pycocotools.coco import COCO
-from pycocotools.cocoeval import COCOeval
 
 from .. import utils
 from .dataset_base import *
+from .coco_index import *
 
 __all__ = ['COCODetection', 'coco_det_label_offset_80to90', 'coco_det_label_offset_90to90']
 
@@ -150,7 +147,7 @@ class COCODetection(DatasetBase):
 
     def _load_dataset(self):
         shuffle = self.kwargs.get('shuffle', False)
-        self.coco_dataset = COCO(self.annotation_file)
+        self.coco_dataset = get_coco_index(self.annotation_file)
         filter_imgs = self.kwargs['filter_imgs'] if 'filter_imgs' in self.kwargs else None
         if isinstance(filter_imgs, str):
             # filter images with the given list
@@ -241,31 +238,15 @@ class COCODetection(DatasetBase):
 
     def evaluate(self, predictions, **kwargs):
         label_offset = kwargs.get('label_offset_pred', 0)
-        #run_dir = kwargs.get('run_dir', None)
-        temp_dir_obj = tempfile.TemporaryDirectory()
-        temp_dir = temp_dir_obj.name
-        self.tempfiles.append(temp_dir_obj)
-
-        #os.makedirs(run_dir, exist_ok=True)
-        detections_formatted_list = []
-        for frame_idx, det_frame in enumerate(predictions):
-            for det_id, det in enumerate(det_frame):
-                det = self._format_detections(det, frame_idx, label_offset=label_offset)
-                category_id = det['category_id'] if isinstance(det, dict) else det[4]
-                if category_id >= 1: # final coco categories start from 1
-                    detections_formatted_list.append(det)
-                #
-            #
-        #
+        # the detections are evaluated in memory - without writing and loading a results json
+        detections = self._format_detections_array(predictions, label_offset=label_offset)
         coco_ap = 0.0
         coco_ap50 = 0.0
-        if len(detections_formatted_list) > 0:
-            detection_file = os.path.join(temp_dir, 'detection_results.json')
-            with open(detection_file, 'w') as det_fp:
-                json.dump(detections_formatted_list, det_fp)
-            #
-            cocoDet = self.coco_dataset.loadRes(detection_file)
-            cocoEval = COCOeval(self.coco_dataset, cocoDet, iouType='bbox')
+        if len(detections) > 0:
+            img_ids = self.coco_dataset.getImgIds()
+            cat_ids = self.coco_dataset.getCatIds()
+            gt_anns = self.coco_dataset.loadAnns(self.coco_dataset.getAnnIds(imgIds=img_ids, catIds=cat_ids))
+            cocoEval = utils.COCOBBoxEval(gt_anns, detections, img_ids, cat_ids)
             cocoEval.evaluate()
             cocoEval.accumulate()
             cocoEval.summarize()
@@ -275,6 +256,65 @@ class COCODetection(DatasetBase):
         accuracy = {'accuracy_ap[.5:.95]%': coco_ap*100.0, 'accuracy_ap50%': coco_ap50*100.0}
         return accuracy
 
+    def _format_detections_array(self, predictions, label_offset=0):
+        # same as calling _format_detections() for each detection, but for all the detections of a frame at once
+        detections_list = []
+        for frame_idx, det_frame in enumerate(predictions):
+            det_frame = np.asarray(det_frame)
+            if det_frame.size == 0:
+                continue
+            #
+            if det_frame.ndim != 2 or det_frame.shape[1] < 6 or det_frame.dtype.kind not in 'iuf':
+                detections = self._format_detections_list(det_frame, frame_idx, label_offset=label_offset)
+            else:
+                detections = np.zeros((len(det_frame),), dtype=utils.coco_bbox_detection_dtype)
+                detections['image_id'] = self.img_ids[frame_idx]
+                detections['category_id'] = self._detection_labels_to_catids(det_frame[:,4], label_offset)
+                # xyxy to xywh - the subtraction is in the dtype of the detections, as in _xyxy2xywh()
+                detections['bbox'][:,0] = det_frame[:,0]
+                detections['bbox'][:,1] = det_frame[:,1]
+                detections['bbox'][:,2] = det_frame[:,2] - det_frame[:,0]
+                detections['bbox'][:,3] = det_frame[:,3] - det_frame[:,1]
+                detections['score'] = det_frame[:,5]
+            #
+            # final coco categories start from 1
+            detections_list.append(detections[detections['category_id'] >= 1])
+        #
+        detections = np.concatenate(detections_list) if len(detections_list) > 0 else \
+            np.zeros((0,), dtype=utils.coco_bbox_detection_dtype)
+        return detections
+
+    def _format_detections_list(self, det_frame, frame_idx, label_offset=0):
+        detections = np.zeros((len(det_frame),), dtype=utils.coco_bbox_detection_dtype)
+        for det_id, det in enumerate(det_frame):
+            det = self._format_detections(det, frame_idx, label_offset=label_offset)
+            detections[det_id] = (det['image_id'], det['category_id'], det['bbox'], det['score'])
+        #
+        return detections
+
+    def _detection_labels_to_catids(self, labels, label_offset):
+        # vectorized version of _detection_label_to_catid()
+        if isinstance(label_offset, (list,tuple)):
+            labels = labels.astype(np.int64)
+            assert np.all(labels<len(label_offset)), \
+                'label_offset is a list/tuple, but its size is smaller than the detected label'
+            catids = np.array(label_offset)[labels]
+        elif isinstance(label_offset, dict):
+            catids = np.zeros(labels.shape, dtype=np.int64)
+            is_valid = ~np.isnan(labels)
+            unique_labels, label_indices = np.unique(labels[is_valid].astype(np.int64), return_inverse=True)
+            unique_catids = np.array([label_offset.get(int(label), 0) for label in unique_labels], dtype=np.int64)
+            catids[is_valid] = unique_catids[label_indices]
+        elif isinstance(label_offset, numbers.Number):
+            catids = (labels + label_offset).astype(np.int64)
+        else:
+            labels = labels.astype(np.int64)
+            assert np.all(labels<len(self.cat_ids)), \
+                'the detected label could not be mapped to the 90 COCO categories using the default COCO.getCatIds()'
+            catids = np.array(self.cat_ids)[labels]
+        #
+        return catids
+
     def _format_detections(self, bbox_label_score, image_id, label_offset=0, class_map=None):
         if class_map is not None:
             assert bbox_label_score[4] in class_map, 'invalid prediction label or class_map'
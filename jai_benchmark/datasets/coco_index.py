@@ -0,0 +1,60 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import copy
+import threading
+from pycocotools.coco import COCO
+
+__all__ = ['get_coco_index']
+
+
+# annotation index of each COCO json file - parsed only once in a process
+_coco_index_cache = {}
+_coco_index_lock = threading.Lock()
+
+
+def get_coco_index(annotation_file, coco_type=COCO):
+    '''
+    Returns a COCO object for the annotation_file. The json is parsed only once in a process and the
+    parsed annotations are shared by all the datasets that use the same file (eg. detection and segmentation).
+    Each caller gets its own shallow copy, so that it can select its images by assigning to coco.imgs.
+    The shared annotation dicts (anns, imgToAnns, cats etc.) must be treated as read-only.
+    coco_type is the COCO api class to be used - eg. xtcocotools.coco.COCO can be used instead of the default.
+    '''
+    annotation_key = (coco_type, os.path.realpath(annotation_file))
+    with _coco_index_lock:
+        coco_index = _coco_index_cache.get(annotation_key, None)
+        if coco_index is None:
+            coco_index = coco_type(annotation_file)
+            _coco_index_cache[annotation_key] = coco_index
+        #
+    #
+    coco_dataset = copy.copy(coco_index)
+    coco_dataset.imgs = dict(coco_index.imgs)
+    return coco_dataset
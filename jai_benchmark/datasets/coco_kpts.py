@@ -120,6 +120,7 @@ from jai_benchmark.utils import *
 # from ..utils import *
 from jai_benchmark.datasets.dataset_base import *
 # from .dataset_base import *
+from jai_benchmark.datasets.coco_index import *
 
 __all__ = ['COCOKeypoints', '_get_mapping_id_name']
 
@@ -165,7 +166,8 @@ class COCOKeypoints(DatasetBase):
         assert self.kwargs['split'] in image_split_dirs, f'invalid path to coco dataset images/split {kwargs["split"]}'
         self.image_dir = os.path.join(image_base_dir, self.kwargs['split'])
 
-        self.coco_dataset = COCO(os.path.join(annotations_dir, f'person_keypoints_{self.kwargs["split"]}.json'))
+        self.coco_dataset = get_coco_index(os.path.join(annotations_dir, f'person_keypoints_{self.kwargs["split"]}.json'),
+                                           coco_type=COCO)
 
         filter_imgs = self.kwargs['filter_imgs'] if 'filter_imgs' in self.kwargs else None
         if isinstance(filter_imgs, str):
@@ -106,16 +106,19 @@ https://arxiv.org/abs/1405.0312, https://cocodataset.org/
 import os
 import random
 import copy
+import hashlib
+import shutil
+import multiprocessing
+import concurrent.futures
 import numpy as np
-import PIL
 import cv2
 import tempfile
 from colorama import Fore
-from pycocotools.coco import COCO
 from pycocotools import mask as coco_mask
 
 from .. import utils
 from .dataset_base import *
+from .coco_index import *
 
 __all__ = ['COCOSegmentation']
 
@@ -156,7 +159,8 @@ class COCOSegmentation(DatasetBase):
         image_split_dirs = os.listdir(image_base_dir)
         self.image_dir = os.path.join(image_base_dir, split)
 
-        self.coco_dataset = COCO(os.path.join(annotations_dir, f'instances_{split}.json'))
+        self.annotation_file = os.path.join(annotations_dir, f'instances_{split}.json')
+        self.coco_dataset = get_coco_index(self.annotation_file)
 
         self.cat_ids = self.coco_dataset.getCatIds()
         img_ids = self.coco_dataset.getImgIds()
@@ -188,6 +192,10 @@ class COCOSegmentation(DatasetBase):
             self.tempfiles.append(temp_dir)
         #
         self.label_dir = os.path.join(run_dir, 'labels')
+        # the rasterized labels of all the images are cached - they are built when the labels are needed first.
+        label_cache_path = self.kwargs.get('label_cache_path', None)
+        self.label_cache_path = label_cache_path or os.path.join(annotations_dir, 'label_cache')
+        self.label_cache = None
 
     def download(self, path, split):
         root = path
@@ -226,11 +234,7 @@ class COCOSegmentation(DatasetBase):
         image_path = os.path.join(self.image_dir, img['file_name'])
         if with_label:
             os.makedirs(self.label_dir, exist_ok=True)
-            ann_ids = self.coco_dataset.getAnnIds(imgIds=img_id, iscrowd=None)
-            anno = self.coco_dataset.loadAnns(ann_ids)
-            image = PIL.Image.open(image_path)
-            image, anno = self._filter_and_remap_categories(image, anno)
-            image, target = self._convert_polys_to_mask(image, anno)
+            target = self._get_label_mask(img_id)
             # write the label file to a temorary dir so that it can be used by evaluate()
             image_basename = os.path.basename(image_path)
             label_path = os.path.join(self.label_dir, image_basename)
@@ -257,22 +261,107 @@ class COCOSegmentation(DatasetBase):
         return self.evaluate(predictions, **kwargs)
 
     def evaluate(self, predictions, **kwargs):
-        cmatrix = None
-        num_frames = min(self.num_frames, len(predictions))
-        for n in range(num_frames):
-            image_file, label_file = self.__getitem__(n, with_label=True)
-            label_img = PIL.Image.open(label_file)
-            label_img = self.encode_segmap(label_img)
-            # reshape prediction is needed
-            output = predictions[n]
-            output = output.astype(np.uint8)
-            output = output[0] if (output.ndim > 2 and output.shape[0] == 1) else output
-            output = output[:2] if (output.ndim > 2 and output.shape[2] == 1) else output
-            # compute metric
-            cmatrix = utils.confusion_matrix(cmatrix, output, label_img, self.num_classes)
+        evaluator = self.get_evaluator(**kwargs)
+        return utils.run_evaluator(evaluator, predictions, self.num_frames)
+
+    def get_evaluator(self, **kwargs):
+        # build or load the label cache here - the labels are loaded by multiple threads in the evaluator
+        self._get_label_cache()
+        return utils.SegmentationEvaluator(self.num_classes, self.num_frames, self._load_label)
+
+    def _load_label(self, frame_idx):
+        # the label is taken from the cache directly - there is no need to write and read a png file
+        img_id = self.img_ids[frame_idx]
+        label_img = self._get_label_mask(img_id)
+        label_img = self.encode_segmap(label_img)
+        return label_img
+
+    def _get_label_mask(self, img_id):
+        label_cache = self._get_label_cache()
+        label_index = label_cache['index'][img_id]
+        height, width = label_cache['shapes'][label_index]
+        run_start, run_end = label_cache['run_offsets'][label_index:label_index+2]
+        run_values = label_cache['run_values'][run_start:run_end]
+        run_lengths = label_cache['run_lengths'][run_start:run_end]
+        target = np.repeat(run_values, run_lengths).reshape(height, width)
+        return target
+
+    def _get_label_cache(self):
+        if self.label_cache is not None:
+            return self.label_cache
+        #
+        # the cache depends on the contents of the annotation file and the category mapping
+        hash_obj = hashlib.sha1()
+        with open(self.annotation_file, 'rb') as fp:
+            for block in iter(lambda: fp.read(1<<20), b''):
+                hash_obj.update(block)
+            #
+        #
+        hash_obj.update(str(list(self.categories)).encode())
+        cache_name = f'{os.path.splitext(os.path.basename(self.annotation_file))[0]}_{hash_obj.hexdigest()[:16]}'
+        cache_dir = os.path.join(self.label_cache_path, cache_name)
+        label_cache_files = ('image_ids', 'shapes', 'run_offsets', 'run_values', 'run_lengths')
+        if all(os.path.exists(os.path.join(cache_dir, f'{f}.npy')) for f in label_cache_files):
+            label_cache = {f:np.load(os.path.join(cache_dir, f'{f}.npy'), mmap_mode='r') for f in label_cache_files}
+        else:
+            print(utils.log_color('\nINFO', 'building label cache', cache_dir))
+            label_cache = self._build_label_cache()
+            self._save_label_cache(label_cache, cache_dir)
+        #
+        label_cache['index'] = {int(img_id):label_index for label_index, img_id in enumerate(label_cache['image_ids'])}
+        self.label_cache = label_cache
+        return label_cache
+
+    def _build_label_cache(self):
+        # all the images in the annotation file are rasterized, so that the cache can be used for any num_frames
+        # coco_dataset.imgs has only the selected frames - so take the images from the annotation file itself
+        images = sorted(self.coco_dataset.dataset['images'], key=lambda img: img['id'])
+        image_ids = [img['id'] for img in images]
+        image_infos = []
+        for img in images:
+            ann_ids = self.coco_dataset.getAnnIds(imgIds=img['id'], iscrowd=None)
+            anno = self.coco_dataset.loadAnns(ann_ids)
+            image_infos.append((img['height'], img['width'], anno))
+        #
+        categories = list(self.categories)
+        chunk_size = 64
+        chunks = [image_infos[i:i+chunk_size] for i in range(0, len(image_infos), chunk_size)]
+        num_workers = min(os.cpu_count() or 1, len(chunks))
+        if num_workers > 1:
+            mp_context = multiprocessing.get_context('spawn')
+            with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context) as executor:
+                chunk_results = list(executor.map(_rasterize_labels, chunks, [categories]*len(chunks)))
+            #
+        else:
+            chunk_results = [_rasterize_labels(chunk, categories) for chunk in chunks]
+        #
+        runs_list = [runs for chunk_result in chunk_results for runs in chunk_result]
+        run_counts = [len(run_values) for run_values, _ in runs_list]
+        label_cache = dict(
+            image_ids=np.array(image_ids, dtype=np.int64),
+            shapes=np.array([(height, width) for height, width, _ in image_infos], dtype=np.int64).reshape(-1, 2),
+            run_offsets=np.concatenate([[0], np.cumsum(run_counts)]).astype(np.int64),
+            run_values=np.concatenate([run_values for run_values, _ in runs_list] + [np.zeros(0, dtype=np.uint8)]),
+            run_lengths=np.concatenate([run_lengths for _, run_lengths in runs_list] + [np.zeros(0, dtype=np.uint32)]))
+        return label_cache
+
+    def _save_label_cache(self, label_cache, cache_dir):
+        try:
+            os.makedirs(self.label_cache_path, exist_ok=True)
+            # write to a temporary folder and rename - other processes may be building the same cache
+            temp_dir = tempfile.mkdtemp(dir=self.label_cache_path)
+            for name, value in label_cache.items():
+                np.save(os.path.join(temp_dir, f'{name}.npy'), value)
+            #
+            try:
+                os.rename(temp_dir, cache_dir)
+            except OSError:
+                # the cache was written by another process in the meantime
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            #
+        except OSError as e:
+            print(utils.log_color('\nWARNING', 'could not write label cache', f'{cache_dir} - {e}'))
         #
-        accuracy = utils.segmentation_accuracy(cmatrix)
-        return accuracy
 
     def _remove_images_without_annotations(self, img_ids):
         ids = []
@@ -295,57 +384,83 @@ class COCOSegmentation(DatasetBase):
         return sum(obj["area"] for obj in anno) > 1000
 
     def _filter_and_remap_categories(self, image, anno, remap=True):
-        anno = [obj for obj in anno if obj["category_id"] in self.categories]
-        if not remap:
-            return image, anno
-        #
-        anno = copy.deepcopy(anno)
-        for obj in anno:
-            obj["category_id"] = self.categories.index(obj["category_id"])
-        #
+        anno = _filter_and_remap_categories(anno, self.categories, remap=remap)
         return image, anno
 
     def _convert_polys_to_mask(self, image, anno):
         w, h = image.size
-        segmentations = [obj["segmentation"] for obj in anno]
-        cats = [obj["category_id"] for obj in anno]
-        if segmentations:
-            masks = self._convert_poly_to_mask(segmentations, h, w)
-            cats = np.array(cats, dtype=masks.dtype)
-            cats = cats.reshape(-1, 1, 1)
-            # merge all instance masks into a single segmentation map
-            # with its corresponding categories
-            target = (masks * cats).max(axis=0)
-            # discard overlapping instances
-            target[masks.sum(0) > 1] = 255
-        else:
-            target = np.zeros((h, w), dtype=np.uint8)
-        #
+        target = _convert_polys_to_mask(anno, h, w)
         return image, target
 
     def _convert_poly_to_mask(self, segmentations, height, width):
-        masks = []
-        for polygons in segmentations:
-            rles = coco_mask.frPyObjects(polygons, height, width)
-            mask = coco_mask.decode(rles)
-            if len(mask.shape) < 3:
-                mask = mask[..., None]
-            mask = mask.any(axis=2)
-            mask = mask.astype(np.uint8)
-            masks.append(mask)
-        if masks:
-            masks = np.stack(masks, axis=0)
-        else:
-            masks = np.zeros((0, height, width), dtype=np.uint8)
-        return masks
+        return _convert_poly_to_mask(segmentations, height, width)
+
 
+def _filter_and_remap_categories(anno, categories, remap=True):
+    anno = [obj for obj in anno if obj["category_id"] in categories]
+    if not remap:
+        return anno
+    #
+    anno = copy.deepcopy(anno)
+    for obj in anno:
+        obj["category_id"] = categories.index(obj["category_id"])
+    #
+    return anno
+
+
+def _convert_polys_to_mask(anno, h, w):
+    segmentations = [obj["segmentation"] for obj in anno]
+    cats = [obj["category_id"] for obj in anno]
+    if segmentations:
+        masks = _convert_poly_to_mask(segmentations, h, w)
+        cats = np.array(cats, dtype=masks.dtype)
+        cats = cats.reshape(-1, 1, 1)
+        # merge all instance masks into a single segmentation map
+        # with its corresponding categories
+        target = (masks * cats).max(axis=0)
+        # discard overlapping instances
+        target[masks.sum(0) > 1] = 255
+    else:
+        target = np.zeros((h, w), dtype=np.uint8)
+    #
+    return target
+
+
+def _convert_poly_to_mask(segmentations, height, width):
+    masks = []
+    for polygons in segmentations:
+        rles = coco_mask.frPyObjects(polygons, height, width)
+        mask = coco_mask.decode(rles)
+        if len(mask.shape) < 3:
+            mask = mask[..., None]
+        mask = mask.any(axis=2)
+        mask = mask.astype(np.uint8)
+        masks.append(mask)
+    if masks:
+        masks = np.stack(masks, axis=0)
+    else:
+        masks = np.zeros((0, height, width), dtype=np.uint8)
+    return masks
+
+
+def _rasterize_labels(image_infos, categories):
+    # rasterize the labels of a chunk of images and run length encode them (row major)
+    runs_list = []
+    for height, width, anno in image_infos:
+        anno = _filter_and_remap_categories(anno, categories)
+        target = _convert_polys_to_mask(anno, height, width).reshape(-1)
+        run_starts = np.concatenate([[0], np.flatnonzero(target[1:] != target[:-1]) + 1])
+        run_lengths = np.diff(np.concatenate([run_starts, [target.size]])).astype(np.uint32)
+        run_values = target[run_starts].astype(np.uint8)
+        runs_list.append((run_values, run_lengths))
+    #
+    return runs_list
 
 if __name__ == '__main__':
     # from inside the folder jacinto_ai_benchmark, run the following:
     # python3 -m jai_benchmark.datasets.coco_seg
     # to create a converted dataset if you wish to load it using the dataset loader ImageSegmentation() in image_seg.py
     # to load it using CocoSegmentation dataset in this file, this conversion is not required.
-    import shutil
     output_folder = './dependencies/datasets/coco-seg21-converted'
     split = 'val2017'
     coco_seg = COCOSegmentation(path='./dependencies/datasets/coco', split=split)
@@ -1,10 +1,159 @@
+import copy
 from .. import utils
 
 
+# datasets constructed in this process, by their registry key - the LazyDatasets with the same key (and the copies
+# of them made for each pipeline) share one dataset, instead of each having a copy of the annotations and file lists
+_dataset_registry = {}
+
+
+def get_dataset_key(dataset_type, **kwargs):
+    '''the registry key of a dataset - the name of its type and its arguments'''
+    type_name = dataset_type if isinstance(dataset_type, str) else dataset_type.__name__
+    return f'{type_name}:{sorted(kwargs.items())!r}'
+
+
+def clear_dataset_registry():
+    _dataset_registry.clear()
+
+
 class DatasetBase(utils.ParamsBase):
     def __init__(self, **kwargs):
         super().__init__()
         # this is required to save the params
         self.kwargs = kwargs
         # call the utils.ParamsBase.initialize()
-        super().initialize()
\ No newline at end of file
+        super().initialize()
+
+class LazyDataset(utils.ParamsBase):
+    '''
+    Holds the type (or its name) and the arguments of a dataset and constructs it only when it is used for the first time.
+    get_datasets() returns these, so that only the datasets of the models that are actually run are loaded.
+    The constructed dataset is kept in a registry of the process, by a key made of the type and the arguments - so
+    a copy of a LazyDataset shares the dataset (copy on write - set_param makes a private copy of it).
+    If shared_index_path is given, the file lists of the dataset are stored there as memory-mapped files (see
+    utils.SharedIndexStore) - the processes that use the dataset load it from there and share the same pages.
+    A pickled one (to a worker process) carries the key and the shared_index_path, and is attached when it is unpickled -
+    to the dataset in the registry of that process, or the one in the shared index. Without a shared index, a dataset
+    that is already constructed is pickled with it, so that the worker does not construct it again (eg. parse the
+    annotations). The worker constructs the dataset from the arguments only if it is not available in any of these.
+    '''
+    def __init__(self, dataset_type, shared_index_path=None, **kwargs):
+        super().__init__()
+        self.dataset_type = dataset_type
+        self.kwargs = kwargs
+        self.dataset_key = get_dataset_key(dataset_type, **kwargs)
+        self.shared_index_path = shared_index_path
+        self.dataset = None
+        super().initialize()
+
+    def get_dataset(self):
+        if self.dataset is None:
+            self.dataset = _dataset_registry.get(self.dataset_key, None)
+        #
+        if self.dataset is None:
+            self.dataset = self._load_shared_index()
+        #
+        if self.dataset is None:
+            # dataset_type can also be the name of the type - it is imported now
+            from .. import datasets
+            self.dataset = datasets.get_dataset_type(self.dataset_type)(**self.kwargs)
+            self.dataset = self._save_shared_index(self.dataset)
+        #
+        _dataset_registry[self.dataset_key] = self.dataset
+        return self.dataset
+
+    def _get_source_paths(self):
+        # the index is made again if these are modified
+        return [v for k, v in self.kwargs.items() if k in ('path', 'split') and isinstance(v, str)]
+
+    def _load_shared_index(self):
+        if self.shared_index_path is None or self.dataset_key is None:
+            return None
+        #
+        from .. import datasets
+        return utils.SharedIndexStore(self.shared_index_path).load(self.dataset_key, self._get_source_paths(),
+                                                                   obj_type=datasets.get_dataset_type(self.dataset_type))
+
+    def _save_shared_index(self, dataset):
+        if self.shared_index_path is None or self.dataset_key is None:
+            return dataset
+        #
+        try:
+            dataset = utils.SharedIndexStore(self.shared_index_path).save(self.dataset_key, dataset, self._get_source_paths())
+        except Exception as e:
+            print(utils.log_color('WARNING', 'dataset index could not be shared', f'{type(e).__name__}: {e}'))
+        #
+        return dataset
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.dataset_key is not None:
+            # the shared dataset is not pickled if it can be loaded from the shared index - see __setstate__
+            dataset = self.dataset if self.dataset is not None else _dataset_registry.get(self.dataset_key, None)
+            state['dataset'] = dataset if self.shared_index_path is None else None
+        #
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.dataset_key is None:
+            return
+        #
+        # attach to the shared dataset - the first one that is unpickled in this process is shared by the others
+        registered_dataset = _dataset_registry.get(self.dataset_key, None)
+        if registered_dataset is not None:
+            self.dataset = registered_dataset
+        elif self.dataset is None:
+            self.dataset = self._load_shared_index()
+        #
+        if self.dataset is not None:
+            _dataset_registry[self.dataset_key] = self.dataset
+        #
+
+    def __deepcopy__(self, memo):
+        # the shared dataset is not copied - only a private one is (see set_param)
+        dataset_copy = copy.copy(self)
+        dataset_copy.kwargs = copy.deepcopy(self.kwargs, memo)
+        if self.dataset_key is None:
+            dataset_copy.dataset = copy.deepcopy(self.dataset, memo)
+        #
+        memo[id(self)] = dataset_copy
+        return dataset_copy
+
+    def __getattr__(self, name):
+        # this is called only for the attributes that are not found in the proxy itself
+        # avoid constructing the dataset for special attributes looked up by copy/pickle
+        if name.startswith('__') or name in ('dataset_type', 'kwargs', 'dataset_key', 'shared_index_path', 'dataset'):
+            raise AttributeError(name)
+        #
+        return getattr(self.get_dataset(), name)
+
+    def __getitem__(self, *args, **kwargs):
+        return self.get_dataset().__getitem__(*args, **kwargs)
+
+    def __len__(self):
+        return len(self.get_dataset())
+
+    def __call__(self, *args, **kwargs):
+        return self.get_dataset()(*args, **kwargs)
+
+    def get_param(self, param_name):
+        return self.get_dataset().get_param(param_name)
+
+    def set_param(self, param_name, value):
+        # copy on write - the shared dataset is not modified, but a private copy of it
+        if self.dataset_key is not None:
+            self.dataset = copy.deepcopy(self.get_dataset())
+            self.dataset_key = None
+        #
+        return self.dataset.set_param(param_name, value)
+
+    def peek_param(self, param_name):
+        return self.get_dataset().peek_param(param_name)
+
+    def get_params(self):
+        return self.get_dataset().get_params()
+
+    def peek_params(self):
+        return self.get_dataset().peek_params()
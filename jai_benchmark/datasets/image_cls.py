@@ -85,16 +85,11 @@ class ImageClassification(DatasetBase):
         return self.evaluate(predictions, **kwargs)
 
     def evaluate(self, predictions, **kwargs):
-        in_lines = self.imgs
-        metric_tracker = utils.AverageMeter(name='accuracy_top1%')
-        num_frames = min(self.num_frames, len(predictions))
-        for n in range(num_frames):
-            words = in_lines[n].split(' ')
-            gt_label = int(words[1])
-            accuracy = self.classification_accuracy(predictions[n], gt_label, **kwargs)
-            metric_tracker.update(accuracy)
-        #
-        return {metric_tracker.name:metric_tracker.avg}
+        evaluator = self.get_evaluator(**kwargs)
+        return utils.run_evaluator(evaluator, predictions, self.num_frames)
+
+    def get_evaluator(self, **kwargs):
+        return ImageClassificationEvaluator(self, **kwargs)
 
     def classification_accuracy(self, prediction, target, label_offset_pred=0, label_offset_gt=0,
                                 multiplier=100.0, **kwargs):
@@ -104,3 +99,22 @@ class ImageClassification(DatasetBase):
         accuracy = accuracy * multiplier
         return accuracy
 
+
+
+class ImageClassificationEvaluator(utils.EvaluatorBase):
+    def __init__(self, dataset, **kwargs):
+        self.dataset = dataset
+        self.kwargs = kwargs
+        self.metric_tracker = utils.AverageMeter(name='accuracy_top1%')
+
+    def update(self, frame_idx, output):
+        if frame_idx >= self.dataset.num_frames:
+            return
+        #
+        words = self.dataset.imgs[frame_idx].split(' ')
+        gt_label = int(words[1])
+        accuracy = self.dataset.classification_accuracy(output, gt_label, **self.kwargs)
+        self.metric_tracker.update(accuracy)
+
+    def finalize(self):
+        return {self.metric_tracker.name:self.metric_tracker.avg}
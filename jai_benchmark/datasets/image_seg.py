@@ -16,18 +16,14 @@ class ImageSegmentation(ImagePixel2Pixel):
         return self.evaluate(predictions, **kwargs)
 
     def evaluate(self, predictions, **kwargs):
-        cmatrix = None
-        for n in range(self.num_frames):
-            image_file, label_file = self.__getitem__(n, with_label=True)
-            label_img = PIL.Image.open(label_file)
-            # reshape prediction is needed
-            output = predictions[n]
-            output = output.astype(np.uint8)
-            output = output[0] if (output.ndim > 2 and output.shape[0] == 1) else output
-            output = output[:2] if (output.ndim > 2 and output.shape[2] == 1) else output
-            # compute metric
-            cmatrix = utils.confusion_matrix(cmatrix, output, label_img, self.num_classes)
-        #
-        accuracy = utils.segmentation_accuracy(cmatrix)
-        return accuracy
+        evaluator = self.get_evaluator(**kwargs)
+        return utils.run_evaluator(evaluator, predictions, self.num_frames)
+
+    def get_evaluator(self, **kwargs):
+        return utils.SegmentationEvaluator(self.num_classes, self.num_frames, self._load_label)
+
+    def _load_label(self, frame_idx):
+        image_file, label_file = self.__getitem__(frame_idx, with_label=True)
+        label_img = PIL.Image.open(label_file)
+        return np.array(label_img)
 
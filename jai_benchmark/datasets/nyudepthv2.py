@@ -79,9 +79,17 @@ class NYUDepthV2(DatasetBase):
         train_annotations_folder = os.path.join(path, 'train', 'annotations')
         val_images_folder = os.path.join(path, 'val', 'images')
         val_annotations_folder = os.path.join(path, 'val', 'annotations')
-        if (not self.force_download) and os.path.exists(path) and os.path.exists(train_images_folder) and \
+        # the frames are converted in parallel - an interrupted preparation resumes from the frames that are not done
+        preparer = utils.DatasetPreparer(path, 'nyudepthv2')
+        if self.force_download:
+            preparer.reset()
+        elif preparer.verify():
+            print(utils.log_color('\nINFO', 'dataset exists - will reuse', path))
+            return
+        elif (not preparer.is_started()) and os.path.exists(path) and os.path.exists(train_images_folder) and \
             os.path.exists(train_annotations_folder) and os.path.exists(val_images_folder) and \
             os.path.exists(val_annotations_folder):
+            # prepared before the preparation had a manifest
             print(utils.log_color('\nINFO', 'dataset exists - will reuse', path))
             return
         #
@@ -114,13 +122,11 @@ class NYUDepthV2(DatasetBase):
         test_images = set([int(x) for x in split["testNdxs"]])
         train_images = set([int(x) for x in split["trainNdxs"]])
         depths_raw = h5_file['rawDepths']
-
         images = h5_file['images']
-        scenes = [u''.join(chr(c) for c in h5_file[obj_ref]) for obj_ref in h5_file['sceneTypes'][0]]
 
-        for i, (image, scene, depth_raw) in enumerate(zip(images, scenes, depths_raw)):
-            depth_raw = depth_raw.T
-            image = image.T
+        def convert_frame(i):
+            depth_raw = depths_raw[i].T
+            image = images[i].T
 
             idx = int(i) + 1
             if idx in train_images:
@@ -129,22 +135,26 @@ class NYUDepthV2(DatasetBase):
                 assert idx in test_images, "index %d neither found in training set nor in test set" % idx
                 train_val = "val"
 
-            #folder = "%s/%s" % (out_folder, train_val)
             folder = os.path.join(out_folder, train_val)
             images_folder = os.path.join(folder, 'images')
             annotations_folder = os.path.join(folder, 'annotations')
 
-            # if not os.path.exists(folder):
-            #     os.makedirs(folder)
-
             depth_raw = depth_raw.clip(0.0, 255.0 )
             img_depth = depth_raw * self.depth_label_scale
             img_depth_uint16 = img_depth.astype(np.uint16)
-            cv2.imwrite("%s/%05d.png" % (annotations_folder, i), img_depth_uint16)
+            annotation_file = "%s/%05d.png" % (annotations_folder, i)
+            cv2.imwrite(annotation_file, img_depth_uint16)
             image = image[:, :, ::-1]
             image_black_boundary = np.zeros((480, 640, 3), dtype=np.uint8)
             image_black_boundary[7:474, 7:632, :] = image[7:474, 7:632, :]
-            cv2.imwrite("%s/%05d.jpg" % (images_folder, i), image_black_boundary)
+            image_file = "%s/%05d.jpg" % (images_folder, i)
+            cv2.imwrite(image_file, image_black_boundary)
+            return [annotation_file, image_file]
+        #
+        try:
+            preparer.run(convert_frame, range(len(images)))
+        finally:
+            h5_file.close()
         #
         print(utils.log_color('\nINFO', 'dataset ready', path))
         return
@@ -165,66 +175,25 @@ class NYUDepthV2(DatasetBase):
         return self.evaluate(predictions, **kwargs)
 
     def compute_scale_and_shift(self, prediction, gt, mask):
-        a_00 = np.sum(mask * prediction * prediction)
-        a_01 = np.sum(mask * prediction)
-        a_11 = np.sum(mask)
+        return utils.compute_scale_and_shift(prediction, gt, mask)
 
-        b_0 = np.sum(mask * prediction * gt)
-        b_1 = np.sum(mask * gt)
+    def evaluate(self, predictions, **kwargs):
+        evaluator = self.get_evaluator(**kwargs)
+        return utils.run_evaluator(evaluator, predictions, self.num_frames)
 
-        det = a_00 * a_11 - a_01 * a_01
+    def get_evaluator(self, **kwargs):
+        return NYUDepthV2Evaluator(self, **kwargs)
 
-        if det <= 0:
-            return 0, 0
 
-        else:
-            x_0 = (a_11 * b_0 - a_01 * b_1) / det
-            x_1 = (-a_01 * b_0 + a_00 * b_1) / det
-
-            return x_0, x_1
-
-    def evaluate(self, predictions, threshold=1.25, depth_cap_max = 80, depth_cap_min = 1e-3, **kwargs):
-        disparity = kwargs.get('disparity')
-        scale_and_shift_needed = kwargs.get('scale_shift')
-
-        delta_1 = 0.0
-        num_frames = min(self.num_frames, len(predictions))
-        for n in range(num_frames):
-            image_file, label_file = self.__getitem__(n, with_label=True)
-            label_img = PIL.Image.open(label_file)
-            label_img = np.array(label_img, dtype=np.float32) / self.depth_label_scale
-            prediction = predictions[n]
-            if scale_and_shift_needed:
-                mask = label_img != 0
-                disp_label = np.zeros_like(label_img)
-                disp_label[mask] = 1.0 / label_img[mask]
-                if not disparity:
-                    disp_prediction = np.zeros_like(prediction)
-                    disp_prediction[prediction != 0] = 1.0 / prediction[prediction != 0]
-                else:
-                    disp_prediction = prediction
-                scale, shift = self.compute_scale_and_shift(disp_prediction, disp_label, mask)
-
-                prediction = scale * disp_prediction + shift
-                prediction[prediction < 1 / depth_cap_max] = 1 / depth_cap_max
-                prediction[prediction > 1 / depth_cap_min] = 1 / depth_cap_min
-
-            mask = np.minimum(label_img, prediction) != 0
-
-            if disparity:
-                disp_pred = prediction
-                prediction = np.zeros_like(disp_pred)
-                prediction[mask] = 1.0 / disp_pred[mask]
-
-            delta = np.zeros_like(label_img, dtype=np.float32)
-            delta = np.maximum(
-                prediction[mask] / label_img[mask], 
-                label_img[mask] / prediction[mask]
-            )
-            good_pixels_in_img = delta < threshold
-            delta_1 += good_pixels_in_img.sum() / mask.sum()
-        #
+class NYUDepthV2Evaluator(utils.DepthEvaluator):
+    def __init__(self, dataset, threshold=1.25, depth_cap_max = 80, depth_cap_min = 1e-3, **kwargs):
+        super().__init__(dataset.num_frames, self._load_label, threshold=threshold, depth_cap_max=depth_cap_max,
+                         depth_cap_min=depth_cap_min, disparity=kwargs.get('disparity'),
+                         scale_shift=kwargs.get('scale_shift'))
+        self.dataset = dataset
 
-        delta_1 /= (n + 1)
-        metric = {'accuracy_delta_1%': delta_1 * 100}
-        return metric
\ No newline at end of file
+    def _load_label(self, frame_idx):
+        image_file, label_file = self.dataset.__getitem__(frame_idx, with_label=True)
+        label_img = PIL.Image.open(label_file)
+        label_img = np.array(label_img, dtype=np.float32) / self.dataset.depth_label_scale
+        return label_img
@@ -32,8 +32,18 @@ import copy
 import yaml
 import time
 import itertools
+import concurrent.futures
 from .. import utils, constants
 
+
+# the stages of inference for which the per frame latency is recorded
+# read, preprocess: in the frame loader. wait: the time that inference waited for the frame loader.
+# infer: in the runtime (session_invoke_time). session_overhead: in the session, outside of the runtime.
+# postprocess, evaluate: postprocess and metric update. frame: the total time per frame (it is less than the sum of
+# the stages when the frames are prefetched - as read, preprocess and postprocess are then overlapped with inference).
+latency_stages = ('read', 'preprocess', 'wait', 'infer', 'session_overhead', 'postprocess', 'evaluate', 'frame')
+
+
 class AccuracyPipeline():
     def __init__(self, settings, pipeline_config):
         self.info_dict = dict()
@@ -49,6 +59,9 @@ class AccuracyPipeline():
         # these files willbe written after import and inference respectively
         self.param_yaml = os.path.join(self.run_dir, 'param.yaml')
         self.result_yaml = os.path.join(self.run_dir, 'result.yaml')
+        # histograms of the per frame latency of each stage are written along with the result
+        self.latency_yaml = os.path.join(self.run_dir, 'latency.yaml')
+        self.latency_histograms = None
 
     def __enter__(self):
         return self
@@ -83,6 +96,7 @@ class AccuracyPipeline():
                 with open(self.result_yaml, 'w') as fp:
                     yaml.safe_dump(param_result, fp, sort_keys=False)
                 #
+                utils.write_results_store(self.result_yaml, param_result)
             #
             print(utils.log_color('\nSUCCESS', 'found results', f'{result_dict}\n'))
             return param_result
@@ -143,10 +157,12 @@ class AccuracyPipeline():
         if self.settings.run_inference:
             start_time = time.time()
             self.write_log(utils.log_color('\nINFO', f'infer {description}', self.run_dir_base))
-            output_list = self._infer_frames(description)
+            # the metric is accumulated as the frames are inferred, by these evaluators
+            evaluators = self._get_evaluators()
+            self._infer_frames(evaluators, description)
             elapsed_time = time.time() - start_time
             self.write_log(utils.log_color('\nINFO', f'infer completed {description}', f'{self.run_dir_base} - {elapsed_time:.0f} sec'))
-            result_dict = self._evaluate(output_list)
+            result_dict = self._evaluate(evaluators)
             # collect the results
             result_dict.update(self.infer_stats_dict)
             result_dict = utils.pretty_object(result_dict)
@@ -158,6 +174,11 @@ class AccuracyPipeline():
                 with open(self.result_yaml, 'w') as fp:
                     yaml.safe_dump(param_result, fp, sort_keys=False)
                 #
+                utils.write_results_store(self.result_yaml, param_result)
+                latency_dict = {stage: histogram.get_dict() for stage, histogram in self.latency_histograms.items()}
+                with open(self.latency_yaml, 'w') as fp:
+                    yaml.safe_dump(latency_dict, fp, sort_keys=False)
+                #
             #
         #
         return param_result
@@ -170,18 +191,17 @@ class AccuracyPipeline():
         calibration_frames = self.pipeline_config.get('calibration_frames', self.settings.calibration_frames)
         calibration_frames = min(len(calibration_dataset), calibration_frames)
 
-        calib_data = []
-        for data_index in range(calibration_frames):
-            info_dict = {}
-            data = calibration_dataset[data_index]
-            data, info_dict = preprocess(data, info_dict)
-            calib_data.append(data)
-        #
+        # calibration frames are preprocessed (in parallel if prefetch_workers is set) as the session consumes them
+        calib_data = utils.CalibrationData(calibration_dataset, preprocess, calibration_frames,
+                                           num_workers=self.settings.prefetch_workers or 0,
+                                           worker_type=self.settings.prefetch_worker_type,
+                                           prefetch_frames=self.settings.prefetch_frames,
+                                           cache_path=self.settings.calibration_cache_path)
 
         # this is the actual import
         self._run_with_log(session.import_model, calib_data)
 
-    def _infer_frames(self, description=''):
+    def _infer_frames(self, evaluators, description=''):
         session = self.pipeline_config['session']
         input_dataset = self.pipeline_config['input_dataset']
         assert input_dataset is not None, f'got input_dataset={input_dataset}. please check settings.dataset_loading'
@@ -200,26 +220,54 @@ class AccuracyPipeline():
         ddr_transfer = 0.0
         num_frames_ddr = 0
 
-        output_list = []
+        # frames are read and preprocessed ahead of inference if prefetch_workers is set
+        prefetch_workers = self.settings.prefetch_workers or 0
+        frame_loader = utils.PrefetchLoader(input_dataset, preprocess, range(num_frames),
+                                            num_workers=prefetch_workers,
+                                            worker_type=self.settings.prefetch_worker_type,
+                                            prefetch_frames=self.settings.prefetch_frames,
+                                            cache=self._get_preprocess_cache(preprocess))
+        # postprocess (and metric update) of a frame runs while the next frame is being inferred
+        postprocess_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) \
+            if prefetch_workers > 0 else None
+        postprocess_future = None
+
+        # frames are grouped for batched inference if inference_batch_size is set (not supported with flip_test)
+        batch_size = 1 if self.settings.flip_test else max(self.settings.inference_batch_size or 1, 1)
+
+        self.latency_histograms = {stage: utils.LatencyHistogram() for stage in latency_stages}
+
         pbar_desc = f'infer {description}: {run_dir_base}'
-        for data_index in utils.progress_step(range(num_frames), desc=pbar_desc, file=self.logger, position=0):
-            info_dict = {}
-            data = input_dataset[data_index]
-            data, info_dict = preprocess(data, info_dict)
-            output, info_dict = self._run_with_log(session.infer_frame, data, info_dict)
-            invoke_time += info_dict['session_invoke_time']
-
-            stats_dict = session.infer_stats()
-            core_time += stats_dict['core_time']
-            subgraph_time += stats_dict['subgraph_time']
-            if stats_dict['write_total'] >= 0  and stats_dict['read_total'] >= 0 :
-                ddr_transfer += (stats_dict['write_total'] + stats_dict['read_total'])
-                num_frames_ddr += 1
-           
+        frame_iter = utils.progress_step(frame_loader, desc=pbar_desc, file=self.logger, position=0)
+        frame_start_time = time.perf_counter()
+        for frames in self._batch_frames(frame_iter, batch_size):
+            num_batch_frames = len(frames)
+            wait_time = (time.perf_counter() - frame_start_time) / num_batch_frames
+            data_indices, inputs, info_dicts = zip(*frames)
+            infer_start_time = time.perf_counter()
+            outputs, info_dicts = self._run_with_log(session.infer_batch, list(inputs), info_dicts)
+            infer_call_time = (time.perf_counter() - infer_start_time) / num_batch_frames
+            infer_times = [info_dict['session_invoke_time'] for info_dict in info_dicts]
+            invoke_time += sum(infer_times)
+
+            # stats of each call to the runtime - one call for the whole batch or one for each frame
+            for num_call_frames, stats_dict in session.infer_batch_stats():
+                core_time += stats_dict['core_time']
+                subgraph_time += stats_dict['subgraph_time']
+                if stats_dict['write_total'] >= 0  and stats_dict['read_total'] >= 0 :
+                    ddr_transfer += (stats_dict['write_total'] + stats_dict['read_total'])
+                    num_frames_ddr += num_call_frames
+                #
+            #
+
             if self.settings.flip_test:
+                data_index, output, info_dict = data_indices[0], outputs[0], info_dicts[0]
+                infer_start_time = time.perf_counter()
                 outputs_flip, info_dict = self._run_with_log(session.infer_frame, info_dict['flip_img'], info_dict)
+                infer_call_time += time.perf_counter() - infer_start_time
                 info_dict['outputs_flip'] = outputs_flip
                 invoke_time += info_dict['session_invoke_time']
+                infer_times[0] += info_dict['session_invoke_time']
 
                 stats_dict = session.infer_stats()
                 core_time += stats_dict['core_time']
@@ -227,11 +275,39 @@ class AccuracyPipeline():
                 if stats_dict['write_total'] >= 0  and stats_dict['read_total'] >= 0 :
                     ddr_transfer += (stats_dict['write_total'] + stats_dict['read_total'])
                     num_frames_ddr += 1
+                outputs, info_dicts = [output], [info_dict]
             else:
-                info_dict['outputs_flip'] = None
-
-            output, info_dict = postprocess(output, info_dict)
-            output_list.append(output)
+                for info_dict in info_dicts:
+                    info_dict['outputs_flip'] = None
+                #
+            #
+            for info_dict, infer_time in zip(info_dicts, infer_times):
+                self._add_latency(read=info_dict.get('read_time', None), preprocess=info_dict.get('preprocess_time', None),
+                                  wait=wait_time, infer=infer_time, session_overhead=max(infer_call_time-infer_time, 0.0))
+            #
+            for data_index, output, info_dict in zip(data_indices, outputs, info_dicts):
+                if postprocess_executor is not None:
+                    # wait for the previous frame, so that at most one frame is in postprocess at a time
+                    if postprocess_future is not None:
+                        postprocess_future.result()
+                    #
+                    postprocess_future = postprocess_executor.submit(self._postprocess_frame, postprocess, evaluators,
+                                                                     data_index, output, info_dict)
+                else:
+                    self._postprocess_frame(postprocess, evaluators, data_index, output, info_dict)
+                #
+            #
+            frame_end_time = time.perf_counter()
+            for _ in range(num_batch_frames):
+                self._add_latency(frame=(frame_end_time - frame_start_time) / num_batch_frames)
+            #
+            frame_start_time = frame_end_time
+        #
+        if postprocess_executor is not None:
+            if postprocess_future is not None:
+                postprocess_future.result()
+            #
+            postprocess_executor.shutdown(wait=True)
         #
         # compute and populate final stats so that it can be used in result
         self.infer_stats_dict = {
@@ -250,9 +326,49 @@ class AccuracyPipeline():
         if 'perfsim_macs' in stats_dict:
             self.infer_stats_dict.update({'perfsim_gmacs': stats_dict['perfsim_macs'] / constants.GIGA_CONST})
         #
-        return output_list
+        # mean, p50, p90, p99 and max of each stage - the histograms are written to latency.yaml
+        self.infer_stats_dict['latency_ms'] = {stage: histogram.get_stats() for stage, histogram in \
+                                               self.latency_histograms.items() if histogram.count > 0}
 
-    def _evaluate(self, output_list):
+    def _batch_frames(self, frame_iter, batch_size):
+        frames = []
+        for frame in frame_iter:
+            frames.append(frame)
+            if len(frames) == batch_size:
+                yield frames
+                frames = []
+            #
+        #
+        if len(frames) > 0:
+            yield frames
+        #
+
+    def _postprocess_frame(self, postprocess, evaluators, data_index, output, info_dict):
+        start_time = time.perf_counter()
+        output, info_dict = postprocess(output, info_dict)
+        postprocess_time = time.perf_counter()
+        # the output is not kept after the update - so memory does not grow with the number of frames
+        for evaluator in evaluators:
+            evaluator.update(data_index, output)
+        #
+        self._add_latency(postprocess=postprocess_time-start_time, evaluate=time.perf_counter()-postprocess_time)
+
+    def _add_latency(self, **stage_times):
+        for stage, stage_time in stage_times.items():
+            if stage_time is not None:
+                self.latency_histograms[stage].add(stage_time)
+            #
+        #
+
+    def _get_preprocess_cache(self, preprocess):
+        # the cached info_dict doesn't have the decoded image, which is needed by the
+        # postprocess of some tasks (eg. detection) - so use the cache only for classification
+        if self.settings.preprocess_cache_path is None or self.pipeline_config.get('task_type', None) != 'classification':
+            return None
+        #
+        return utils.PreprocessCache(self.settings.preprocess_cache_path, preprocess)
+
+    def _get_evaluators(self):
         session = self.pipeline_config['session']
         # if metric is not given use input_dataset
         if 'metric' in self.pipeline_config and callable(self.pipeline_config['metric']):
@@ -266,11 +382,18 @@ class AccuracyPipeline():
         metric_options['run_dir'] = run_dir
         metric = utils.as_list(metric)
         metric_options = utils.as_list(metric_options)
+        # metrics that cannot be accumulated frame by frame get a BufferedEvaluator
+        evaluators = [utils.get_evaluator(m, **m_options) for m, m_options in zip(metric, metric_options)]
+        return evaluators
+
+    def _evaluate(self, evaluators):
+        session = self.pipeline_config['session']
+        run_dir = session.get_param('run_dir')
         output_dict = {}
         inference_path = os.path.split(run_dir)[-1]
         output_dict.update({'infer_path':inference_path})
-        for m, m_options in zip(metric, metric_options):
-            output = m(output_list, **m_options)
+        for evaluator in evaluators:
+            output = evaluator.finalize()
             output_dict.update(output)
         #
         return output_dict
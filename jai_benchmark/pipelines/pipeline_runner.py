@@ -27,26 +27,17 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import sys
+import re
+import yaml
 import functools
 import itertools
 import warnings
 import copy
 import traceback
 
-try:
-    import onnx
-except:
-    #warnings.warn('onnx could not be imported - this is not required for inference, but may be required for import')
-    pass
-
-try:
-    from onnxsim import simplify
-except:
-    #warnings.warn('onnxsim could not be imported - this is not required for inference, but may be required for import')
-    pass
-
 from .accuracy_pipeline import *
 from .. import utils
+from .. import datasets
 from jai_benchmark import preprocess
 
 #from prototxt_parser.prototxt import parse as prototxt_parse
@@ -58,6 +49,10 @@ class PipelineRunner():
             # set model_id in each config
             pipeline_config['session'].set_param('model_id', model_id)
             session = pipeline_config['session']
+            # the cache of compiled artifacts (used by tvmdlr) comes from settings, unless it is given in the session
+            if session.peek_params().get('build_cache_path', False) is None:
+                session.set_param('build_cache_path', settings.build_cache_path)
+            #
             # call initialize() on each pipeline_config so that run_dir,
             # artifacts folder and such things are initialized
             session.initialize()
@@ -88,7 +83,10 @@ class PipelineRunner():
         self.pipeline_configs = pipelines_selected
 
     def run(self):
-        if self.settings.parallel_devices is not None:
+        if self.settings.parallel_devices is not None and self.settings.get('parallel_inference_devices', None) is not None \
+                and self.settings.run_import and self.settings.run_inference:
+            return self._run_pipelines_pipelined()
+        elif self.settings.parallel_devices is not None:
             return self._run_pipelines_parallel()
         else:
             return self._run_pipelines_sequential()
@@ -115,13 +113,63 @@ class PipelineRunner():
         cwd = os.getcwd()
         num_devices = len(self.settings.parallel_devices)
         description = 'TASKS'
+        run_dirs = [pipeline_config['session'].get_param('run_dir') for pipeline_config in self.pipeline_configs.values()]
+        # the journal records the status and duration of each model - the durations are used to
+        # start the longest running models first, the next time these models are run.
+        journal_file = os.path.join(os.path.commonpath([os.path.dirname(d) for d in run_dirs]), 'parallel_run_journal.yaml') \
+            if len(run_dirs) > 0 else None
         parallel_exec = utils.ParallelRun(num_processes=num_devices, parallel_devices=self.settings.parallel_devices,
-                                          desc=description)
-        for pipeline_index, pipeline_config in enumerate(self.pipeline_configs.values()):
+                                          desc=description, max_retries=self.settings.parallel_max_retries,
+                                          journal_file=journal_file)
+        # the task is pickled to the worker process - the dataset_cache in settings is not needed there
+        basic_settings = self.settings.basic_settings()
+        for pipeline_config, run_dir in zip(self.pipeline_configs.values(), run_dirs):
             os.chdir(cwd)
-            run_pipeline_bound_func = functools.partial(self._run_pipeline, self.settings, pipeline_config,
+            run_pipeline_bound_func = functools.partial(self._run_pipeline, basic_settings, pipeline_config,
                                                         description='')
-            parallel_exec.enqueue(run_pipeline_bound_func)
+            # if the journal has no duration for the model, it is estimated from the logs of earlier runs
+            logged_durations = self._get_logged_durations(run_dir)
+            cost = sum(logged_durations.values()) if len(logged_durations) > 0 else None
+            parallel_exec.enqueue(run_pipeline_bound_func, task_id=os.path.basename(run_dir), cost=cost,
+                                  resume_task=self._get_resume_task(run_dir))
+        #
+        results_list = parallel_exec.run()
+        return results_list
+
+    def _run_pipelines_pipelined(self):
+        # import and inference run as separate tasks, in separate sets of processes - import in parallel_devices and
+        # inference in parallel_inference_devices. the inference of a model is queued as soon as its import is done,
+        # so the inference of a model runs while the next models are being imported.
+        assert isinstance(self.settings.parallel_inference_devices, list), \
+            'parallel_inference_devices must be None or a list of integers (GPU/CUDA devices)'
+
+        cwd = os.getcwd()
+        run_dirs = [pipeline_config['session'].get_param('run_dir') for pipeline_config in self.pipeline_configs.values()]
+        # separate journals for import and inference, as their durations are different
+        journal_base = os.path.join(os.path.commonpath([os.path.dirname(d) for d in run_dirs]), 'parallel_run_journal') \
+            if len(run_dirs) > 0 else None
+        stage_runs = []
+        for stage_name, stage_devices in (('import', self.settings.parallel_devices),
+                                          ('infer', self.settings.parallel_inference_devices)):
+            journal_file = f'{journal_base}_{stage_name}.yaml' if journal_base is not None else None
+            stage_runs.append(utils.ParallelRun(num_processes=len(stage_devices), parallel_devices=stage_devices,
+                                                desc=f'TASKS {stage_name}', max_retries=self.settings.parallel_max_retries,
+                                                journal_file=journal_file))
+        #
+        parallel_exec = utils.PipelinedParallelRun(stage_runs)
+        import_settings = self.settings.basic_settings()
+        import_settings.run_inference = False
+        infer_settings = self.settings.basic_settings()
+        infer_settings.run_import = False
+        for pipeline_config, run_dir in zip(self.pipeline_configs.values(), run_dirs):
+            os.chdir(cwd)
+            import_func = functools.partial(self._run_pipeline, import_settings, pipeline_config, description='')
+            infer_func = functools.partial(self._run_pipeline, infer_settings, pipeline_config, description='')
+            # if the journals have no durations for the model, they are estimated from the logs of earlier runs
+            logged_durations = self._get_logged_durations(run_dir)
+            costs = (logged_durations.get('import', None), logged_durations.get('infer', None))
+            parallel_exec.enqueue((import_func, infer_func), task_id=os.path.basename(run_dir), costs=costs,
+                                  resume_task=self._get_resume_task(run_dir))
         #
         results_list = parallel_exec.run()
         return results_list
@@ -131,7 +179,7 @@ class PipelineRunner():
     @classmethod
     def _run_pipeline(cls, settings_in, pipeline_config_in, description=''):
         # create a copy to avoid issues due to running multiple models
-        pipeline_config = copy.deepcopy(pipeline_config_in)
+        pipeline_config = cls._copy_pipeline_config(pipeline_config_in)
         # note that this basic_settings() copies only the basic settings.
         # sometimes, there is no need to copy the entire settings which includes the dataset_cache
         settings = settings_in.basic_settings()
@@ -165,6 +213,52 @@ class PipelineRunner():
         os.chdir(cwd)
         return result
 
+    def _get_resume_task(self, run_dir):
+        # models that are done are not run again (in a new process) if run_missing is set - their result is read here
+        if self.settings.run_missing and not self.settings.rewrite_results:
+            return functools.partial(self._load_result, run_dir)
+        else:
+            return None
+        #
+
+    @classmethod
+    def _load_result(cls, run_dir):
+        result_yaml = os.path.join(run_dir, 'result.yaml')
+        if not os.path.exists(result_yaml):
+            return None
+        #
+        with open(result_yaml) as fp:
+            param_result = yaml.safe_load(fp)
+        #
+        return param_result
+
+    @classmethod
+    def _get_logged_durations(cls, run_dir):
+        # durations of the import and the inference of the model (in sec), as written in run.log by
+        # AccuracyPipeline in earlier runs - the last one of each is used. empty if there is no log.
+        logged_durations = {}
+        log_file = os.path.join(run_dir, 'run.log')
+        if not os.path.exists(log_file):
+            return logged_durations
+        #
+        with open(log_file, errors='ignore') as fp:
+            for line in fp:
+                match = re.search(r'(import|infer) completed.* - (\d+) sec', line)
+                if match is not None:
+                    logged_durations[match.group(1)] = float(match.group(2))
+                #
+            #
+        #
+        return logged_durations
+
+    @classmethod
+    def _copy_pipeline_config(cls, pipeline_config_in):
+        # the datasets are only read by the pipeline - they are shared by the copy instead of being copied.
+        # LazyDatasets are copied, but the copies share the dataset that they construct (see datasets.LazyDataset)
+        memo = {id(value): value for value in pipeline_config_in.values() if isinstance(value, datasets.DatasetBase)}
+        pipeline_config = copy.deepcopy(pipeline_config_in, memo)
+        return pipeline_config
+
     def _str_match_any(self, k, x_list):
         match_any = any([(k in x) for x in x_list])
         return match_any
@@ -290,6 +384,8 @@ class PipelineRunner():
                 tarfile_name = run_dir + '.tar.gz'
                 linkfile_name = run_dir + '.tar.gz.link'
                 if (not os.path.exists(run_dir)) and (not os.path.exists(tarfile_name)) and (not os.path.exists(linkfile_name)):
+                    # onnx is required only to create the models of other sizes - import it here
+                    import onnx
                     onnx_model = onnx.load(model_path)
                     input_name_shapes = self.get_input_shape_onnx(onnx_model)
                     assert len(input_name_shapes) == 1
@@ -307,6 +403,7 @@ class PipelineRunner():
                     input_name_shapes[input_name] = [1, 3, input_size, input_size]
                     # change to fixed shape model
                     try:
+                        from onnxsim import simplify
                         onnx_model, check = simplify(onnx_model, skip_shape_inference=False, input_shapes=input_name_shapes)
                     except:
                         warnings.warn(f'please install onnx-simplifier : onnxsim.simplify() - changing the size of {model_path} did not work - skipping')
@@ -33,7 +33,6 @@ import numpy as np
 import cv2
 from PIL import ImageDraw
 from munkres import Munkres
-from numpy.lib.stride_tricks import as_strided
 import math
 
 
@@ -387,25 +386,29 @@ class HumanPoseHeatmapParser:
         self.refine_keypoints = True
 
     def maxpool2d(self,A):
-        """Apply the max pool operation on array A with self.nms_kernel as kernel size,
-        self.nms_padding as padding size and can specify the stride in function itself
+        """Apply the max pool operation (stride 1) on the last two dims of array A with self.nms_kernel
+        as kernel size and self.nms_padding as padding size. The max is separable - so it is done
+        along the rows and then along the columns, for all the heatmaps together.
 
         Args:
-            A(np.ndarray[WxH]): heatmap array
+            A(np.ndarray[...xHxW]): heatmap array
 
         Returns:
-            np.ndarray[WxH] : max pooled heatmap array
+            np.ndarray[...xHxW] : max pooled heatmap array
         """
-        A = np.pad(A, self.nms_padding, mode='constant')
-        stride = 1
-        output_shape = ((A.shape[0] - self.nms_kernel)//stride + 1,
-                        (A.shape[1] - self.nms_kernel)//stride + 1)
-        kernel_size = (self.nms_kernel, self.nms_kernel)
-        A_w = as_strided(A, shape = output_shape + kernel_size, 
-                            strides = (stride*A.strides[0],
-                                    stride*A.strides[1]) + A.strides)
-        A_w = A_w.reshape(-1, *kernel_size)
-        return A_w.max(axis=(1,2)).reshape(output_shape)
+        padding = [(0, 0)] * (A.ndim - 2) + [(self.nms_padding, self.nms_padding)] * 2
+        A = np.pad(A, padding, mode='constant')
+        output_h = A.shape[-2] - self.nms_kernel + 1
+        output_w = A.shape[-1] - self.nms_kernel + 1
+        A_h = A[..., :output_h, :]
+        for k in range(1, self.nms_kernel):
+            A_h = np.maximum(A_h, A[..., k:k+output_h, :])
+        #
+        A_w = A_h[..., :output_w]
+        for k in range(1, self.nms_kernel):
+            A_w = np.maximum(A_w, A_h[..., k:k+output_w])
+        #
+        return A_w
 
     def _py_max_match(self, scores):
         """Apply munkres algorithm to get the best match.
@@ -519,13 +522,38 @@ class HumanPoseHeatmapParser:
         """Non-Maximum Suppression for heatmaps.
         """
         heatmaps_new = copy.deepcopy(heatmaps)
-        for i,heatmap in enumerate(heatmaps[0]):
-            maxm = self.maxpool2d(heatmap)
-            maxm = np.equal(maxm,heatmap)
-            heatmap = heatmap * maxm
-            heatmaps_new[0][i] = heatmap
+        maxm = self.maxpool2d(heatmaps[0])
+        maxm = np.equal(maxm, heatmaps[0])
+        heatmaps_new[0] = heatmaps[0] * maxm
         return heatmaps_new
 
+    def _top_k_indices(self, heatmaps):
+        """Indices of the top max_num_people values (in descending order) of each of the flattened heatmaps.
+        np.argpartition is used instead of a full sort. The order of equal values from argsort is
+        implementation specific - for the heatmaps that have such ties above the detection_threshold
+        (the values below it are not used for grouping) or nans, the full argsort is used.
+
+        Args:
+            heatmaps (np.ndarray[KxHW])
+
+        Returns:
+            np.ndarray[KxM]
+        """
+        num_top = self.max_num_people
+        if heatmaps.shape[1] <= num_top or np.isnan(heatmaps).any():
+            return np.array([heatmap.argsort()[-num_top:][::-1] for heatmap in heatmaps])
+        #
+        ind = np.argpartition(-heatmaps, num_top, axis=1)[:, :num_top+1]
+        val = np.take_along_axis(heatmaps, ind, axis=1)
+        order = np.argsort(-val, axis=1, kind='stable')
+        ind = np.take_along_axis(ind, order, axis=1)
+        val = np.take_along_axis(val, order, axis=1).astype(np.float64)
+        ties = (val[:, 1:] == val[:, :-1]) & (val[:, 1:] > self.detection_threshold)
+        for i in np.flatnonzero(ties.any(axis=1)):
+            ind[i, :num_top] = heatmaps[i].argsort()[-num_top:][::-1]
+        #
+        return ind[:, :num_top]
+
     def match(self, tag_k, loc_k, val_k):
         """Group keypoints to human poses in a batch.
 
@@ -580,10 +608,9 @@ class HumanPoseHeatmapParser:
         
         ind = np.zeros((N,K,self.max_num_people),int)
         val_k = np.zeros((N,K,self.max_num_people))
-        for i,heatmap in enumerate(heatmaps[0]):
-            ind[0][i] = heatmap.argsort()[-self.max_num_people:][::-1]
-            val_k[0][i] = heatmap[ind[0][i]]
-            
+        ind[0] = self._top_k_indices(heatmaps[0])
+        val_k[0] = np.take_along_axis(heatmaps[0], ind[0], axis=1)
+
         tags = np.reshape(tags,(tags.shape[0], tags.shape[1], W * H, -1))
         tag_k = np.concatenate([np.expand_dims(self.gather(tags[...,i],2,ind),axis=3) for i in range(tags.shape[3])],axis=3)
 
@@ -615,25 +642,21 @@ class HumanPoseHeatmapParser:
         """
         _, _, H, W = heatmaps.shape
         for batch_id, people in enumerate(ans):
-            for people_id, people_i in enumerate(people):
-                for joint_id, joint in enumerate(people_i):
-                    if joint[2] > 0:
-                        x, y = joint[0:2]
-                        xx, yy = int(x), int(y)
-                        tmp = heatmaps[batch_id][joint_id]
-                        if tmp[min(H - 1, yy + 1), xx] > tmp[max(0, yy - 1),
-                                                             xx]:
-                            y += 0.25
-                        else:
-                            y -= 0.25
-
-                        if tmp[yy, min(W - 1, xx + 1)] > tmp[yy,
-                                                             max(0, xx - 1)]:
-                            x += 0.25
-                        else:
-                            x -= 0.25
-                        ans[batch_id][people_id, joint_id,
-                                      0:2] = (x + 0.5, y + 0.5)
+            if len(people) == 0:
+                continue
+            #
+            # all the detected joints of all the people together
+            people_id, joint_id = np.nonzero(people[..., 2] > 0)
+            x = people[people_id, joint_id, 0].astype(np.float64)
+            y = people[people_id, joint_id, 1].astype(np.float64)
+            xx, yy = x.astype(int), y.astype(int)
+            tmp = heatmaps[batch_id]
+            y = np.where(tmp[joint_id, np.minimum(H - 1, yy + 1), xx] >
+                         tmp[joint_id, np.maximum(0, yy - 1), xx], y + 0.25, y - 0.25)
+            x = np.where(tmp[joint_id, yy, np.minimum(W - 1, xx + 1)] >
+                         tmp[joint_id, yy, np.maximum(0, xx - 1)], x + 0.25, x - 0.25)
+            ans[batch_id][people_id, joint_id, 0] = x + 0.5
+            ans[batch_id][people_id, joint_id, 1] = y + 0.5
         return ans
 
     def refine(self, heatmap, tag, keypoints):
@@ -660,56 +683,56 @@ class HumanPoseHeatmapParser:
         if len(tag.shape) == 3:
             tag = tag[..., None]
 
-        tags = []
-        for i in range(K):
-            if keypoints[i, 2] > 0:
-                # save tag value of detected keypoint
-                x, y = keypoints[i][:2].astype(int)
-                x = np.clip(x, 0, W - 1)
-                y = np.clip(y, 0, H - 1)
-                tags.append(tag[i, y, x])
+        # save tag value of detected keypoints
+        detected = np.flatnonzero(keypoints[:, 2] > 0)
+        xy = keypoints[detected, :2].astype(int)
+        x = np.clip(xy[:, 0], 0, W - 1)
+        y = np.clip(xy[:, 1], 0, H - 1)
+        tags = tag[detected, y, x]
 
         # mean tag of current detected people
         prev_tag = np.mean(tags, axis=0)
-        ans = []
-
-        for _heatmap, _tag in zip(heatmap, tag):
-            # distance of all tag values with mean tag of
-            # current detected people
-            distance_tag = (((_tag -
-                              prev_tag[None, None, :])**2).sum(axis=2)**0.5)
-            norm_heatmap = _heatmap - np.round(distance_tag)
-
-            # find maximum position
-            y, x = np.unravel_index(np.argmax(norm_heatmap), _heatmap.shape)
-            xx = x.copy()
-            yy = y.copy()
-            # detection score at maximum position
-            val = _heatmap[y, x]
-            if not self.use_udp:
-                # offset by 0.5
-                x += 0.5
-                y += 0.5
-
-            # add a quarter offset
-            if _heatmap[yy, min(W - 1, xx + 1)] > _heatmap[yy, max(0, xx - 1)]:
-                x += 0.25
-            else:
-                x -= 0.25
 
-            if _heatmap[min(H - 1, yy + 1), xx] > _heatmap[max(0, yy - 1), xx]:
-                y += 0.25
-            else:
-                y -= 0.25
-
-            ans.append((x, y, val))
-        ans = np.array(ans)
-
-        if ans is not None:
-            for i in range(K):
-                # add keypoint if it is not detected
-                if ans[i, 2] > 0 and keypoints[i, 2] == 0:
-                    keypoints[i, :3] = ans[i, :3]
+        # only the joints that are not detected can be added - so search only those
+        joint_id = np.flatnonzero(keypoints[:, 2] == 0)
+        if len(joint_id) == 0:
+            return keypoints
+        #
+        heatmap = heatmap[joint_id]
+
+        # distance of all tag values with mean tag of
+        # current detected people - the sum over the tag dim is
+        # done in the same order as ndarray.sum() for small dims
+        tag_diff = (tag[joint_id] - prev_tag[None, None, None, :])**2
+        distance_tag = tag_diff[..., 0]
+        for l in range(1, tag_diff.shape[-1]):
+            distance_tag = distance_tag + tag_diff[..., l]
+        #
+        distance_tag = distance_tag**0.5
+        norm_heatmap = heatmap - np.round(distance_tag)
+
+        # find maximum position
+        heatmap_id = np.arange(len(joint_id))
+        yy, xx = np.unravel_index(np.argmax(norm_heatmap.reshape(len(joint_id), -1), axis=1), (H, W))
+        # detection score at maximum position
+        val = heatmap[heatmap_id, yy, xx]
+        x = xx.astype(np.float64)
+        y = yy.astype(np.float64)
+        if not self.use_udp:
+            # offset by 0.5
+            x += 0.5
+            y += 0.5
+
+        # add a quarter offset
+        x = np.where(heatmap[heatmap_id, yy, np.minimum(W - 1, xx + 1)] >
+                     heatmap[heatmap_id, yy, np.maximum(0, xx - 1)], x + 0.25, x - 0.25)
+        y = np.where(heatmap[heatmap_id, np.minimum(H - 1, yy + 1), xx] >
+                     heatmap[heatmap_id, np.maximum(0, yy - 1), xx], y + 0.25, y - 0.25)
+        ans = np.stack([x, y, val.astype(np.float64)], axis=1)
+
+        # add keypoint if it is not detected
+        found = ans[:, 2] > 0
+        keypoints[joint_id[found], :3] = ans[found, :3]
 
         return keypoints
 
@@ -755,7 +778,7 @@ class HumanPoseHeatmapParser:
 
         index = coords[..., 0] + 1 + (coords[..., 1] + 1) * (W + 2)
         index += (W + 2) * (H + 2) * np.arange(0, B * K).reshape(-1, K)
-        index = index.astype(np.int).reshape(-1, 1)
+        index = index.astype(int).reshape(-1, 1)
         i_ = batch_heatmaps_pad[index]
         ix1 = batch_heatmaps_pad[index + 1]
         iy1 = batch_heatmaps_pad[index + W + 2]
@@ -413,6 +413,17 @@ class PointCloudRead(object):
         return point_cloud_data, info_dict
 
 class Voxelization(object):
+    """
+    Groups the points of a point cloud into pillars (voxels) and computes the pillar features.
+    Output layout: input0 (1, 9, max_points_per_voxel, nw_max_num_voxels) pillar features,
+    input2 (1, num_channel, nw_max_num_voxels) the flat voxel index of each pillar and
+    input1 (1, num_channel, num_voxel_x*num_voxel_y) which is all zeros.
+
+    Pillars are numbered in the order in which their first point appears in the point cloud
+    and each pillar keeps its first max_points_per_voxel points. The computations are vectorized,
+    but follow the same arithmetic (and the same numpy scalar type promotion) as a per point loop,
+    so the output is bit exact with it.
+    """
     def __init__(self):
 
         self.min_x = 0
@@ -430,113 +441,88 @@ class Voxelization(object):
         self.num_feat_per_voxel = 9
         self.num_channel = 64
         self.scale_fact = 32.0
-
+        # input1 is never written to - so one read only buffer is shared by all the frames
+        self._input1 = None
 
     def __call__(self, lidar_data, info_dict):
+        # numpy scalar ops with python floats are done in float64 in numpy<2, but in the
+        # dtype of the numpy operand with the promotion rules of numpy>=2. use the same precision -
+        # for the points, that of lidar_data and for the features, that of the float32 input0.
+        calc_dtype = (lidar_data.dtype.type(0) + 0.0).dtype
+        feature_dtype = (np.float32(0) + 0.0).dtype
 
-        scratch_1 =[]
-        scratch_2 =[]
-
+        # the outputs are allocated per frame, as earlier frames may still be in use (eg. in a prefetch queue)
         input0 = np.zeros((1, self.num_feat_per_voxel, self.max_points_per_voxel, self.nw_max_num_voxels),dtype='float32')
-        input1 = np.zeros((1, self.num_channel, (int)(self.num_voxel_x*self.num_voxel_y)),dtype='float32')
         input2 = np.zeros((1, self.num_channel, self.nw_max_num_voxels),dtype='int32')
+        input1 = self._get_input1()
+
+        points = lidar_data[:,:4].astype(calc_dtype)
+        x, y, z = points[:,0], points[:,1], points[:,2]
+        valid = (x >= self.min_x) & (x < self.max_x) & (y >= self.min_y) & (y < self.max_y) & \
+                (z >= self.min_z) & (z < self.max_z)
+        point_index = np.nonzero(valid)[0]
+        x_id = ((x[point_index] - self.min_x) / self.voxel_size_x).astype(np.int64)
+        y_id = ((y[point_index] - self.min_y) / self.voxel_size_y).astype(np.int64)
+        # flat voxel index - num_voxel_x is a float, so this is a float (as in the reference loop)
+        voxel_key = y_id * self.num_voxel_x + x_id
+
+        # number the non empty voxels in the order of their first point
+        unique_keys, first_index, point_voxel = np.unique(voxel_key, return_index=True, return_inverse=True)
+        point_voxel = point_voxel.reshape(-1)
+        voxel_order = np.argsort(first_index, kind='stable')
+        voxel_rank = np.empty_like(voxel_order)
+        voxel_rank[voxel_order] = np.arange(len(voxel_order))
+        point_voxel = voxel_rank[point_voxel]
+        # the network can take only nw_max_num_voxels voxels - the extra voxels are dropped
+        num_voxels = min(len(voxel_order), self.nw_max_num_voxels)
+        voxel_key = unique_keys[voxel_order][:num_voxels].astype(np.int32)
+
+        # position of each point in its voxel
+        voxel_counts = np.bincount(point_voxel, minlength=len(voxel_order))
+        sort_index = np.argsort(point_voxel, kind='stable')
+        voxel_start = np.cumsum(voxel_counts) - voxel_counts
+        point_slot = np.empty_like(sort_index)
+        point_slot[sort_index] = np.arange(len(sort_index)) - voxel_start[point_voxel[sort_index]]
+        keep = (point_slot < self.max_points_per_voxel) & (point_voxel < num_voxels)
+        point_index, point_voxel, point_slot = point_index[keep], point_voxel[keep], point_slot[keep]
+        num_points = np.minimum(voxel_counts[:num_voxels], self.max_points_per_voxel)
+
+        # scatter the scaled x, y, z, intensity of the points
+        features = input0[0,:,:,:num_voxels]
+        features[:4, point_slot, point_voxel] = (points[point_index] * self.scale_fact).astype(np.float32).T
+
+        # mean of the points in each voxel - accumulated in the order of the points
+        xyz_sum = np.zeros((3, num_voxels), dtype=feature_dtype)
+        for j in range(self.max_points_per_voxel):
+            xyz_sum += features[:3, j, :]
+        #
+        xyz_avg = xyz_sum.astype(np.float64) / num_points
 
-        for i, data in enumerate(lidar_data):
-
-            x = data[0]
-            y = data[1]
-            z = data[2]
-
-            if ((x >= self.min_x) and (x < self.max_x) and (y >= self.min_y) and (y < self.max_y) and
-                (z >= self.min_z) and (z < self.max_z)):
-
-                x_id = (int)(((x - self.min_x) / self.voxel_size_x))
-                y_id = (int)(((y - self.min_y) / self.voxel_size_y))
-                scratch_1.append(y_id * self.num_voxel_x + x_id)
-            else:
-                scratch_1.append(-1 - i) # filing unique non valid index
-
-        num_points = np.zeros(self.nw_max_num_voxels,dtype=int)
-
-        # Find unique indices
-        # There will be voxel which doesnt have any 3d point, hence collecting the voxel ids for valid voxels*/
-        # scratch_2 is the index in valid voxels
-        num_non_empty_voxels = 0
-
-        for i in range(len(lidar_data)):
-            if (scratch_1[i] >= 0):
-
-                find_voxel = scratch_1[i] in scratch_1[:i]
-
-                if find_voxel == False:
-                    scratch_2.append(num_non_empty_voxels) # this voxel idx has come first time, hence allocate a new index for this
-                    input2[0][0][num_non_empty_voxels] = scratch_1[i]
-                    num_non_empty_voxels += 1
-                else:
-                    k = scratch_1[:i].index(scratch_1[i])
-                    scratch_2.append(scratch_2[k]) #already this voxel is having one id hence reuse it
-            else:
-                scratch_2.append(None)
-
-        #Even though current_voxels is less than self.nw_max_num_voxels, then also arrange
-        #    the data as per maximum number of voxels.
-
-        line_pitch = self.nw_max_num_voxels
-        channel_pitch = self.max_points_per_voxel * line_pitch
-        j = 0
-        tot_num_pts = 0
-
-        for i in range(len(lidar_data)):
-            if (scratch_1[i] >= 0):
-                j = scratch_2[i] #voxel index
-                if(num_points[j]<self.max_points_per_voxel):
-                    input0[0][0][num_points[j]][j] = lidar_data[i][0] * self.scale_fact
-                    input0[0][1][num_points[j]][j] = lidar_data[i][1] * self.scale_fact
-                    input0[0][2][num_points[j]][j] = lidar_data[i][2] * self.scale_fact
-                    input0[0][3][num_points[j]][j] = lidar_data[i][3] * self.scale_fact
-                    num_points[j] = num_points[j] + 1
-                else:
-                    tot_num_pts = tot_num_pts+1
-
-        line_pitch = self.nw_max_num_voxels
-        channel_pitch = self.max_points_per_voxel * line_pitch
+        # center of each voxel
         x_offset = self.voxel_size_x / 2 + self.min_x
         y_offset = self.voxel_size_y / 2 + self.min_y
-
-        for i in range(num_non_empty_voxels):
-            x = 0
-            y = 0
-            z = 0
-
-            for j in range(num_points[i]):
-                x += input0[0][0][j][i]
-                y += input0[0][1][j][i]
-                z += input0[0][2][j][i]
-
-            x_avg = x / num_points[i]
-            y_avg = y / num_points[i]
-            z_avg = z / num_points[i]
-
-            voxel_center_y = (int)(input2[0][0][i] / self.num_voxel_x)
-            voxel_center_x = (int)(input2[0][0][i] - ((int)(voxel_center_y)) * self.num_voxel_x)
-
-            voxel_center_x *= self.voxel_size_x
-            voxel_center_x += x_offset
-
-            voxel_center_y *= self.voxel_size_y
-            voxel_center_y += y_offset
-
-            for j in range(num_points[i]):
-                input0[0][4][j][i] = input0[0][0][j][i] - x_avg
-                input0[0][5][j][i] = input0[0][1][j][i] - y_avg
-                input0[0][6][j][i] = input0[0][2][j][i] - z_avg
-                input0[0][7][j][i] = input0[0][0][j][i] - voxel_center_x * self.scale_fact
-                input0[0][8][j][i] = input0[0][1][j][i] - voxel_center_y * self.scale_fact
+        voxel_center_y = (voxel_key / self.num_voxel_x).astype(np.int64)
+        voxel_center_x = (voxel_key - voxel_center_y * self.num_voxel_x).astype(np.int64)
+        voxel_center_x = voxel_center_x * self.voxel_size_x + x_offset
+        voxel_center_y = voxel_center_y * self.voxel_size_y + y_offset
+        voxel_center = np.stack([voxel_center_x * self.scale_fact, voxel_center_y * self.scale_fact]).astype(feature_dtype)
+
+        slot_valid = np.arange(self.max_points_per_voxel)[:,None] < num_points[None,:]
+        offset_avg = features[:3].astype(np.float64) - xyz_avg[:,None,:]
+        offset_center = features[:2].astype(feature_dtype) - voxel_center[:,None,:]
+        features[4:7] = np.where(slot_valid, offset_avg, 0)
+        features[7:9] = np.where(slot_valid, offset_center, 0)
 
         #/*looks like bug in python mmdetection3d code, hence below code is to mimic the mmdetect behaviour*/
-            for j in range (num_points[i]):
-                input0[0][0][j][i] = input0[0][7][j][i]
-                input0[0][1][j][i] = input0[0][8][j][i]
+        features[0:2] = features[7:9]
 
+        input2[0][0][:num_voxels] = voxel_key
         input2[0][1:64] = input2[0][0]
         return (input0,input2,input1), info_dict
+
+    def _get_input1(self):
+        if self._input1 is None:
+            self._input1 = np.zeros((1, self.num_channel, (int)(self.num_voxel_x*self.num_voxel_y)),dtype='float32')
+            self._input1.setflags(write=False)
+        #
+        return self._input1
@@ -28,28 +28,41 @@
 
 
 from .. import constants
-from .tvmdlr_session import TVMDLRSession
-from .tflitert_session import TFLiteRTSession
-from .onnxrt_session import ONNXRTSession
+from .. import utils
 
 
-session_name_to_type_dict = {
-    constants.SESSION_NAME_TVMDLR : TVMDLRSession,
-    constants.SESSION_NAME_TFLITERT: TFLiteRTSession,
-    constants.SESSION_NAME_ONNXRT: ONNXRTSession
+# the session modules import their runtimes (and tvm, mxnet for import) - so they are imported only when used
+_session_modules = {
+    'BaseRTSession': '.basert_session',
+    'TVMDLRSession': '.tvmdlr_session',
+    'TFLiteRTSession': '.tflitert_session',
+    'ONNXRTSession': '.onnxrt_session',
+    'MockRTSession': '.mock_session',
 }
 
 
-session_type_to_name_dict = {
-    TVMDLRSession : constants.SESSION_NAME_TVMDLR,
-    TFLiteRTSession : constants.SESSION_NAME_TFLITERT,
-    ONNXRTSession: constants.SESSION_NAME_ONNXRT
-}
+def __getattr__(name):
+    if name == 'session_type_to_name_dict':
+        return {get_session_type(session_name): session_name for session_name in session_name_to_type_dict.keys()}
+    #
+    return utils.import_attr(__name__, _session_modules, name)
+
+
+# the session classes are imported when they are looked up in this dict
+session_name_to_type_dict = utils.LazyImportDict(__name__, {
+    constants.SESSION_NAME_TVMDLR : 'TVMDLRSession',
+    constants.SESSION_NAME_TFLITERT: 'TFLiteRTSession',
+    constants.SESSION_NAME_ONNXRT: 'ONNXRTSession',
+    constants.SESSION_NAME_MOCK: 'MockRTSession'
+})
 
 
 def get_session_name(session_type):
-    assert session_type in session_type_to_name_dict, f'unrecognized session_type: {session_type}'
-    return session_type_to_name_dict[session_type]
+    session_type_names = session_name_to_type_dict.attr_names
+    session_names = [session_name for session_name, type_name in session_type_names.items() \
+                     if session_type.__name__ == type_name and session_type is get_session_type(session_name)]
+    assert len(session_names) > 0, f'unrecognized session_type: {session_type}'
+    return session_names[0]
 
 
 def get_session_type(session_name):
@@ -59,4 +72,3 @@ def get_session_type(session_name):
 
 def get_session_name_to_type_dict():
     return session_name_to_type_dict
-
@@ -27,6 +27,7 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import os
+import time
 import datetime
 import shutil
 import tempfile
@@ -50,14 +51,22 @@ class BaseRTSession(utils.ParamsBase):
         self.is_started = False
         self.is_imported = False
         self.is_start_infer_done = False
+        # perfsim stats are static once the artifacts are created - they are read once and cached here
+        # along with the artifacts signature (the sizes and modification times of the files)
+        self.perfsim_stats_cache = None
+        # None: batched inference not tried yet, False: not supported by the session or the model
+        self.batched_inference = None
+        # the stats of each runtime call in the last infer_batch()
+        self.batch_infer_stats = []
 
         # set tidl_offload to False to disable offloading to TIDL
         self.kwargs['tidl_offload'] = self.kwargs.get('tidl_offload', True)
 
-        # tidl_tools_path
-        assert 'TIDL_TOOLS_PATH' in os.environ, 'TIDL_TOOLS_PATH must be set in environemnt variable'
-        tidl_tools_path = os.environ['TIDL_TOOLS_PATH']
-        self.kwargs['tidl_tools_path'] = tidl_tools_path
+        # tidl_tools_path - from the environment, unless it is given (a session that doesn't use tidl may give it)
+        if self.kwargs.get('tidl_tools_path', None) is None:
+            assert 'TIDL_TOOLS_PATH' in os.environ, 'TIDL_TOOLS_PATH must be set in environemnt variable'
+            self.kwargs['tidl_tools_path'] = os.environ['TIDL_TOOLS_PATH']
+        #
 
         # work_dir at top level
         self.kwargs['work_dir'] = self.kwargs.get('work_dir', None)
@@ -139,6 +148,7 @@ class BaseRTSession(utils.ParamsBase):
         os.makedirs(self.kwargs['artifacts_folder'], exist_ok=True)
 
         self.clear()
+        self.perfsim_stats_cache = None
         self.is_imported = True
 
     def start_infer(self):
@@ -152,6 +162,8 @@ class BaseRTSession(utils.ParamsBase):
         # we assume that it is proper and import is done
         self.is_imported = True
         self.is_start_infer_done = True
+        # read the perfsim stats here, so that it need not be done for every frame
+        self._update_perfsim_stats_cache()
 
     def __call__(self, input, info_dict):
         return self.infer_frame(input, info_dict)
@@ -167,14 +179,106 @@ class BaseRTSession(utils.ParamsBase):
         # the over-ridden function in super class must return valid outputs
         return None, None
 
-    def infer_frames(self, inputs, info_dict=None):
+    def infer_frames(self, inputs, info_dict=None, batch_size=1):
         outputs = []
-        for input in inputs:
-            output, info_dict = self.infer_frame(input, info_dict)
-            outputs.append(output)
+        if batch_size <= 1:
+            for input in inputs:
+                output, info_dict = self.infer_frame(input, info_dict)
+                outputs.append(output)
+            #
+        else:
+            for start_index in range(0, len(inputs), batch_size):
+                batch_inputs = inputs[start_index:start_index+batch_size]
+                batch_outputs, _ = self.infer_batch(batch_inputs, [info_dict]*len(batch_inputs))
+                outputs.extend(batch_outputs)
+            #
         #
         return outputs, info_dict
 
+    def infer_batch(self, inputs, info_dicts):
+        '''run inference of several frames with a single call to the runtime.
+        the frames are concatenated along the first (batch) dimension and the outputs
+        are split back into the outputs of each frame. if the session or the model cannot
+        run batched (see _supports_batched_inference()), the frames are inferred one by one using infer_frame().
+        session_invoke_time of the batch is divided equally among the frames.
+        the stats of each of the runtime calls are returned by infer_batch_stats().'''
+        info_dicts = list(info_dicts)
+        if len(inputs) > 1 and self.batched_inference is not False and self._supports_batched_inference():
+            outputs = self._infer_batch(inputs, info_dicts)
+            if outputs is not None:
+                # the stats of the interpreter that ran the batch
+                self.batch_infer_stats = [(len(inputs), self.infer_stats(self._get_batch_interpreter()))]
+                return outputs, info_dicts
+            #
+        #
+        outputs = []
+        self.batch_infer_stats = []
+        for frame_index, input in enumerate(inputs):
+            output, info_dicts[frame_index] = self.infer_frame(input, info_dicts[frame_index])
+            outputs.append(output)
+            self.batch_infer_stats.append((1, self.infer_stats()))
+        #
+        return outputs, info_dicts
+
+    def infer_batch_stats(self):
+        '''list of (number of frames, infer_stats()) of each runtime call in the last infer_batch() -
+        a single entry for the batch if it was inferred batched, else an entry for each frame'''
+        return self.batch_infer_stats
+
+    def _infer_batch(self, inputs, info_dicts):
+        assert self.is_imported, 'import_model() must be called before infer_batch()'
+        if not self.is_start_infer_done:
+            self.start_infer()
+        #
+        batch_size = len(inputs)
+        inputs = [utils.as_tuple(input) for input in inputs]
+        # each of the input tensors must have a batch dimension of 1, so that they can be concatenated
+        for input in inputs:
+            if len(input) != len(inputs[0]) or any((np.ndim(t) == 0 or np.shape(t)[0] != 1) for t in input):
+                return None
+            #
+        #
+        batch_input = tuple(np.concatenate(tensors, axis=0) for tensors in zip(*inputs))
+        run_dir_base = os.path.basename(self.kwargs['run_dir'])
+        try:
+            start_time = time.time()
+            batch_outputs = self._run_batch(batch_input)
+            invoke_time = time.time() - start_time
+        except Exception as e:
+            print(utils.log_color('\nWARNING', 'batched inference is not possible, inferring one frame at a time',
+                                  f'{run_dir_base} - {type(e).__name__}: {e}'))
+            self.batched_inference = False
+            return None
+        #
+        if any((np.ndim(o) == 0 or np.shape(o)[0] != batch_size) for o in batch_outputs):
+            print(utils.log_color('\nWARNING', 'batched inference is not possible, inferring one frame at a time',
+                                  f'{run_dir_base} - the outputs do not have a batch dimension'))
+            self.batched_inference = False
+            return None
+        #
+        self.batched_inference = True
+        outputs = [[o[frame_index:frame_index+1] for o in batch_outputs] for frame_index in range(batch_size)]
+        for info_dict in info_dicts:
+            if info_dict is not None:
+                info_dict['run_dir'] = self.get_param('run_dir')
+                info_dict['session_invoke_time'] = invoke_time / batch_size
+            #
+        #
+        return outputs
+
+    def _supports_batched_inference(self):
+        # a session that supports batched inference over-rides this and _run_batch()
+        return False
+
+    def _get_batch_interpreter(self):
+        # the interpreter that runs _run_batch() - for its stats
+        return self.interpreter
+
+    def _run_batch(self, input):
+        # the over-ridden function in super class must run the batched input tensors and return the outputs
+        # it is called only if _supports_batched_inference() is True
+        raise NotImplementedError('batched inference is not supported by this session')
+
     def run(self, calib_data, inputs, info_dict=None):
         info_dict = self.import_model(calib_data, info_dict)
         outputs, info_dict = self.infer_frames(inputs, info_dict)
@@ -187,9 +291,10 @@ class BaseRTSession(utils.ParamsBase):
             t.cleanup()
         #
 
-    def infer_stats(self):
-        if hasattr(self.interpreter, 'get_TI_benchmark_data'):
-            stats_dict = self._tidl_infer_stats()
+    def infer_stats(self, interpreter=None):
+        interpreter = interpreter if interpreter is not None else self.interpreter
+        if hasattr(interpreter, 'get_TI_benchmark_data'):
+            stats_dict = self._tidl_infer_stats(interpreter)
         else:
             stats_dict = dict()
             stats_dict['num_subgraphs'] = 0
@@ -203,9 +308,10 @@ class BaseRTSession(utils.ParamsBase):
         #
         return stats_dict
 
-    def _tidl_infer_stats(self):
+    def _tidl_infer_stats(self, interpreter=None):
         assert self.is_imported is True, 'the given model must be an imported one.'
-        benchmark_dict = self.interpreter.get_TI_benchmark_data()
+        interpreter = interpreter if interpreter is not None else self.interpreter
+        benchmark_dict = interpreter.get_TI_benchmark_data()
         subgraph_time = copy_time = 0
         cp_in_time = cp_out_time = 0
         subgraphIds = []
@@ -244,13 +350,35 @@ class BaseRTSession(utils.ParamsBase):
             'write_total': write_total, 'read_total': read_total,
             'perfsim_macs': 0.0, 'perfsim_time': 0.0, 'perfsim_ddr_transfer': 0.0
         }
+        if self.perfsim_stats_cache is None:
+            self._update_perfsim_stats_cache()
+        #
+        stats.update(self.perfsim_stats_cache['stats'])
+        return stats
+
+    def _update_perfsim_stats_cache(self):
+        artifacts_signature = self._get_artifacts_signature()
+        if self.perfsim_stats_cache is not None and self.perfsim_stats_cache['signature'] == artifacts_signature:
+            return
+        #
         try:
             perfsim_stats = self._infer_perfsim_stats()
-            stats.update(perfsim_stats)
         except:
-            pass
+            perfsim_stats = {}
         #
-        return stats
+        self.perfsim_stats_cache = {'signature': artifacts_signature, 'stats': perfsim_stats}
+
+    def _get_artifacts_signature(self):
+        artifacts_folder = self.kwargs['artifacts_folder']
+        artifacts_signature = []
+        for root, dirs, files in os.walk(artifacts_folder):
+            for f in files:
+                file_path = os.path.join(root, f)
+                file_stat = os.stat(file_path)
+                artifacts_signature.append((os.path.relpath(file_path, artifacts_folder), file_stat.st_size, file_stat.st_mtime_ns))
+            #
+        #
+        return sorted(artifacts_signature)
 
     def _infer_perfsim_stats(self):
         assert self.is_imported == True, 'the given model must be an imported one.'
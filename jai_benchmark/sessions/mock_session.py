@@ -0,0 +1,285 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import time
+import glob
+import yaml
+import numpy as np
+from .. import constants
+from .basert_session import BaseRTSession
+
+
+class MockInterpreter():
+    '''stand-in for the runtime interpreter - returns the given outputs (cycling through them) after the
+    simulated latency, and records the timestamps of the run in the format of get_TI_benchmark_data()'''
+    def __init__(self, outputs_list, infer_time=0.0, num_subgraphs=1, ddr_transfer=0):
+        self.outputs_list = outputs_list
+        self.infer_time = infer_time
+        self.num_subgraphs = num_subgraphs
+        self.ddr_transfer = ddr_transfer
+        self.frame_index = 0
+        self.benchmark_data = None
+
+    def run(self, batch_size=1):
+        start_time = time.time()
+        if self.infer_time > 0:
+            time.sleep(self.infer_time * batch_size)
+        #
+        frame_outputs = []
+        for _ in range(batch_size):
+            frame_outputs.append(self.outputs_list[self.frame_index % len(self.outputs_list)])
+            self.frame_index += 1
+        #
+        # a runtime gives new output buffers for every call - so copies are returned
+        if batch_size == 1:
+            outputs = [o.copy() for o in frame_outputs[0]]
+        else:
+            outputs = [np.concatenate(tensors, axis=0) for tensors in zip(*frame_outputs)]
+        #
+        end_time = time.time()
+        self._update_benchmark_data(start_time, end_time, batch_size)
+        return outputs
+
+    def get_TI_benchmark_data(self):
+        return dict(self.benchmark_data)
+
+    def _update_benchmark_data(self, start_time, end_time, batch_size):
+        # timestamps are in cycles - as in the runtime, they are converted to time using DSP_FREQ
+        start_cycles = int(start_time * constants.DSP_FREQ)
+        end_cycles = int(end_time * constants.DSP_FREQ)
+        benchmark_data = {'ts:run_start': start_cycles, 'ts:run_end': end_cycles}
+        # the run is split equally among the subgraphs - with copy in and copy out of zero duration
+        subgraph_cycles = (end_cycles - start_cycles) // self.num_subgraphs
+        for subgraph_id in range(self.num_subgraphs):
+            proc_start = start_cycles + subgraph_id * subgraph_cycles
+            proc_end = proc_start + subgraph_cycles
+            benchmark_data.update({
+                f'ts:subgraph_{subgraph_id}_copy_in_start': proc_start, f'ts:subgraph_{subgraph_id}_copy_in_end': proc_start,
+                f'ts:subgraph_{subgraph_id}_proc_start': proc_start, f'ts:subgraph_{subgraph_id}_proc_end': proc_end,
+                f'ts:subgraph_{subgraph_id}_copy_out_start': proc_end, f'ts:subgraph_{subgraph_id}_copy_out_end': proc_end,
+            })
+        #
+        ddr_transfer = int(self.ddr_transfer * batch_size)
+        benchmark_data.update({
+            'ddr:read_start': 0, 'ddr:read_end': ddr_transfer // 2,
+            'ddr:write_start': 0, 'ddr:write_end': ddr_transfer - ddr_transfer // 2,
+        })
+        self.benchmark_data = benchmark_data
+
+
+class MockRTSession(BaseRTSession):
+    '''a session that doesn't need a runtime. it returns synthetic outputs of the shapes of the model outputs
+    (or outputs replayed from files) after a simulated latency, so that the benchmark harness (dataset loading,
+    pre/post processing, evaluation, reporting) can be run end to end on any pc.
+    it can be used for all the configs by setting session_type_dict to {'onnx':'mock', 'tflite':'mock', 'mxnet':'mock'}
+
+    the options are given in runtime_options (which can also be given in the settings file):
+    mock:infer_time: simulated latency of inference in seconds, per frame
+    mock:import_time: simulated latency of import in seconds, per calibration frame
+    mock:output_shape: shapes of the outputs - a dict of output names and shapes or a list of shapes.
+        if it is not given, the output_shape of the session or the shapes in the model file are used
+        (onnx models need the onnx package and tflite models need tflite_runtime).
+    mock:output_dtype: dtype (or list of dtypes) of the outputs, if the output shapes are given
+    mock:dynamic_dim: size used for the dimensions of the model outputs that are not fixed
+    mock:outputs_path: folder with one .npz file per frame (written with np.savez(file, *outputs)) -
+        these are replayed (in the sorted order of the file names) instead of synthetic outputs.
+    mock:num_outputs: number of different synthetic outputs that are cycled through
+    mock:value_range: range of the values in the synthetic outputs
+    mock:num_subgraphs: number of subgraphs reported in the benchmark data
+    mock:ddr_transfer: ddr transfer in bytes per frame reported in the benchmark data
+    '''
+    def __init__(self, session_name=constants.SESSION_NAME_MOCK, **kwargs):
+        # tidl tools are not used - so TIDL_TOOLS_PATH need not be set
+        kwargs['tidl_tools_path'] = kwargs.get('tidl_tools_path', None) or os.environ.get('TIDL_TOOLS_PATH', '')
+        super().__init__(session_name=session_name, **kwargs)
+        self.interpreter = None
+
+    def import_model(self, calib_data, info_dict=None):
+        super().import_model(calib_data)
+        # the output shapes are found in import and written into the artifacts - as a runtime would do
+        output_details = self._get_output_details()
+        import_time = self.kwargs['runtime_options']['mock:import_time']
+        for c_data in calib_data:
+            if import_time > 0:
+                time.sleep(import_time)
+            #
+        #
+        with open(self._get_artifacts_file(), 'w') as fp:
+            yaml.safe_dump(output_details, fp, sort_keys=False)
+        #
+        return info_dict
+
+    def start_infer(self):
+        super().start_infer()
+        self.interpreter = self._create_interpreter()
+        os.chdir(self.cwd)
+        return True
+
+    def infer_frame(self, input, info_dict=None):
+        super().infer_frame(input, info_dict)
+        start_time = time.time()
+        outputs = self.interpreter.run()
+        info_dict['session_invoke_time'] = (time.time() - start_time)
+        return outputs, info_dict
+
+    def _supports_batched_inference(self):
+        return True
+
+    def _run_batch(self, input):
+        batch_size = np.shape(input[0])[0]
+        outputs = self.interpreter.run(batch_size)
+        return outputs
+
+    def set_runtime_option(self, option, value):
+        self.kwargs["runtime_options"][option] = value
+
+    def get_runtime_option(self, option, default=None):
+        return self.kwargs["runtime_options"].get(option, default)
+
+    def _create_interpreter(self):
+        runtime_options = self.kwargs["runtime_options"]
+        outputs_path = runtime_options['mock:outputs_path']
+        if outputs_path is not None:
+            outputs_list = self._read_outputs(outputs_path)
+        else:
+            with open(self._get_artifacts_file()) as fp:
+                output_details = yaml.safe_load(fp)
+            #
+            rng = np.random.default_rng(runtime_options['mock:seed'])
+            value_range = runtime_options['mock:value_range']
+            outputs_list = []
+            for _ in range(max(runtime_options['mock:num_outputs'], 1)):
+                outputs = [self._synthetic_output(rng, o['shape'], o['dtype'], value_range) for o in output_details]
+                outputs_list.append(outputs)
+            #
+        #
+        interpreter = MockInterpreter(outputs_list, infer_time=runtime_options['mock:infer_time'],
+                                      num_subgraphs=max(runtime_options['mock:num_subgraphs'], 1),
+                                      ddr_transfer=runtime_options['mock:ddr_transfer'])
+        return interpreter
+
+    def _synthetic_output(self, rng, shape, dtype, value_range):
+        dtype = np.dtype(dtype)
+        if np.issubdtype(dtype, np.integer) or np.issubdtype(dtype, np.bool_):
+            output = rng.integers(int(value_range[0]), int(value_range[1]), size=shape, endpoint=True)
+        else:
+            output = rng.uniform(value_range[0], value_range[1], size=shape)
+        #
+        return output.astype(dtype)
+
+    def _read_outputs(self, outputs_path):
+        outputs_files = sorted(glob.glob(os.path.join(outputs_path, '*.npz')))
+        assert len(outputs_files) > 0, f'no .npz files found in mock:outputs_path {outputs_path}'
+        outputs_list = []
+        for outputs_file in outputs_files:
+            with np.load(outputs_file) as outputs_data:
+                outputs_list.append([outputs_data[k] for k in outputs_data.files])
+            #
+        #
+        return outputs_list
+
+    def _get_output_details(self):
+        runtime_options = self.kwargs["runtime_options"]
+        output_shape = runtime_options['mock:output_shape'] or self.kwargs['output_shape']
+        if runtime_options['mock:outputs_path'] is not None:
+            outputs = self._read_outputs(runtime_options['mock:outputs_path'])[0]
+            output_details = [dict(name=f'output_{o_idx}', shape=list(o.shape), dtype=str(o.dtype)) \
+                              for o_idx, o in enumerate(outputs)]
+        elif output_shape is not None:
+            output_names = list(output_shape.keys()) if isinstance(output_shape, dict) else \
+                [f'output_{o_idx}' for o_idx in range(len(output_shape))]
+            output_shapes = list(output_shape.values()) if isinstance(output_shape, dict) else output_shape
+            output_dtypes = runtime_options['mock:output_dtype']
+            output_dtypes = output_dtypes if isinstance(output_dtypes, (list,tuple)) else [output_dtypes]*len(output_shapes)
+            output_details = [dict(name=name, shape=list(shape), dtype=str(np.dtype(dtype))) \
+                              for name, shape, dtype in zip(output_names, output_shapes, output_dtypes)]
+        elif self.kwargs['model_type'] == constants.MODEL_TYPE_ONNX or \
+                (isinstance(self.kwargs['model_file'], str) and self.kwargs['model_file'].endswith('.onnx')):
+            output_details = self._get_output_details_onnx()
+        elif self.kwargs['model_type'] == constants.MODEL_TYPE_TFLITE or \
+                (isinstance(self.kwargs['model_file'], str) and self.kwargs['model_file'].endswith('.tflite')):
+            output_details = self._get_output_details_tflite()
+        else:
+            assert False, f"mock:output_shape must be given in runtime_options for model: {self.kwargs['model_file']}"
+        #
+        # the dimensions that are not fixed in the model
+        dynamic_dim = runtime_options['mock:dynamic_dim']
+        for o in output_details:
+            o['shape'] = [int(d) if (isinstance(d, (int, np.integer)) and d > 0) else dynamic_dim for d in o['shape']]
+        #
+        return output_details
+
+    def _get_output_details_onnx(self):
+        import onnx
+        model = onnx.load(self.kwargs['model_file'])
+        output_details = []
+        for output in model.graph.output:
+            tensor_type = output.type.tensor_type
+            shape = [(d.dim_value if d.HasField('dim_value') else None) for d in tensor_type.shape.dim]
+            if hasattr(onnx.helper, 'tensor_dtype_to_np_dtype'):
+                dtype = onnx.helper.tensor_dtype_to_np_dtype(tensor_type.elem_type)
+            else:
+                dtype = onnx.mapping.TENSOR_TYPE_TO_NP_TYPE[tensor_type.elem_type]
+            #
+            output_details.append(dict(name=output.name, shape=shape, dtype=str(np.dtype(dtype))))
+        #
+        return output_details
+
+    def _get_output_details_tflite(self):
+        import tflite_runtime.interpreter as tflitert_interpreter
+        interpreter = tflitert_interpreter.Interpreter(model_path=self.kwargs['model_file'])
+        output_details = [dict(name=o['name'], shape=[int(d) for d in o['shape']], dtype=str(np.dtype(o['dtype']))) \
+                          for o in interpreter.get_output_details()]
+        return output_details
+
+    def _get_artifacts_file(self):
+        return os.path.join(self.kwargs['artifacts_folder'], 'mock_output_details.yaml')
+
+    def _set_default_options(self):
+        runtime_options = self.kwargs.get("runtime_options", {})
+        default_options = {
+            "tidl_tools_path": self.kwargs["tidl_tools_path"],
+            "artifacts_folder": self.kwargs["artifacts_folder"],
+            "tensor_bits": self.kwargs.get("tensor_bits", 8),
+            "import": self.kwargs.get("import", 'no'),
+            # options of the mock session
+            "mock:infer_time": 0.0,
+            "mock:import_time": 0.0,
+            "mock:output_shape": None,
+            "mock:output_dtype": 'float32',
+            "mock:dynamic_dim": 1,
+            "mock:outputs_path": None,
+            "mock:num_outputs": 4,
+            "mock:value_range": [0.0, 1.0],
+            "mock:seed": 0,
+            "mock:num_subgraphs": 1,
+            "mock:ddr_transfer": 0,
+        }
+        default_options.update(runtime_options)
+        self.kwargs["runtime_options"] = default_options
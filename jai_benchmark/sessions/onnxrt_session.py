@@ -28,6 +28,7 @@
 
 import os
 import time
+import tempfile
 import numpy as np
 import warnings
 import onnxruntime
@@ -40,6 +41,8 @@ class ONNXRTSession(BaseRTSession):
     def __init__(self, session_name=constants.SESSION_NAME_ONNXRT, **kwargs):
         super().__init__(session_name=session_name, **kwargs)
         self.interpreter = None
+        # created on first use, for batched inference
+        self.interpreter_batched = None
 
     def start(self):
         super().start()
@@ -99,13 +102,54 @@ class ONNXRTSession(BaseRTSession):
         info_dict['session_invoke_time'] = (time.time() - start_time)
         return outputs, info_dict
 
+    def _supports_batched_inference(self):
+        # the TIDL artifacts are compiled for a batch of 1 - only the models that are not offloaded can be batched.
+        # model needs additional inputs given in extra_inputs - these are not batched
+        return (not self.kwargs['tidl_offload']) and self.kwargs['extra_inputs'] is None
+
+    def _get_batch_interpreter(self):
+        return self.interpreter_batched
+
+    def _run_batch(self, input):
+        if self.interpreter_batched is None:
+            batched_model_file = self._get_batched_model_file()
+            self.interpreter_batched = self._create_interpreter(is_import=False, model_file=batched_model_file)
+            os.chdir(self.cwd)
+        #
+        input_keys = list(self.kwargs['input_shape'].keys())
+        input_dict = {d_name:d for d_name, d in zip(input_keys,input)}
+        output_keys = list(self.kwargs['output_shape'].keys()) \
+            if self.kwargs['output_shape'] is not None else None
+        outputs = self.interpreter_batched.run(output_keys, input_dict)
+        return outputs
+
+    def _get_batched_model_file(self):
+        # a copy of the model with the first dimension of the inputs and outputs made symbolic
+        # it is written to a temporary folder, so that it doesn't get packaged along with the model
+        import onnx
+        temp_dir = tempfile.TemporaryDirectory()
+        self.tempfiles.append(temp_dir)
+        model_file = self.kwargs['model_file']
+        batched_model_file = os.path.join(temp_dir.name, os.path.basename(model_file))
+        def _batched_dims(tensor):
+            dims = tensor.type.tensor_type.shape.dim
+            return ['batch'] + [(d.dim_param if d.HasField('dim_param') else d.dim_value) for d in dims[1:]]
+        #
+        input_keys = list(self.kwargs['input_shape'].keys())
+        model = onnx.load(model_file)
+        input_dims = {t.name:_batched_dims(t) for t in model.graph.input if t.name in input_keys}
+        output_dims = {t.name:_batched_dims(t) for t in model.graph.output}
+        model = utils.onnx_update_model_dims(model, input_dims, output_dims)
+        onnx.save(model, batched_model_file)
+        return batched_model_file
+
     def set_runtime_option(self, option, value):
         self.kwargs["runtime_options"][option] = value
 
     def get_runtime_option(self, option, default=None):
         return self.kwargs["runtime_options"].get(option, default)
 
-    def _create_interpreter(self, is_import):
+    def _create_interpreter(self, is_import, model_file=None):
         # pass options to pybind
         if is_import:
             self.kwargs["runtime_options"]["import"] = "yes"
@@ -113,16 +157,17 @@ class ONNXRTSession(BaseRTSession):
             self.kwargs["runtime_options"]["import"] = "no"
         #
         runtime_options = self.kwargs["runtime_options"]
+        model_file = model_file or self.kwargs['model_file']
         sess_options = onnxruntime.SessionOptions()
 
         if self.kwargs['tidl_offload']:
             ep_list = ['TIDLCompilationProvider', 'CPUExecutionProvider'] if is_import else \
                       ['TIDLExecutionProvider', 'CPUExecutionProvider']
-            interpreter = onnxruntime.InferenceSession(self.kwargs['model_file'], providers=ep_list,
+            interpreter = onnxruntime.InferenceSession(model_file, providers=ep_list,
                             provider_options=[runtime_options, {}], sess_options=sess_options)
         else:
             ep_list = ['CPUExecutionProvider']
-            interpreter = onnxruntime.InferenceSession(self.kwargs['model_file'], providers=ep_list,
+            interpreter = onnxruntime.InferenceSession(model_file, providers=ep_list,
                             provider_options=[{}], sess_options=sess_options)
         #
         return interpreter
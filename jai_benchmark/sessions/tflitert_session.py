@@ -40,6 +40,8 @@ class TFLiteRTSession(BaseRTSession):
     def __init__(self, session_name=constants.SESSION_NAME_TFLITERT, **kwargs):
         super().__init__(session_name=session_name, **kwargs)
         self.interpreter = None
+        # created on first use, for batched inference
+        self.interpreter_batched = None
 
     def import_model(self, calib_data, info_dict=None):
         super().import_model(calib_data)
@@ -82,6 +84,41 @@ class TFLiteRTSession(BaseRTSession):
         outputs = [self._get_tensor(output_detail) for output_detail in output_details]
         return outputs, info_dict
 
+    def _supports_batched_inference(self):
+        # the TIDL artifacts are compiled for a batch of 1 - only the models that are not offloaded can be batched
+        return not self.kwargs['tidl_offload']
+
+    def _get_batch_interpreter(self):
+        return self.interpreter_batched
+
+    def _run_batch(self, input):
+        if self.interpreter_batched is None:
+            self.interpreter_batched = self._create_interpreter(is_import=False)
+            os.chdir(self.cwd)
+        #
+        interpreter = self.interpreter_batched
+        input_details = interpreter.get_input_details()
+        # resize the inputs to the batch size - tensors need to be allocated again only if the shape changed
+        shape_changed = False
+        for c_data_entry_idx, c_data_entry in enumerate(input):
+            input_detail = input_details[c_data_entry_idx]
+            if tuple(input_detail['shape']) != c_data_entry.shape:
+                interpreter.resize_tensor_input(input_detail['index'], c_data_entry.shape)
+                shape_changed = True
+            #
+        #
+        if shape_changed:
+            interpreter.allocate_tensors()
+            input_details = interpreter.get_input_details()
+        #
+        for c_data_entry_idx, c_data_entry in enumerate(input):
+            self._set_tensor(input_details[c_data_entry_idx], c_data_entry, interpreter=interpreter)
+        #
+        interpreter.invoke()
+        output_details = interpreter.get_output_details()
+        outputs = [self._get_tensor(output_detail, interpreter=interpreter) for output_detail in output_details]
+        return outputs
+
     def set_runtime_option(self, option, value):
         self.kwargs["runtime_options"][option] = value
 
@@ -129,7 +166,8 @@ class TFLiteRTSession(BaseRTSession):
         #
         return input_shape
 
-    def _set_tensor(self, model_input, tensor):
+    def _set_tensor(self, model_input, tensor, interpreter=None):
+        interpreter = interpreter if interpreter is not None else self.interpreter
         if model_input['dtype'] == np.int8:
             # scale, zero_point = model_input['quantization']
             # tensor = np.clip(np.round(tensor/scale + zero_point), -128, 127)
@@ -139,10 +177,11 @@ class TFLiteRTSession(BaseRTSession):
             # tensor = np.clip(np.round(tensor/scale + zero_point), 0, 255)
             tensor = np.array(tensor, dtype=np.uint8)
         #
-        self.interpreter.set_tensor(model_input['index'], tensor)
+        interpreter.set_tensor(model_input['index'], tensor)
 
-    def _get_tensor(self, model_output):
-        tensor = self.interpreter.get_tensor(model_output['index'])
+    def _get_tensor(self, model_output, interpreter=None):
+        interpreter = interpreter if interpreter is not None else self.interpreter
+        tensor = interpreter.get_tensor(model_output['index'])
         if model_output['dtype'] == np.int8 or model_output['dtype']  == np.uint8:
             scale, zero_point = model_output['quantization']
             tensor = np.array(tensor, dtype=np.float32)
@@ -28,6 +28,11 @@
 
 import os
 import time
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
 
 # mxnet is required only for import (and that too for mxnet models)
 # but doing the import inside the code, conditionally is causing an error, so do it here.
@@ -42,6 +47,46 @@ from .basert_session import BaseRTSession
 from ..import utils
 
 
+# the artifact files that are generated for each target device
+_deploy_files = ('deploy_lib.so', 'deploy_graph.json', 'deploy_params.params')
+
+
+def _build_target(tvm_model, params, compiler, target_device, artifacts_folder):
+    from tvm import relay
+    from tvm.relay.backend.contrib import tidl
+    if target_device == 'j7':
+        build_target = 'llvm -device=arm_cpu -mtriple=aarch64-linux-gnu'
+        cross_cc_args = {'cc' : os.path.join(os.environ['ARM64_GCC_PATH'], 'bin', 'aarch64-none-linux-gnu-gcc')}
+    elif target_device == 'pc':
+        build_target = 'llvm'
+        cross_cc_args = {}
+    else:
+        assert False, f'unsupported target device {target_device}'
+    #
+
+    # build the relay module into deployables
+    with tidl.build_config(tidl_compiler=compiler):
+        graph, lib, params = relay.build_module.build(tvm_model, target=build_target, params=params)
+
+    # remove nodes / params not needed for inference
+    tidl.remove_tidl_params(params)
+
+    # save the deployables
+    deploy_lib, deploy_graph, deploy_params = _deploy_files
+    path_lib = os.path.join(artifacts_folder, f'{deploy_lib}.{target_device}')
+    path_graph = os.path.join(artifacts_folder, f'{deploy_graph}.{target_device}')
+    path_params = os.path.join(artifacts_folder, f'{deploy_params}.{target_device}')
+
+    lib.export_library(path_lib, **cross_cc_args)
+    with open(path_graph, "w") as fo:
+        fo.write(graph)
+    #
+    with open(path_params, "wb") as fo:
+        fo.write(relay.save_param_dict(params))
+    #
+    return params
+
+
 class TVMDLRSession(BaseRTSession):
     def __init__(self, session_name=constants.SESSION_NAME_TVMDLR, **kwargs):
         super().__init__(session_name=session_name, **kwargs)
@@ -49,6 +94,8 @@ class TVMDLRSession(BaseRTSession):
         self.supported_devices = ('pc', 'j7')
         target_device = self.kwargs['target_device']
         assert target_device in self.supported_devices, f'invalid target_device {target_device}'
+        # folder to cache the compiled artifacts - None disables the cache
+        self.kwargs['build_cache_path'] = self.kwargs.get('build_cache_path', None)
 
     def import_model(self, calib_data, info_dict=None):
         # onnx and tvm are required only for model import
@@ -58,6 +105,22 @@ class TVMDLRSession(BaseRTSession):
         # prepare for actual model import
         super().import_model(calib_data, info_dict)
 
+        artifacts_folder = self.kwargs['artifacts_folder']
+        os.makedirs(artifacts_folder, exist_ok=True)
+
+        # TIDLCompiler.enable() takes the calibration data as a list - so unlike the other sessions,
+        # all the frames are held in memory here. they are read once and hashed for the cache key as they arrive.
+        calib_data, calib_digest = self._read_calib_data(calib_data)
+
+        # compiled artifacts are looked up in the cache - if all of them are found, the import can be skipped
+        build_cache_dir = self._get_build_cache_dir(calib_digest)
+        cached_devices = self._load_build_cache(build_cache_dir, artifacts_folder)
+        if len(cached_devices) == len(self.supported_devices):
+            print(utils.log_color('INFO', 'using compiled artifacts from the cache', build_cache_dir))
+            self._link_deploy_files(artifacts_folder)
+            return info_dict
+        #
+
         model_file = self.kwargs['model_file']
         model_file0 = model_file[0] if isinstance(model_file, (list,tuple)) else model_file
         model_type = self.kwargs['model_type'] or os.path.splitext(model_file0)[1][1:]
@@ -94,7 +157,6 @@ class TVMDLRSession(BaseRTSession):
 
         calib_list = []
         for c_data in calib_data:
-            c_data = utils.as_tuple(c_data)
             c_dict = {d_name:d for d_name, d in zip(input_keys,c_data)}
             calib_list.append(c_dict)
         #
@@ -102,57 +164,24 @@ class TVMDLRSession(BaseRTSession):
         # Create the TIDL compiler with appropriate parameters
         compiler = tidl.TIDLCompiler(**self.kwargs['runtime_options'])
 
-        artifacts_folder = self.kwargs['artifacts_folder']
-        os.makedirs(artifacts_folder, exist_ok=True)
-
         # partition the graph into TIDL operations and TVM operations
         tvm_model, status = compiler.enable(tvm_model, params, calib_list)
 
-        # the artifact files that are generated
-        deploy_lib = 'deploy_lib.so'
-        deploy_graph = 'deploy_graph.json'
-        deploy_params = 'deploy_params.params'
-
-        for target_device in self.supported_devices:
-            if target_device == 'j7':
-                build_target = 'llvm -device=arm_cpu -mtriple=aarch64-linux-gnu'
-                cross_cc_args = {'cc' : os.path.join(os.environ['ARM64_GCC_PATH'], 'bin', 'aarch64-none-linux-gnu-gcc')}
-            elif target_device == 'pc':
-                build_target = 'llvm'
-                cross_cc_args = {}
-            else:
-                assert False, f'unsupported target device {target_device}'
-            #
-
-            # build the relay module into deployables
-            with tidl.build_config(tidl_compiler=compiler):
-                graph, lib, params = relay.build_module.build(tvm_model, target=build_target, params=params)
-
-            # remove nodes / params not needed for inference
-            tidl.remove_tidl_params(params)
-
-            # save the deployables
-            path_lib = os.path.join(artifacts_folder, f'{deploy_lib}.{target_device}')
-            path_graph = os.path.join(artifacts_folder, f'{deploy_graph}.{target_device}')
-            path_params = os.path.join(artifacts_folder, f'{deploy_params}.{target_device}')
-
-            lib.export_library(path_lib, **cross_cc_args)
-            with open(path_graph, "w") as fo:
-                fo.write(graph)
-            #
-            with open(path_params, "wb") as fo:
-                fo.write(relay.save_param_dict(params))
+        # build the partitioned module for the target devices that are not in the cache
+        # the target devices are built in order - each one from the params returned by the build of the previous one
+        build_devices = [t for t in self.supported_devices if t not in cached_devices]
+        for device_index, target_device in enumerate(self.supported_devices):
+            if target_device in build_devices:
+                params = _build_target(tvm_model, params, compiler, target_device, artifacts_folder)
+            elif any(t in build_devices for t in self.supported_devices[device_index+1:]):
+                # a cached target device - its saved params are needed for the build of the next one
+                params = self._load_deploy_params(artifacts_folder, target_device)
             #
         #
+        self._save_build_cache(build_cache_dir, artifacts_folder, build_devices)
 
         # create a symbolic link to the deploy_lib specified in target_device
-        os.chdir(artifacts_folder)
-        target_device = self.kwargs['target_device']
-        artifact_files = [deploy_lib, deploy_graph, deploy_params]
-        for artifact_file in artifact_files:
-            os.symlink(f'{artifact_file}.{target_device}', artifact_file)
-        #
-        os.chdir(self.cwd)
+        self._link_deploy_files(artifacts_folder)
         return info_dict
 
     def start_infer(self):
@@ -229,6 +258,111 @@ class TVMDLRSession(BaseRTSession):
         default_options.update(dict(advanced_options=advanced_options))
         self.kwargs["runtime_options"] = default_options
 
+    def _link_deploy_files(self, artifacts_folder):
+        # create a symbolic link to the deploy_lib specified in target_device
+        os.chdir(artifacts_folder)
+        target_device = self.kwargs['target_device']
+        for artifact_file in _deploy_files:
+            os.symlink(f'{artifact_file}.{target_device}', artifact_file)
+        #
+        os.chdir(self.cwd)
+
+    def _load_deploy_params(self, artifacts_folder, target_device):
+        # the params saved by the build of a target device
+        from tvm import relay
+        path_params = os.path.join(artifacts_folder, f'{_deploy_files[2]}.{target_device}')
+        with open(path_params, 'rb') as fp:
+            params = relay.load_param_dict(fp.read())
+        #
+        return params
+
+    def _read_calib_data(self, calib_data):
+        # collect the calibration frames as tuples - with the hash of the tensors if the build cache is used
+        calib_hash = hashlib.sha1() if self.kwargs['build_cache_path'] is not None else None
+        calib_list = []
+        for c_data in calib_data:
+            c_data = utils.as_tuple(c_data)
+            if calib_hash is not None:
+                for tensor in c_data:
+                    tensor = np.ascontiguousarray(tensor)
+                    calib_hash.update(f'{tensor.dtype}{tensor.shape}'.encode())
+                    calib_hash.update(tensor.tobytes())
+                #
+            #
+            calib_list.append(c_data)
+        #
+        calib_digest = calib_hash.hexdigest() if calib_hash is not None else None
+        return calib_list, calib_digest
+
+    def _get_build_cache_dir(self, calib_digest):
+        # the key is a hash of the model, the runtime_options (except the paths of this run) and the calibration data.
+        # within that, the deployables of each target device are stored in a folder of its own.
+        build_cache_path = self.kwargs['build_cache_path']
+        if build_cache_path is None:
+            return None
+        #
+        key_hash = hashlib.sha1()
+        for model_file in utils.as_list(self.kwargs['model_file']):
+            with open(model_file, 'rb') as fp:
+                for chunk in iter(lambda: fp.read(1<<20), b''):
+                    key_hash.update(chunk)
+                #
+            #
+        #
+        runtime_options = {k:v for k, v in self.kwargs['runtime_options'].items() if k != 'artifacts_folder'}
+        key_params = dict(runtime_options=runtime_options, input_shape=self.kwargs['input_shape'])
+        key_hash.update(json.dumps(utils.pretty_object(key_params), sort_keys=True, default=str).encode())
+        key_hash.update(calib_digest.encode())
+        key = key_hash.hexdigest()
+        return os.path.join(os.path.abspath(build_cache_path), key[:2], key)
+
+    def _load_build_cache(self, build_cache_dir, artifacts_folder):
+        # copy the deployables of the target devices that are available in the cache
+        # the rest of the artifacts (of the TIDL subgraphs) are common to all the target devices
+        if build_cache_dir is None:
+            return []
+        #
+        cached_devices = [t for t in self.supported_devices if os.path.isdir(os.path.join(build_cache_dir, t))]
+        common_dir = os.path.join(build_cache_dir, 'common')
+        if len(cached_devices) == len(self.supported_devices) and os.path.isdir(common_dir):
+            shutil.copytree(common_dir, artifacts_folder, dirs_exist_ok=True)
+        #
+        for target_device in cached_devices:
+            shutil.copytree(os.path.join(build_cache_dir, target_device), artifacts_folder, dirs_exist_ok=True)
+        #
+        return cached_devices
+
+    def _save_build_cache(self, build_cache_dir, artifacts_folder, build_devices):
+        if build_cache_dir is None:
+            return
+        #
+        deploy_file_names = [f'{f}.{t}' for f in _deploy_files for t in self.supported_devices] + list(_deploy_files)
+        cache_entries = {t:[f'{f}.{t}' for f in _deploy_files] for t in build_devices}
+        cache_entries['common'] = [f for f in os.listdir(artifacts_folder) if f not in deploy_file_names]
+        os.makedirs(build_cache_dir, exist_ok=True)
+        for entry_name, entry_files in cache_entries.items():
+            entry_dir = os.path.join(build_cache_dir, entry_name)
+            if os.path.exists(entry_dir):
+                continue
+            #
+            # copy to a temporary folder and rename it, so that a partially written entry is never used
+            temp_dir = tempfile.mkdtemp(dir=build_cache_dir, prefix='.tmp')
+            try:
+                for entry_file in entry_files:
+                    src_path = os.path.join(artifacts_folder, entry_file)
+                    if os.path.isdir(src_path):
+                        shutil.copytree(src_path, os.path.join(temp_dir, entry_file))
+                    else:
+                        shutil.copy2(src_path, temp_dir)
+                    #
+                #
+                os.rename(temp_dir, entry_dir)
+            except OSError as e:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                print(utils.log_color('\nWARNING', 'could not write build cache', f'{entry_dir} - {e}'))
+            #
+        #
+
     def _get_input_shape_onnx(self, onnx_model):
         input_shape = {}
         num_inputs = self.kwargs['num_inputs']
@@ -31,15 +31,25 @@ import os
 import sys
 import shutil
 import tarfile
+import gzip
 import yaml
 import glob
 import re
+import concurrent.futures
 from jai_benchmark import utils
 
 
+# file extension and the extraction command for each of the supported compression types
+package_compression_types = {
+    'gz': ('.tar.gz', 'find . -name "*.tar.gz" -exec tar --one-top-level -zxvf "{}" \\;'),
+    'zst': ('.tar.zst', 'find . -name "*.tar.zst" -exec tar --one-top-level -I zstd -xvf "{}" \\;'),
+}
+
+
 def run_package(settings, work_dir, out_dir, include_results=False):
     # now write out the package
-    package_artifacts(settings, work_dir, out_dir, include_results=include_results)
+    package_artifacts(settings, work_dir, out_dir, include_results=include_results,
+                      num_workers=settings.package_workers, compression=settings.package_compression)
 
 
 def match_string(patterns, filename):
@@ -48,7 +58,116 @@ def match_string(patterns, filename):
     return got_match
 
 
-def package_artifact(pipeline_param, work_dir, out_dir, make_package_tar=True, make_package_dir=False, include_results=False):
+class ParallelGzipFile:
+    """
+    A write only file object that compresses the data in chunks, with the chunks compressed in parallel threads
+    (zlib releases the GIL). Each chunk is written as a separate gzip member - a file with multiple members is
+    standard gzip (RFC 1952) and can be read by gzip, tar and python's gzip / tarfile modules.
+    """
+    def __init__(self, fileobj, num_threads, chunk_size=(4<<20), compresslevel=9):
+        self.fileobj = fileobj
+        self.num_threads = num_threads
+        self.chunk_size = chunk_size
+        self.compresslevel = compresslevel
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_threads)
+        self.buffer = bytearray()
+        self.pending = []
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self._submit(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+        #
+        return len(data)
+
+    def close(self):
+        if self.executor is None:
+            return
+        #
+        if len(self.buffer) > 0 or len(self.pending) == 0:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        #
+        self._write_pending(0)
+        self.executor.shutdown(wait=True)
+        self.executor = None
+
+    def _submit(self, chunk):
+        self.pending.append(self.executor.submit(gzip.compress, chunk, compresslevel=self.compresslevel, mtime=0))
+        # write out the compressed chunks in order - limit the memory used by the chunks waiting to be written
+        self._write_pending(2*self.num_threads)
+
+    def _write_pending(self, max_pending):
+        while len(self.pending) > max_pending:
+            self.fileobj.write(self.pending.pop(0).result())
+        #
+
+
+def write_package_tar(tarfile_name, input_files, arcnames, compression='gz', compression_threads=1):
+    if compression == 'zst':
+        # optional dependency - needed only for zst packages
+        import zstandard
+    #
+    # write to a temporary name first, so that an interrupted write does not leave an incomplete package
+    temp_name = tarfile_name + '.tmp'
+    if compression == 'gz' and compression_threads <= 1:
+        with tarfile.open(temp_name, 'w:gz') as tfp:
+            for inpf, arcname in zip(input_files, arcnames):
+                tfp.add(inpf, arcname=arcname)
+            #
+        #
+        os.replace(temp_name, tarfile_name)
+        return
+    #
+    with open(temp_name, 'wb') as fp:
+        if compression == 'gz':
+            compressed_fp = ParallelGzipFile(fp, compression_threads)
+        elif compression == 'zst':
+            compressed_fp = zstandard.ZstdCompressor(level=10, threads=compression_threads).stream_writer(fp, closefd=False)
+        else:
+            assert False, f'unsupported compression {compression}. must be one of {list(package_compression_types.keys())}'
+        #
+        with tarfile.open(fileobj=compressed_fp, mode='w|') as tfp:
+            for inpf, arcname in zip(input_files, arcnames):
+                tfp.add(inpf, arcname=arcname)
+            #
+        #
+        compressed_fp.close()
+    #
+    os.replace(temp_name, tarfile_name)
+
+
+def get_package_key(input_files, arcnames, compression='gz', include_results=False):
+    '''the files in a package and the packaging options - a package with another key is written again'''
+    files = {arcname: os.path.abspath(inpf) for inpf, arcname in zip(input_files, arcnames)}
+    return {'compression': compression, 'include_results': include_results, 'files': files}
+
+
+def get_package_key_file(tarfile_name):
+    # hidden folder in out_dir, so that the keys are not taken as packages
+    out_dir, package_name = os.path.split(tarfile_name)
+    return os.path.join(out_dir, '.package_keys', package_name + '.yaml')
+
+
+def read_package_key(package_key_file):
+    if not os.path.exists(package_key_file):
+        return None
+    #
+    try:
+        with open(package_key_file) as fp:
+            return yaml.safe_load(fp)
+        #
+    except (OSError, yaml.YAMLError):
+        return None
+    #
+
+
+def package_artifact(pipeline_param, work_dir, out_dir, make_package_tar=True, make_package_dir=False, include_results=False,
+                     compression='gz', compression_threads=1, packaged_time=None):
+    '''packaged_time: modification time (in ns) of the previous package - if the package exists, none of the files
+    to be packaged have been modified after this time and the packaged files and options are the ones recorded
+    for the package (see get_package_key), it is not written again.'''
     input_files = []
     packaged_files = []
 
@@ -104,8 +223,18 @@ def package_artifact(pipeline_param, work_dir, out_dir, make_package_tar=True, m
     if 'result' in pipeline_param:
         del pipeline_param['result']
     #
-    with open(param_file, 'w') as pfp:
-        yaml.safe_dump(pipeline_param, pfp)
+    # write it only if it has changed - so that its modification time shows if the package is up to date
+    param_str = yaml.safe_dump(pipeline_param)
+    param_str_prev = None
+    if os.path.exists(param_file):
+        with open(param_file) as pfp:
+            param_str_prev = pfp.read()
+        #
+    #
+    if param_str != param_str_prev:
+        with open(param_file, 'w') as pfp:
+            pfp.write(param_str)
+        #
     #
 
     # copy model files
@@ -180,13 +309,24 @@ def package_artifact(pipeline_param, work_dir, out_dir, make_package_tar=True, m
 
     tarfile_size = 0
     if make_package_tar:
-        tarfile_name = package_run_dir + '.tar.gz'
-        tfp = tarfile.open(tarfile_name, 'w:gz')
-        for inpf, pf in zip(input_files, packaged_files):
-            outpf = pf.replace(package_run_dir, '')
-            tfp.add(inpf, arcname=outpf)
+        tarfile_name = package_run_dir + package_compression_types[compression][0]
+        arcnames = [pf.replace(package_run_dir, '') for pf in packaged_files]
+        package_key = get_package_key(input_files, arcnames, compression=compression, include_results=include_results)
+        package_key_file = get_package_key_file(tarfile_name)
+        is_unchanged = packaged_time is not None and os.path.exists(tarfile_name) and \
+            all(os.stat(inpf).st_mtime_ns <= packaged_time for inpf in input_files) and \
+            read_package_key(package_key_file) == package_key
+        if is_unchanged:
+            print(utils.log_color('INFO', 'package is up to date', tarfile_name))
+        else:
+            write_package_tar(tarfile_name, input_files, arcnames, compression=compression,
+                              compression_threads=compression_threads)
+            # the key is written after the package is complete
+            os.makedirs(os.path.dirname(package_key_file), exist_ok=True)
+            with open(package_key_file, 'w') as fp:
+                yaml.safe_dump(package_key, fp)
+            #
         #
-        tfp.close()
         tarfile_size = os.path.getsize(tarfile_name)
     else:
         package_run_dir = None
@@ -194,24 +334,43 @@ def package_artifact(pipeline_param, work_dir, out_dir, make_package_tar=True, m
     return package_run_dir, tarfile_size
 
 
-def package_artifacts(settings, work_dir, out_dir, include_results=False):
+def package_artifacts(settings, work_dir, out_dir, include_results=False, num_workers=None, compression='gz'):
+    '''num_workers: number of artifacts that are packaged in parallel. None uses the number of cpus.
+    compression: 'gz' or 'zst'. the cpus that are not used by the parallel packaging are used for
+    multi-threaded compression of each package.'''
     print(f'packaging artifacts to {out_dir} please wait...')
     run_dirs = glob.glob(f'{work_dir}/*')
     run_dirs = sorted(run_dirs)
+    run_dirs = [run_dir for run_dir in run_dirs if os.path.isdir(run_dir)]
 
-    packaged_artifacts_dict = {}
-    for run_dir in run_dirs:
-        if not os.path.isdir(run_dir):
-            continue
+    assert compression in package_compression_types, \
+        f'unsupported compression {compression}. must be one of {list(package_compression_types.keys())}'
+    num_cpus = os.cpu_count() or 1
+    num_workers = min(num_workers or num_cpus, max(len(run_dirs), 1))
+    compression_threads = max(num_cpus // num_workers, 1)
+
+    # packages that are older than the previous artifacts.yaml need not be written again if the files have not changed
+    artifacts_yaml = os.path.join(out_dir,'artifacts.yaml')
+    packaged_time = os.stat(artifacts_yaml).st_mtime_ns if os.path.exists(artifacts_yaml) else None
+
+    def _package_run_dir(run_dir):
+        param_yaml = os.path.join(run_dir, 'param.yaml')
+        result_yaml = os.path.join(run_dir, 'result.yaml')
+        read_yaml = result_yaml if os.path.exists(result_yaml) else param_yaml
+        with open(read_yaml) as fp:
+            pipeline_param = yaml.safe_load(fp)
         #
+        package_outputs = package_artifact(pipeline_param, work_dir, out_dir, include_results=include_results,
+                            compression=compression, compression_threads=compression_threads, packaged_time=packaged_time)
+        return pipeline_param, package_outputs
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_workers)
+    package_futures = [executor.submit(_package_run_dir, run_dir) for run_dir in run_dirs]
+
+    packaged_artifacts_dict = {}
+    for run_dir, package_future in zip(run_dirs, package_futures):
         try:
-            param_yaml = os.path.join(run_dir, 'param.yaml')
-            result_yaml = os.path.join(run_dir, 'result.yaml')
-            read_yaml = result_yaml if os.path.exists(result_yaml) else param_yaml
-            with open(read_yaml) as fp:
-                pipeline_param = yaml.safe_load(fp)
-            #
-            package_run_dir, tarfile_size = package_artifact(pipeline_param, work_dir, out_dir, include_results=include_results)
+            pipeline_param, (package_run_dir, tarfile_size) = package_future.result()
             if package_run_dir is not None:
                 task_type = pipeline_param['task_type']
                 package_run_dir = os.path.basename(package_run_dir)
@@ -246,6 +405,7 @@ def package_artifacts(settings, work_dir, out_dir, include_results=False):
         #
         sys.stdout.flush()
     #
+    executor.shutdown(wait=True)
     if include_results:
         results_yaml = os.path.join(work_dir, 'results.yaml')
         if os.path.exists(results_yaml):
@@ -256,7 +416,7 @@ def package_artifacts(settings, work_dir, out_dir, include_results=False):
     # sort artifacts
     packaged_artifacts_dict = dict(sorted(packaged_artifacts_dict.items(), key=lambda kv:kv[1]['task_type']))
     # write yaml
-    with open(os.path.join(out_dir,'artifacts.yaml'), 'w') as fp:
+    with open(artifacts_yaml, 'w') as fp:
         yaml.safe_dump(packaged_artifacts_dict, fp)
     #
     # write list
@@ -269,8 +429,8 @@ def package_artifacts(settings, work_dir, out_dir, include_results=False):
         fp.write('\n'.join(packaged_artifacts_list))
     #
     with open(os.path.join(out_dir, 'extract.sh'), 'w') as fp:
-        # Note: append '-exec rm -f "{}" \;' to delete the original .tar.gz files
-        fp.write('find . -name "*.tar.gz" -exec tar --one-top-level -zxvf "{}" \;')
+        # Note: append '-exec rm -f "{}" \;' to delete the original .tar.gz / .tar.zst files
+        fp.write(package_compression_types[compression][1])
     #
 
 
@@ -35,25 +35,18 @@ from .. import utils
 
 metric_keys = ['accuracy_top1%', 'accuracy_mean_iou%', 'accuracy_ap[.5:.95]%', 'accuracy_delta_1%', 'accuracy_ap_3d_moderate%']
 performance_keys = ['num_subgraphs', 'infer_time_core_ms', 'ddr_transfer_mb', 'perfsim_time_ms', 'perfsim_ddr_transfer_mb', 'perfsim_gmacs']
+# per frame latency of the stages of inference (result['latency_ms']) - the columns are latency_{stage}_{stat}_ms
+latency_stages = ['read', 'preprocess', 'wait', 'infer', 'session_overhead', 'postprocess', 'evaluate', 'frame']
+latency_stats = ['p50', 'p99']
+latency_keys = [f'latency_{stage}_{stat}_ms' for stage in latency_stages for stat in latency_stats]
 
 
 def run_rewrite_results(work_dir, results_yaml):
-    run_dirs = glob.glob(f'{work_dir}/*')
-    run_dirs = [f for f in run_dirs if os.path.isdir(f)]
-    results = {}
-    for run_dir in run_dirs:
-        try:
-            result_yaml = os.path.join(run_dir, 'result.yaml')
-            with open(result_yaml) as fp:
-                result = yaml.safe_load(fp)
-                model_id = result['session']['model_id']
-                session_name = result['session']['session_name']
-                artifact_id = f'{model_id}_{session_name}'
-                results[artifact_id] = result
-            #
-        except:
-            pass
-        #
+    # the results are read from the results store of the work_dir,
+    # only the result.yaml files that are new or modified since the last call are parsed.
+    with utils.ResultsStore(os.path.join(work_dir, 'results.db')) as results_store:
+        results_store.update(work_dir)
+        results = results_store.get_results()
     #
     results = utils.sorted_dict(results)
     with open(results_yaml, 'w') as rfp:
@@ -78,17 +71,18 @@ def run_report(benchmark_dir, rewrite_results=True):
         results_yaml = os.path.join(work_dir, 'results.yaml')
         # generate results.yaml, aggregating results from all the artifacts across all work_dirs.
         if rewrite_results:
-            run_rewrite_results(work_dir, results_yaml)
+            results = run_rewrite_results(work_dir, results_yaml)
+        else:
+            with open(results_yaml) as rfp:
+                results = yaml.safe_load(rfp)
+            #
         #
         settings_name = os.path.split(work_dir)[-1]
-        with open(results_yaml) as rfp:
-            results = yaml.safe_load(rfp)
-            results_collection[settings_name] = results
-            if len(results) > results_max_len:
-                results_max_len = len(results)
-                results_max_id = work_id
-                results_max_name = settings_name
-            #
+        results_collection[settings_name] = results
+        if len(results) > results_max_len:
+            results_max_len = len(results)
+            results_max_id = work_id
+            results_max_name = settings_name
         #
         settings_names.append(settings_name)
     #
@@ -106,7 +100,7 @@ def run_report(benchmark_dir, rewrite_results=True):
     results_table = list()
     metric_title = ['metric_'+m for m in results_collection.keys()] + ['metric_reference']
     title_line = ['serial_num', 'model_id', 'runtime_name', 'task_type', 'input_resolution', 'model_path', 'metric_name'] + \
-        metric_title + performance_keys + ['run_dir', 'artifact_name']
+        metric_title + performance_keys + latency_keys + ['run_dir', 'artifact_name']
 
     results_table.append(title_line)
     for serial_num, (artifact_id, pipeline_params_anchor) in enumerate(results_anchor.items()):
@@ -140,6 +134,9 @@ def run_report(benchmark_dir, rewrite_results=True):
         performance_line_dict = get_performance(pipeline_params_anchor)
         results_line_dict.update(performance_line_dict)
 
+        latency_line_dict = get_latency(pipeline_params_anchor)
+        results_line_dict.update(latency_line_dict)
+
         run_dir = pipeline_params_anchor['session']['run_dir'] if pipeline_params_anchor is not None else None
         run_dir_basename = os.path.basename(run_dir)
         results_line_dict['run_dir'] = run_dir_basename if run_dir is not None else None
@@ -206,3 +203,18 @@ def get_performance(pipeline_params):
         #
     #
     return performance_line_dict
+
+
+def get_latency(pipeline_params):
+    latency_line_dict = {}
+    latency_dict = None
+    if pipeline_params is not None and pipeline_params.get('result', None) is not None:
+        latency_dict = pipeline_params['result'].get('latency_ms', None)
+    #
+    for stage in latency_stages:
+        stage_dict = latency_dict.get(stage, None) if latency_dict is not None else None
+        for stat in latency_stats:
+            latency_line_dict[f'latency_{stage}_{stat}_ms'] = stage_dict.get(stat, None) if stage_dict is not None else None
+        #
+    #
+    return latency_line_dict
@@ -29,12 +29,18 @@
 from .params_base import *
 from .misc_utils import *
 from .download_utils import *
+from .dataset_prepare import *
 from .file_utils import *
 from .logger_utils import *
 from .parallel_run import *
+from .preprocess_cache import *
+from .results_store import *
+from .shared_index import *
+from .prefetch_loader import *
 from .environ_utils import *
 from .timer_utils import *
 from .metric_utils import *
+from .coco_eval_utils import *
 from .progress_step import *
 from .transforms_utils import *
 from .onnx_utils import *
@@ -0,0 +1,311 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#################################################################################
+# In memory COCO bbox evaluation.
+# This follows the evaluation in pycocotools.cocoeval.COCOeval (iouType='bbox') step by step,
+# including the order in which detections and ground truths are visited - so that the
+# resulting AP/AR numbers are the same. The greedy matching of each image is done for all
+# the iou thresholds and area ranges together with numpy, and the images are distributed
+# to multiple processes.
+# Reference: https://github.com/cocodataset/cocoapi/blob/master/PythonAPI/pycocotools/cocoeval.py
+#################################################################################
+
+import os
+import multiprocessing
+import concurrent.futures
+import numpy as np
+
+__all__ = ['COCOBBoxEval', 'coco_bbox_detection_dtype']
+
+
+# detections given to COCOBBoxEval - bbox is in [x, y, w, h] format as in the COCO results json
+coco_bbox_detection_dtype = np.dtype([('image_id', np.int64), ('category_id', np.int64),
+                                      ('bbox', np.float64, (4,)), ('score', np.float64)])
+
+# ground truth annotations - converted from the COCO annotation dicts
+coco_bbox_annotation_dtype = np.dtype([('image_id', np.int64), ('category_id', np.int64), ('id', np.int64),
+                                       ('bbox', np.float64, (4,)), ('area', np.float64), ('iscrowd', np.bool_)])
+
+
+class COCOBBoxEval:
+    """
+    Same usage as COCOeval: evaluate(), accumulate() and summarize(). The result is in stats.
+    gt_anns: list of annotation dicts, eg. from COCO.loadAnns()
+    detections: numpy array of coco_bbox_detection_dtype, in the order in which they would appear in the results json
+    img_ids, cat_ids: the images and categories to be evaluated (params.imgIds and params.catIds of COCOeval)
+    """
+    def __init__(self, gt_anns, detections, img_ids, cat_ids, num_workers=None):
+        self.img_ids = list(np.unique(img_ids))
+        self.cat_ids = list(np.unique(cat_ids))
+        self.iou_thrs = np.linspace(.5, 0.95, int(np.round((0.95 - .5) / .05)) + 1, endpoint=True)
+        self.rec_thrs = np.linspace(.0, 1.00, int(np.round((1.00 - .0) / .01)) + 1, endpoint=True)
+        self.max_dets = [1, 10, 100]
+        self.area_rngs = [[0 ** 2, 1e5 ** 2], [0 ** 2, 32 ** 2], [32 ** 2, 96 ** 2], [96 ** 2, 1e5 ** 2]]
+        self.area_rng_lbls = ['all', 'small', 'medium', 'large']
+        self.num_workers = num_workers if num_workers is not None else (os.cpu_count() or 1)
+        self.gts = self._to_annotation_array(gt_anns)
+        self.dts = np.asarray(detections, dtype=coco_bbox_detection_dtype)
+        self.eval_imgs = None
+        self.eval = None
+        self.stats = None
+
+    def evaluate(self):
+        image_tasks = self._prepare()
+        chunk_size = max(1, min(256, len(image_tasks) // max(1, 4 * self.num_workers)))
+        chunks = [image_tasks[i:i+chunk_size] for i in range(0, len(image_tasks), chunk_size)]
+        # starting the worker processes takes a few seconds - worth it only if there are many images
+        if self.num_workers > 1 and len(image_tasks) >= 1000:
+            mp_context = multiprocessing.get_context('spawn')
+            num_workers = min(self.num_workers, len(chunks))
+            with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context) as executor:
+                chunk_results = list(executor.map(_evaluate_images, chunks, [self._get_eval_params()]*len(chunks)))
+            #
+        else:
+            chunk_results = [_evaluate_images(chunk, self._get_eval_params()) for chunk in chunks]
+        #
+        # eval_imgs[cat_id] is the list of per image results, in the order of img_ids
+        self.eval_imgs = {cat_id:[] for cat_id in self.cat_ids}
+        for chunk_result in chunk_results:
+            for image_result in chunk_result:
+                for cat_id, cat_result in image_result.items():
+                    self.eval_imgs[cat_id].append(cat_result)
+                #
+            #
+        #
+
+    def accumulate(self):
+        num_thrs = len(self.iou_thrs)
+        num_recs = len(self.rec_thrs)
+        num_cats = len(self.cat_ids)
+        num_areas = len(self.area_rngs)
+        num_max_dets = len(self.max_dets)
+        precision = -np.ones((num_thrs, num_recs, num_cats, num_areas, num_max_dets))
+        recall = -np.ones((num_thrs, num_cats, num_areas, num_max_dets))
+        scores = -np.ones((num_thrs, num_recs, num_cats, num_areas, num_max_dets))
+        for k, cat_id in enumerate(self.cat_ids):
+            cat_results = self.eval_imgs[cat_id]
+            if len(cat_results) == 0:
+                continue
+            #
+            for m, max_det in enumerate(self.max_dets):
+                dt_scores = np.concatenate([e['dt_scores'][0:max_det] for e in cat_results])
+                # different sorting method generates slightly different results.
+                # mergesort is used to be consistent as Matlab implementation.
+                inds = np.argsort(-dt_scores, kind='mergesort')
+                dt_scores_sorted = dt_scores[inds]
+                # (area, thr, det)
+                dtm = np.concatenate([e['dt_matches'][:, :, 0:max_det] for e in cat_results], axis=2)[:, :, inds]
+                dt_ig = np.concatenate([e['dt_ignore'][:, :, 0:max_det] for e in cat_results], axis=2)[:, :, inds]
+                npigs = np.sum([e['num_gt_not_ignored'] for e in cat_results], axis=0)
+                for a in range(num_areas):
+                    npig = npigs[a]
+                    if npig == 0:
+                        continue
+                    #
+                    tps = np.logical_and(dtm[a], np.logical_not(dt_ig[a]))
+                    fps = np.logical_and(np.logical_not(dtm[a]), np.logical_not(dt_ig[a]))
+                    tp_sum = np.cumsum(tps, axis=1).astype(dtype=float)
+                    fp_sum = np.cumsum(fps, axis=1).astype(dtype=float)
+                    nd = tp_sum.shape[1]
+                    rc = tp_sum / npig
+                    pr = tp_sum / (fp_sum + tp_sum + np.spacing(1))
+                    recall[:, k, a, m] = rc[:, -1] if nd else 0
+                    if nd == 0:
+                        precision[:, :, k, a, m] = 0
+                        scores[:, :, k, a, m] = 0
+                        continue
+                    #
+                    # make precision monotonically non-increasing, from the end
+                    pr = np.maximum.accumulate(pr[:, ::-1], axis=1)[:, ::-1]
+                    for t in range(num_thrs):
+                        rec_inds = np.searchsorted(rc[t], self.rec_thrs, side='left')
+                        valid = (rec_inds < nd)
+                        q = np.zeros((num_recs,))
+                        ss = np.zeros((num_recs,))
+                        q[valid] = pr[t][rec_inds[valid]]
+                        ss[valid] = dt_scores_sorted[rec_inds[valid]]
+                        precision[t, :, k, a, m] = q
+                        scores[t, :, k, a, m] = ss
+                    #
+                #
+            #
+        #
+        self.eval = {'precision': precision, 'recall': recall, 'scores': scores}
+
+    def summarize(self):
+        def _summarize(ap=1, iou_thr=None, area_rng='all', max_dets=100):
+            i_str = ' {:<18} {} @[ IoU={:<9} | area={:>6s} | maxDets={:>3d} ] = {:0.3f}'
+            title_str = 'Average Precision' if ap == 1 else 'Average Recall'
+            type_str = '(AP)' if ap == 1 else '(AR)'
+            iou_str = '{:0.2f}:{:0.2f}'.format(self.iou_thrs[0], self.iou_thrs[-1]) \
+                if iou_thr is None else '{:0.2f}'.format(iou_thr)
+            aind = [i for i, a_rng in enumerate(self.area_rng_lbls) if a_rng == area_rng]
+            mind = [i for i, m_det in enumerate(self.max_dets) if m_det == max_dets]
+            if ap == 1:
+                # dimension of precision: [TxRxKxAxM]
+                s = self.eval['precision']
+                if iou_thr is not None:
+                    t = np.where(iou_thr == self.iou_thrs)[0]
+                    s = s[t]
+                #
+                s = s[:, :, :, aind, mind]
+            else:
+                # dimension of recall: [TxKxAxM]
+                s = self.eval['recall']
+                if iou_thr is not None:
+                    t = np.where(iou_thr == self.iou_thrs)[0]
+                    s = s[t]
+                #
+                s = s[:, :, aind, mind]
+            #
+            mean_s = -1 if len(s[s > -1]) == 0 else np.mean(s[s > -1])
+            print(i_str.format(title_str, type_str, iou_str, area_rng, max_dets, mean_s))
+            return mean_s
+
+        stats = np.zeros((12,))
+        stats[0] = _summarize(1)
+        stats[1] = _summarize(1, iou_thr=.5, max_dets=self.max_dets[2])
+        stats[2] = _summarize(1, iou_thr=.75, max_dets=self.max_dets[2])
+        stats[3] = _summarize(1, area_rng='small', max_dets=self.max_dets[2])
+        stats[4] = _summarize(1, area_rng='medium', max_dets=self.max_dets[2])
+        stats[5] = _summarize(1, area_rng='large', max_dets=self.max_dets[2])
+        stats[6] = _summarize(0, max_dets=self.max_dets[0])
+        stats[7] = _summarize(0, max_dets=self.max_dets[1])
+        stats[8] = _summarize(0, max_dets=self.max_dets[2])
+        stats[9] = _summarize(0, area_rng='small', max_dets=self.max_dets[2])
+        stats[10] = _summarize(0, area_rng='medium', max_dets=self.max_dets[2])
+        stats[11] = _summarize(0, area_rng='large', max_dets=self.max_dets[2])
+        self.stats = stats
+
+    def _to_annotation_array(self, gt_anns):
+        gts = np.zeros((len(gt_anns),), dtype=coco_bbox_annotation_dtype)
+        for i, ann in enumerate(gt_anns):
+            # as in COCOeval._prepare(), crowd annotations are the ones that are ignored
+            gts[i] = (ann['image_id'], ann['category_id'], ann['id'], ann['bbox'], ann['area'],
+                      bool(ann.get('iscrowd', 0)))
+        #
+        return gts
+
+    def _prepare(self):
+        # group the annotations and the detections by image, keeping their order within each image
+        gts = self.gts[np.isin(self.gts['category_id'], self.cat_ids)]
+        dts = self.dts[np.isin(self.dts['category_id'], self.cat_ids)]
+        gts_by_image = _group_by_image(gts, self.img_ids)
+        dts_by_image = _group_by_image(dts, self.img_ids)
+        image_tasks = [(gts_by_image[img_id], dts_by_image[img_id]) for img_id in self.img_ids]
+        return image_tasks
+
+    def _get_eval_params(self):
+        return dict(iou_thrs=self.iou_thrs, area_rngs=np.array(self.area_rngs), max_det=self.max_dets[-1])
+
+
+def _group_by_image(records, img_ids):
+    # stable sort, so that the original order within an image is retained
+    order = np.argsort(records['image_id'], kind='mergesort')
+    records = records[order]
+    starts = np.searchsorted(records['image_id'], img_ids, side='left')
+    ends = np.searchsorted(records['image_id'], img_ids, side='right')
+    return {img_id:records[start:end] for img_id, start, end in zip(img_ids, starts, ends)}
+
+
+def _bbox_iou(dt_bboxes, gt_bboxes, gt_iscrowd):
+    # same as pycocotools.mask.iou() for bboxes in [x, y, w, h] format
+    dx, dy, dw, dh = [dt_bboxes[:, i:i+1] for i in range(4)]
+    gx, gy, gw, gh = [gt_bboxes[None, :, i] for i in range(4)]
+    w = np.minimum(dx + dw, gx + gw) - np.maximum(dx, gx)
+    h = np.minimum(dy + dh, gy + gh) - np.maximum(dy, gy)
+    intersection = np.where((w > 0) & (h > 0), w * h, 0.0)
+    dt_area = dw * dh
+    gt_area = gw * gh
+    union = np.where(gt_iscrowd[None, :], dt_area, dt_area + gt_area - intersection)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ious = np.where(intersection > 0, intersection / union, 0.0)
+    #
+    return ious
+
+
+def _evaluate_images(image_tasks, eval_params):
+    return [_evaluate_image(gts, dts, **eval_params) for gts, dts in image_tasks]
+
+
+def _evaluate_image(gts, dts, iou_thrs, area_rngs, max_det):
+    # evaluates all the categories of one image, for all the area ranges and iou thresholds
+    image_result = {}
+    num_areas = len(area_rngs)
+    num_thrs = len(iou_thrs)
+    for cat_id in np.unique(np.concatenate([gts['category_id'], dts['category_id']])):
+        gt = gts[gts['category_id'] == cat_id]
+        dt = dts[dts['category_id'] == cat_id]
+        dt = dt[np.argsort(-dt['score'], kind='mergesort')][:max_det]
+        num_gt, num_dt = len(gt), len(dt)
+        # ignore flags of ground truths for each area range: (area, gt)
+        gt_area = gt['area'][None, :]
+        gt_ig = gt['iscrowd'][None, :] | (gt_area < area_rngs[:, 0:1]) | (gt_area > area_rngs[:, 1:2])
+        # the matching below is done for each (area range, iou threshold) in parallel - flatten them as rows
+        gt_ig_rows = np.repeat(gt_ig, num_thrs, axis=0)
+        thrs_rows = np.tile(np.minimum(iou_thrs, 1 - 1e-10), num_areas)
+        gt_matched = np.zeros((num_areas * num_thrs, num_gt), dtype=np.bool_)
+        dt_matched = np.zeros((num_areas * num_thrs, num_dt), dtype=np.bool_)
+        dt_ig = np.zeros((num_areas * num_thrs, num_dt), dtype=np.bool_)
+        if num_gt > 0 and num_dt > 0:
+            ious = _bbox_iou(dt['bbox'], gt['bbox'], gt['iscrowd'])
+            crowd = gt['iscrowd'][None, :]
+            # detections that do not reach the lowest threshold with any ground truth are never matched
+            for d in np.flatnonzero(ious.max(axis=1) >= thrs_rows.min()):
+                iou_d = ious[d][None, :]
+                # a ground truth that is already matched can be matched again only if it is a crowd
+                eligible = (iou_d >= thrs_rows[:, None]) & ~(gt_matched & ~crowd)
+                # in COCOeval the ground truths are sorted with the ignored ones at the end, and the
+                # ignored ones are considered only if none of the others is matched
+                eligible_not_ig = eligible & ~gt_ig_rows
+                eligible = np.where(eligible_not_ig.any(axis=1, keepdims=True), eligible_not_ig, eligible)
+                rows = np.flatnonzero(eligible.any(axis=1))
+                if len(rows) == 0:
+                    continue
+                #
+                # best iou - the last one among equals, as in the loop in COCOeval
+                eligible_ious = np.where(eligible[rows], iou_d, -np.inf)
+                is_best = eligible_ious == eligible_ious.max(axis=1, keepdims=True)
+                m = num_gt - 1 - np.argmax(is_best[:, ::-1], axis=1)
+                dt_ig[rows, d] = gt_ig_rows[rows, m]
+                dt_matched[rows, d] = True
+                gt_matched[rows, m] = True
+            #
+        #
+        # set unmatched detections outside of area range to ignore
+        dt_area = dt['bbox'][:, 2] * dt['bbox'][:, 3]
+        dt_out = (dt_area[None, :] < area_rngs[:, 0:1]) | (dt_area[None, :] > area_rngs[:, 1:2])
+        dt_ig = dt_ig | (~dt_matched & np.repeat(dt_out, num_thrs, axis=0))
+        image_result[int(cat_id)] = dict(
+            dt_scores=dt['score'],
+            dt_matches=dt_matched.reshape(num_areas, num_thrs, num_dt),
+            dt_ignore=dt_ig.reshape(num_areas, num_thrs, num_dt),
+            num_gt_not_ignored=np.count_nonzero(~gt_ig, axis=1))
+    #
+    return image_result
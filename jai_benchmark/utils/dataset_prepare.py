@@ -0,0 +1,207 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import shutil
+import hashlib
+import multiprocessing
+import concurrent.futures
+import yaml
+from .parallel_run import _multiprocessing_default_context_type
+from .shared_index import _write_atomic
+from .progress_step import progress_step
+from .logger_utils import log_color
+
+__all__ = ['DatasetPreparer']
+
+
+def _file_md5(file_name, chunk_size=1024*1024):
+    md5 = hashlib.md5()
+    with open(file_name, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            md5.update(chunk)
+        #
+    #
+    return md5.hexdigest()
+
+
+class DatasetPreparer:
+    """
+    Runs the conversion steps of a dataset preparation (eg. writing the images of an archive as files)
+    in a pool of workers, and keeps track of the steps that are complete - so that an interrupted
+    preparation continues from where it stopped, instead of starting again.
+
+    convert_func(item) converts one item and returns the list of files that it wrote (the paths as they were written,
+    eg. os.path.join(output_path, ...) - or absolute paths). When it returns,
+    a marker file that records those files and their sizes (and md5 if checksum is set) is written for the
+    item. An item is done if its marker is there and the files in it are still present with the same size.
+    When all the items are done, the markers are merged into a manifest, that verify() checks the files against.
+
+    The markers and the manifest are under output_path/.prepare/name - the files in the markers are relative
+    to output_path. source_key (optional) identifies the source of the items (eg. the size and modification time
+    of an archive) - if it is not the one of the earlier run, the items are converted again. worker_type can be 'thread' (convert_func can share open files) or 'process'
+    (convert_func and the items must be picklable).
+    """
+    def __init__(self, output_path, name, num_workers=None, worker_type='thread', checksum=False, source_key=None):
+        assert worker_type in ('thread', 'process'), f'invalid worker_type {worker_type}'
+        self.output_path = output_path
+        self.name = name
+        self.num_workers = num_workers if num_workers is not None else (os.cpu_count() or 1)
+        self.worker_type = worker_type
+        self.checksum = checksum
+        self.source_key = source_key
+        self.prepare_dir = os.path.join(output_path, '.prepare', name)
+        self.markers_dir = os.path.join(self.prepare_dir, 'markers')
+        self.manifest_file = os.path.join(self.prepare_dir, 'manifest.yaml')
+        self.source_file = os.path.join(self.prepare_dir, 'source.yaml')
+
+    def is_started(self):
+        return os.path.exists(self.prepare_dir)
+
+    def reset(self):
+        '''remove the markers and the manifest - the next run() converts all the items again'''
+        if os.path.exists(self.prepare_dir):
+            shutil.rmtree(self.prepare_dir)
+        #
+
+    def run(self, convert_func, items, desc=None):
+        if self.is_started() and self._load_source_key() != self.source_key:
+            print(log_color('\nINFO', 'the source has changed - preparing all the items again', self.name))
+            self.reset()
+        #
+        os.makedirs(self.markers_dir, exist_ok=True)
+        if not os.path.exists(self.source_file):
+            source = {'source_key': self.source_key}
+            _write_atomic(self.source_file, lambda fp: yaml.safe_dump(source, fp, encoding='utf-8'))
+        #
+        items = list(items)
+        pending_items = [item for item in items if self._load_marker(item) is None]
+        if len(pending_items) < len(items):
+            print(log_color('\nINFO', 'items are already prepared - resuming',
+                            f'{self.name}: {len(items)-len(pending_items)} of {len(items)}'))
+        #
+        failed_items = []
+        if len(pending_items) > 0:
+            desc = desc if desc is not None else f'preparing {self.name}'
+            with self._get_executor() as executor:
+                futures = {executor.submit(convert_func, item): item for item in pending_items}
+                for future in progress_step(concurrent.futures.as_completed(futures), desc=desc, total=len(futures)):
+                    item = futures[future]
+                    try:
+                        self._save_marker(item, future.result())
+                    except Exception as e:
+                        print(log_color('\nWARNING', 'preparation of item failed', f'{self.name}: {item} - {e}'))
+                        failed_items.append(item)
+                    #
+                #
+            #
+        #
+        assert len(failed_items) == 0, f'{self.name}: preparation of {len(failed_items)} items failed - ' \
+            f'run it again to retry only those'
+        self._save_manifest(items)
+
+    def verify(self, checksum=False):
+        '''check the files of the manifest - False if the preparation is not complete or a file is missing or modified'''
+        if not os.path.exists(self.manifest_file) or self._load_source_key() != self.source_key:
+            return False
+        #
+        with open(self.manifest_file) as fp:
+            manifest = yaml.safe_load(fp)
+        #
+        return self._check_files(manifest['files'], checksum=checksum)
+
+    def _get_executor(self):
+        if self.worker_type == 'process':
+            mp_context = multiprocessing.get_context(_multiprocessing_default_context_type)
+            return concurrent.futures.ProcessPoolExecutor(max_workers=self.num_workers, mp_context=mp_context)
+        else:
+            return concurrent.futures.ThreadPoolExecutor(max_workers=self.num_workers)
+        #
+
+    def _load_source_key(self):
+        if not os.path.exists(self.source_file):
+            return None
+        #
+        with open(self.source_file) as fp:
+            return yaml.safe_load(fp)['source_key']
+        #
+
+    def _get_marker_file(self, item):
+        # the item itself is recorded in the marker
+        marker_name = hashlib.sha1(str(item).encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self.markers_dir, f'{marker_name}.yaml')
+
+    def _load_marker(self, item):
+        marker_file = self._get_marker_file(item)
+        if not os.path.exists(marker_file):
+            return None
+        #
+        with open(marker_file) as fp:
+            marker = yaml.safe_load(fp)
+        #
+        return marker if self._check_files(marker['files']) else None
+
+    def _save_marker(self, item, output_files):
+        files = {}
+        for output_file in (output_files or []):
+            abs_file = os.path.abspath(output_file)
+            rel_file = os.path.relpath(abs_file, os.path.abspath(self.output_path))
+            file_entry = {'size': os.path.getsize(abs_file)}
+            if self.checksum:
+                file_entry['md5'] = _file_md5(abs_file)
+            #
+            files[rel_file] = file_entry
+        #
+        marker = {'item': str(item), 'files': files}
+        _write_atomic(self._get_marker_file(item), lambda fp: yaml.safe_dump(marker, fp, encoding='utf-8'))
+
+    def _save_manifest(self, items):
+        files = {}
+        for item in items:
+            with open(self._get_marker_file(item)) as fp:
+                files.update(yaml.safe_load(fp)['files'])
+            #
+        #
+        manifest = {'name': self.name, 'num_items': len(items), 'files': files}
+        _write_atomic(self.manifest_file, lambda fp: yaml.safe_dump(manifest, fp, encoding='utf-8'))
+
+    def _check_files(self, files, checksum=False):
+        for rel_file, file_entry in files.items():
+            abs_file = os.path.join(self.output_path, rel_file)
+            try:
+                if os.path.getsize(abs_file) != file_entry['size']:
+                    return False
+                #
+            except OSError:
+                return False
+            #
+            if checksum and 'md5' in file_entry and _file_md5(abs_file) != file_entry['md5']:
+                return False
+            #
+        #
+        return True
@@ -31,26 +31,35 @@
 #################################################################################
 import os
 import yaml
+import tarfile
 from pathlib import Path
 #from jacinto_ai_benchmark import *
-import jacinto_ai_benchmark.utils
+from jai_benchmark import utils
 
 #####################
 #extract multiple tars and store them in separate folders
+#the tars are extracted in parallel - an interrupted extraction resumes with the tars that are not done
 #####################
-def extract_multiple_tar(data_root=None, extracted_path=None):
+def extract_multiple_tar(data_root=None, extracted_path=None, num_workers=None):
+    input_tar_files = []
     for subdir, dirs, files in sorted(os.walk(data_root)):
         #print(subdir, dirs, files)
-        p = Path(subdir)
         for file in sorted(files):
             filename, file_extension = os.path.splitext(file)
             if file_extension in ['.tar']:
-                input_tar_file = os.path.join(subdir, file)
-                op_path_one_set = os.path.join(extracted_path,filename)
-                os.makedirs(op_path_one_set, exist_ok=True)
-                cmd = "tar -xvf {} -C {}".format(input_tar_file, op_path_one_set)
-                print(cmd)
-                os.system(cmd)
+                input_tar_files.append(os.path.join(subdir, file))
+
+    def extract_tar(input_tar_file):
+        filename = os.path.splitext(os.path.basename(input_tar_file))[0]
+        op_path_one_set = os.path.join(extracted_path, filename)
+        os.makedirs(op_path_one_set, exist_ok=True)
+        with tarfile.open(input_tar_file) as tar:
+            members = [m for m in tar.getmembers() if m.isfile()]
+            tar.extractall(path=op_path_one_set, members=members)
+        return [os.path.join(op_path_one_set, m.name) for m in members]
+
+    preparer = utils.DatasetPreparer(extracted_path, 'extract_multiple_tar', num_workers=num_workers)
+    preparer.run(extract_tar, input_tar_files, desc='extracting tars')
     return            
 
 #####################
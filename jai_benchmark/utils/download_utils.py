@@ -72,9 +72,11 @@ import tarfile
 from typing import Any, Callable, List, Iterable, Optional, TypeVar
 from urllib.parse import urlparse
 import zipfile
+import threading
 from tqdm.auto import tqdm
 
 from . import model_utils
+from .dataset_prepare import DatasetPreparer
 
 
 def download_file(url, root=None, extract_root=None, filename=None, md5=None, mode=None, force_download=False, force_linkfile=True):
@@ -397,8 +399,7 @@ def extract_archive(from_path: str, to_path: Optional[str] = None, remove_finish
             out_f.write(zip_f.read())
     elif _is_zip(from_path):
         mode = 'r' if mode is None else mode
-        with zipfile.ZipFile(from_path, mode) as z:
-            z.extractall(to_path)
+        _extract_zip(from_path, to_path, mode)
     else:
         raise ValueError("Extraction of {} not supported".format(from_path))
 
@@ -412,6 +413,43 @@ def extract_archive(from_path: str, to_path: Optional[str] = None, remove_finish
     return to_path
 
 
+def _extract_zip(from_path, to_path, mode, files_per_item=256):
+    # the files are extracted by a pool of threads, in groups of files_per_item - with a marker for each group,
+    # so that an interrupted extraction resumes from where it stopped (see DatasetPreparer)
+    with zipfile.ZipFile(from_path, mode) as z:
+        members = z.infolist()
+    #
+    # the folders are created upfront - workers creating the same folder at the same time would collide
+    for member in members:
+        folder = member.filename if member.is_dir() else os.path.dirname(member.filename)
+        if folder:
+            os.makedirs(os.path.join(to_path, folder), exist_ok=True)
+        #
+    #
+    file_names = [member.filename for member in members if not member.is_dir()]
+    file_groups = [file_names[i:i+files_per_item] for i in range(0, len(file_names), files_per_item)]
+    # each thread reads the archive through its own handle
+    thread_local = threading.local()
+    zip_files = []
+    def extract_group(group_idx):
+        zip_file = getattr(thread_local, 'zip_file', None)
+        if zip_file is None:
+            zip_file = thread_local.zip_file = zipfile.ZipFile(from_path, mode)
+            zip_files.append(zip_file)
+        #
+        return [zip_file.extract(file_name, to_path) for file_name in file_groups[group_idx]]
+    #
+    from_stat = os.stat(from_path)
+    preparer = DatasetPreparer(to_path, os.path.basename(from_path), source_key=f'{from_stat.st_size}_{from_stat.st_mtime_ns}')
+    try:
+        preparer.run(extract_group, range(len(file_groups)), desc=f'extracting {os.path.basename(from_path)}')
+    finally:
+        for zip_file in zip_files:
+            zip_file.close()
+        #
+    #
+
+
 def download_and_extract_archive(
     url: str,
     download_root: str,
@@ -1,6 +1,7 @@
 import os
 import sys
 import importlib
+import collections.abc
 
 
 def import_folder(folder_name):
@@ -13,3 +14,36 @@ def import_folder(folder_name):
     imported_module = importlib.import_module(basename, __name__)
     sys.path.pop(0)
     return imported_module
+
+
+def import_attr(package_name, attr_modules, attr_name):
+    '''import the (sub)module given for attr_name in attr_modules - relative to package_name and return the attribute.
+    used in the module level __getattr__ of a package, so that its contents are imported only when they are used.
+    the attribute is set in the package, so that __getattr__ is not called again for it.'''
+    if attr_name not in attr_modules:
+        raise AttributeError(f'module {package_name!r} has no attribute {attr_name!r}')
+    #
+    module = importlib.import_module(attr_modules[attr_name], package_name)
+    attr_value = module if module.__name__.endswith('.' + attr_name) else getattr(module, attr_name)
+    setattr(sys.modules[package_name], attr_name, attr_value)
+    return attr_value
+
+
+class LazyImportDict(collections.abc.Mapping):
+    '''a read only dict, with each value given as the name of an attribute of a package, that is imported when it is looked up.
+    example: LazyImportDict(__name__, {'onnxrt': 'ONNXRTSession'}) - in the package that has ONNXRTSession in its __getattr__'''
+    def __init__(self, package_name, attr_names):
+        self.package_name = package_name
+        self.attr_names = dict(attr_names)
+
+    def __getitem__(self, key):
+        return getattr(sys.modules[self.package_name], self.attr_names[key])
+
+    def __iter__(self):
+        return iter(self.attr_names)
+
+    def __len__(self):
+        return len(self.attr_names)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.attr_names})'
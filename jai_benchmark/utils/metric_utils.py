@@ -26,6 +26,8 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import os
+import concurrent.futures
 import numpy as np
 
 class AverageMeter(object):
@@ -71,3 +73,300 @@ def segmentation_accuracy(cmatrix, multiplier=100.0):
     mean_iou = np.nanmean(iou)
     metric = {'accuracy_mean_iou%':mean_iou*multiplier}
     return metric
+
+
+class EvaluatorBase:
+    """
+    Incremental evaluation of a metric.
+    update() is called with the output of each frame, in the order of frames.
+    finalize() returns the metric as a dict.
+    """
+    def update(self, frame_idx, output):
+        raise NotImplementedError('update() must be implemented in the derived class')
+
+    def finalize(self):
+        raise NotImplementedError('finalize() must be implemented in the derived class')
+
+
+class BufferedEvaluator(EvaluatorBase):
+    """
+    Collects all the outputs and calls metric(outputs, **kwargs) in finalize().
+    This is used for metrics that do not provide get_evaluator().
+    """
+    def __init__(self, metric, **kwargs):
+        self.metric = metric
+        self.kwargs = kwargs
+        self.outputs = []
+
+    def update(self, frame_idx, output):
+        self.outputs.append(output)
+
+    def finalize(self):
+        return self.metric(self.outputs, **self.kwargs)
+
+
+class LabelEvaluator(EvaluatorBase):
+    """
+    Base class of the evaluators that compare the output of each frame with a label.
+    load_label(frame_idx) returns the label of a frame. Since the label files are known upfront,
+    they are read by a pool of threads (num_workers), ahead of the frame that is being evaluated.
+    """
+    def __init__(self, num_frames, load_label, num_workers=None, prefetch_frames=None):
+        self.num_frames = num_frames
+        self.load_label = load_label
+        self.num_workers = num_workers if num_workers is not None else min(4, os.cpu_count() or 1)
+        self.prefetch_frames = prefetch_frames if prefetch_frames is not None else 2*self.num_workers
+        self.label_executor = None
+        self.label_futures = {}
+
+    def _get_label(self, frame_idx):
+        if self.num_workers == 0:
+            return self.load_label(frame_idx)
+        #
+        if self.label_executor is None:
+            self.label_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.num_workers)
+        #
+        # frames normally arrive in order - keep the labels of the next few frames being loaded
+        prefetch_end = min(frame_idx + self.prefetch_frames, self.num_frames)
+        for label_idx in range(frame_idx, prefetch_end):
+            if label_idx not in self.label_futures:
+                self.label_futures[label_idx] = self.label_executor.submit(self.load_label, label_idx)
+            #
+        #
+        label_future = self.label_futures.pop(frame_idx)
+        # loads of earlier frames that were skipped are no longer needed
+        for label_idx in [k for k in self.label_futures.keys() if k < frame_idx]:
+            self.label_futures.pop(label_idx).cancel()
+        #
+        return label_future.result()
+
+    def _close(self):
+        if self.label_executor is not None:
+            for label_future in self.label_futures.values():
+                label_future.cancel()
+            #
+            self.label_executor.shutdown(wait=True)
+            self.label_executor = None
+            self.label_futures = {}
+        #
+
+    def __del__(self):
+        self._close()
+
+
+class SegmentationEvaluator(LabelEvaluator):
+    """
+    Accumulates the confusion matrix of a segmentation dataset as the frames arrive.
+    The result is identical to calling confusion_matrix() for each frame and segmentation_accuracy() at the end.
+
+    load_label(frame_idx) returns the label of a frame as an array - the labels are read ahead by LabelEvaluator.
+    label_lut (optional) maps the values of the label returned by load_label() to the class indices -
+    values that are mapped outside [0, num_classes) are ignored, as in confusion_matrix().
+    The lut is combined with the row offset of the confusion matrix, so that each frame needs only
+    one table lookup, one add and one bincount - without the intermediate masks and copies.
+    """
+    def __init__(self, num_classes, num_frames, load_label, label_lut=None, label_offset_pred=0,
+                 num_workers=None, prefetch_frames=None):
+        super().__init__(num_frames, load_label, num_workers=num_workers, prefetch_frames=prefetch_frames)
+        self.num_classes = num_classes
+        self.label_offset_pred = label_offset_pred
+        # bin num_classes*num_classes collects the pixels with invalid labels - it is dropped at the end
+        self.invalid_bin = num_classes * num_classes
+        self.label_lut = np.asarray(label_lut) if label_lut is not None else None
+        assert self.label_lut is None or len(self.label_lut) == 256, 'label_lut must have 256 entries'
+        class_lut = self.label_lut if label_lut is not None else np.arange(256)
+        is_valid = (class_lut >= 0) & (class_lut < num_classes)
+        self.row_lut = np.where(is_valid, class_lut.astype(np.intp)*num_classes, self.invalid_bin).astype(np.intp)
+        self.cmatrix = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.merged_buffer = None
+
+    def update(self, frame_idx, output):
+        if frame_idx >= self.num_frames:
+            return
+        #
+        label_img = self._get_label(frame_idx)
+        # reshape prediction is needed
+        output = output+self.label_offset_pred
+        output = output.astype(np.uint8)
+        output = output[0] if (output.ndim > 2 and output.shape[0] == 1) else output
+        output = output[:2] if (output.ndim > 2 and output.shape[2] == 1) else output
+        # compute metric
+        self._accumulate(output, label_img)
+
+    def finalize(self):
+        self._close()
+        accuracy = segmentation_accuracy(self.cmatrix)
+        return accuracy
+
+    def _accumulate(self, output, label_img):
+        label_img = np.asarray(label_img)
+        output = np.asarray(output)
+        num_classes = self.num_classes
+        if label_img.dtype != np.uint8 or output.size == 0 or label_img.size != output.size or \
+                output.max() >= num_classes:
+            # uncommon cases - eg. labels that are not 8 bit or predictions that are out of range
+            assert self.label_lut is None or label_img.dtype == np.uint8, 'label_lut can be used only with 8 bit labels'
+            label_img = self.label_lut[label_img] if self.label_lut is not None else label_img
+            self.cmatrix += confusion_matrix(None, output, label_img, num_classes)
+            return
+        #
+        if self.merged_buffer is None or self.merged_buffer.size != label_img.size:
+            self.merged_buffer = np.empty(label_img.size, dtype=np.intp)
+        #
+        merged = self.merged_buffer
+        np.take(self.row_lut, label_img.reshape(-1), out=merged)
+        np.add(merged, output.reshape(-1), out=merged)
+        hist = np.bincount(merged, minlength=self.invalid_bin+num_classes)
+        self.cmatrix += hist[:self.invalid_bin].reshape(num_classes, num_classes)
+
+
+def compute_scale_and_shift(prediction, gt, mask):
+    # least squares scale and shift that align the prediction to gt, in the pixels of mask
+    a_00 = np.sum(mask * prediction * prediction)
+    a_01 = np.sum(mask * prediction)
+    a_11 = np.sum(mask)
+
+    b_0 = np.sum(mask * prediction * gt)
+    b_1 = np.sum(mask * gt)
+
+    det = a_00 * a_11 - a_01 * a_01
+
+    if det <= 0:
+        return 0, 0
+
+    else:
+        x_0 = (a_11 * b_0 - a_01 * b_1) / det
+        x_1 = (-a_01 * b_0 + a_00 * b_1) / det
+
+        return x_0, x_1
+
+
+class DepthEvaluator(LabelEvaluator):
+    """
+    Accumulates the depth estimation metrics as the frames arrive - delta_1, delta_2, delta_3 (the fraction of
+    pixels in which max(prediction/label, label/prediction) is less than threshold, threshold^2, threshold^3),
+    abs_rel, rmse and log_rmse. Each metric is computed per frame over the valid pixels (where both the label and the
+    prediction are non zero - and for the errors, positive) and averaged over the frames. The valid pixels are gathered
+    once into preallocated buffers and all the metrics are computed from those - delta_1 is identical to computing it
+    with masked copies of the prediction and the label.
+
+    load_label(frame_idx) returns the depth label of a frame - the labels are read ahead by LabelEvaluator.
+    disparity: the prediction is disparity (inverse depth). scale_shift: the prediction is aligned to the label
+    (in disparity) by least squares, and clipped to the range given by depth_cap_min and depth_cap_max.
+    """
+    def __init__(self, num_frames, load_label, threshold=1.25, depth_cap_max=80, depth_cap_min=1e-3,
+                 disparity=False, scale_shift=False, num_workers=None, prefetch_frames=None):
+        super().__init__(num_frames, load_label, num_workers=num_workers, prefetch_frames=prefetch_frames)
+        self.threshold = threshold
+        self.delta_thresholds = (threshold, threshold**2, threshold**3)
+        self.depth_cap_max = depth_cap_max
+        self.depth_cap_min = depth_cap_min
+        self.disparity = disparity
+        self.scale_shift = scale_shift
+        self.metric_sums = dict(delta_1=0.0, delta_2=0.0, delta_3=0.0, abs_rel=0.0, rmse=0.0, log_rmse=0.0)
+        self.num_frames_evaluated = 0
+        self.buffers = {}
+
+    def update(self, frame_idx, prediction):
+        if frame_idx >= self.num_frames:
+            return
+        #
+        label_img = self._get_label(frame_idx)
+        prediction = np.asarray(prediction)
+        if prediction.shape != label_img.shape and prediction.size == label_img.size:
+            prediction = prediction.reshape(label_img.shape)
+        #
+        if self.scale_shift:
+            prediction = self._scale_and_shift(prediction, label_img)
+        #
+        # the valid pixels are gathered once into contiguous buffers - the metrics are computed on those
+        buffer_dtype = np.result_type(prediction, label_img)
+        mask = self._get_buffer('mask', label_img.size, np.bool_)
+        min_depth = np.minimum(label_img.reshape(-1), prediction.reshape(-1),
+                               out=self._get_buffer('min', label_img.size, buffer_dtype))
+        np.not_equal(min_depth, 0, out=mask)
+        num_valid = np.count_nonzero(mask)
+        label_valid = np.compress(mask, label_img.reshape(-1), out=self._get_buffer('label', num_valid, label_img.dtype))
+        pred_valid = np.compress(mask, prediction.reshape(-1), out=self._get_buffer('pred', num_valid, prediction.dtype))
+        if self.disparity:
+            np.divide(1.0, pred_valid, out=pred_valid)
+        #
+        delta = np.divide(pred_valid, label_valid, out=self._get_buffer('delta', num_valid, buffer_dtype))
+        delta_inv = np.divide(label_valid, pred_valid, out=self._get_buffer('delta_inv', num_valid, buffer_dtype))
+        np.maximum(delta, delta_inv, out=delta)
+        compare = self._get_buffer('compare', num_valid, np.bool_)
+        for delta_idx, delta_threshold in enumerate(self.delta_thresholds):
+            np.less(delta, delta_threshold, out=compare)
+            self.metric_sums[f'delta_{delta_idx+1}'] += np.int64(np.count_nonzero(compare)) / np.int64(num_valid)
+        #
+        # the errors are computed where both the label and the prediction are positive
+        np.greater(pred_valid, 0, out=compare)
+        np.logical_and(compare, label_valid > 0, out=compare)
+        num_positive = np.count_nonzero(compare)
+        if num_positive < num_valid:
+            label_valid = np.compress(compare, label_valid)
+            pred_valid = np.compress(compare, pred_valid)
+        #
+        error = np.subtract(pred_valid, label_valid, out=delta_inv[:num_positive])
+        np.abs(error, out=error)
+        rel_error = np.divide(error, label_valid, out=delta[:num_positive])
+        self.metric_sums['abs_rel'] += np.sum(rel_error, dtype=np.float64) / num_positive
+        np.square(error, out=error)
+        self.metric_sums['rmse'] += np.sqrt(np.sum(error, dtype=np.float64) / num_positive)
+        log_error = np.log(np.maximum(pred_valid, self.depth_cap_min, out=error), out=error)
+        np.subtract(log_error, np.log(label_valid, out=delta[:num_positive]), out=log_error)
+        np.square(log_error, out=log_error)
+        self.metric_sums['log_rmse'] += np.sqrt(np.sum(log_error, dtype=np.float64) / num_positive)
+        self.num_frames_evaluated += 1
+
+    def finalize(self):
+        self._close()
+        metric = {k: v / self.num_frames_evaluated for k, v in self.metric_sums.items()}
+        metric = {'accuracy_delta_1%': metric['delta_1'] * 100, 'accuracy_delta_2%': metric['delta_2'] * 100,
+                  'accuracy_delta_3%': metric['delta_3'] * 100, 'abs_rel': metric['abs_rel'],
+                  'rmse': metric['rmse'], 'log_rmse': metric['log_rmse']}
+        return metric
+
+    def _scale_and_shift(self, prediction, label_img):
+        depth_cap_max = self.depth_cap_max
+        depth_cap_min = self.depth_cap_min
+        mask = label_img != 0
+        disp_label = np.zeros_like(label_img)
+        disp_label[mask] = 1.0 / label_img[mask]
+        if not self.disparity:
+            disp_prediction = np.zeros_like(prediction)
+            disp_prediction[prediction != 0] = 1.0 / prediction[prediction != 0]
+        else:
+            disp_prediction = prediction
+        #
+        scale, shift = compute_scale_and_shift(disp_prediction, disp_label, mask)
+        prediction = scale * disp_prediction + shift
+        prediction[prediction < 1 / depth_cap_max] = 1 / depth_cap_max
+        prediction[prediction > 1 / depth_cap_min] = 1 / depth_cap_min
+        return prediction
+
+    def _get_buffer(self, name, size, dtype):
+        # the buffers are grown as needed and reused for the next frames
+        buffer = self.buffers.get(name, None)
+        if buffer is None or buffer.size < size or buffer.dtype != dtype:
+            buffer = np.empty((size,), dtype=dtype)
+            self.buffers[name] = buffer
+        #
+        return buffer[:size]
+
+
+def get_evaluator(metric, **kwargs):
+    # datasets that can accumulate the metric as the frames arrive provide get_evaluator()
+    if hasattr(metric, 'get_evaluator'):
+        return metric.get_evaluator(**kwargs)
+    else:
+        return BufferedEvaluator(metric, **kwargs)
+    #
+
+
+def run_evaluator(evaluator, predictions, num_frames=None):
+    num_frames = len(predictions) if num_frames is None else min(num_frames, len(predictions))
+    for frame_idx in range(num_frames):
+        evaluator.update(frame_idx, predictions[frame_idx])
+    #
+    return evaluator.finalize()
@@ -29,10 +29,12 @@
 import os
 import sys
 import multiprocessing
-from multiprocessing import pool
+import multiprocessing.connection
 import collections
+import functools
 import time
 import traceback
+import yaml
 from .progress_step import *
 from .logger_utils import *
 
@@ -42,94 +44,379 @@ from .logger_utils import *
 _multiprocessing_default_context_type = 'spawn' #'fork'
 
 
-# daemon processes are not allowed to have children
-# a hack to create non-daemon process in multiprocessing.Pool
-class NoDaemonProcess(multiprocessing.Process):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-    def _get_daemon(self):
-        return False
-
-    def _set_daemon(self, value):
-        pass
-
-    daemon = property(_get_daemon, _set_daemon)
-
-
-class NoDaeomonPool(pool.Pool):
-    Process = NoDaemonProcess
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-    # create process pool and queue the tasks
-    def get_context(self, method=None):
-        return super().get_context(_multiprocessing_default_context_type)
-
-
 class ParallelRun:
-    def __init__(self, num_processes, parallel_devices=None, desc='tasks', blocking=True, maxinterval=10.0):
+    """
+    Runs the queued tasks in parallel, on num_processes slots. Each slot has a worker process that runs its
+    tasks one after the other - it is started for the first task of the slot and reused for the next ones, so
+    that the tasks do not pay for starting python and importing the packages again. It is started again only if
+    it crashes. The workers are not daemon processes, so that the tasks can start processes of their own.
+
+    Scheduling: tasks are started longest first (largest cost first), which reduces the total time
+    when the task durations vary a lot. The cost of a task is the duration recorded in the journal_file
+    by an earlier run, else the estimate given in enqueue() (eg. from the logs of earlier runs).
+    Retry: if the process of a task crashes (eg. segfault) without returning a result, the task is
+    started again, up to max_retries times. A crashed task does not stop the other tasks.
+    Journal: if journal_file is given, the status, number of attempts and duration of each task is written
+    to it as soon as it changes - so an interrupted run can be examined and the durations are reused next time.
+    Resume: a task that the journal records as done is not run again if a resume_task is given in enqueue() -
+    the result of resume_task() (run in this process, eg. reading the result file of the task) is used instead,
+    unless it is None. If the run is interrupted (eg. KeyboardInterrupt), the running processes are terminated.
+    Staged tasks: run() blocks until all the tasks are done. To add tasks while running (eg. the next stage of
+    a task that is done - see PipelinedParallelRun), use start(), then start_pending_tasks(), wait on
+    get_wait_list() and collect_done_tasks() until done, with add_task() or cancel_expected_task() for each
+    expected task, and stop() at the end.
+    """
+    def __init__(self, num_processes, parallel_devices=None, desc='tasks', maxinterval=10.0,
+                 max_retries=0, journal_file=None):
         self.desc = desc
         self.num_processes = num_processes
         self.parallel_devices = parallel_devices
         self.queued_tasks = collections.deque()
         self.maxinterval = maxinterval
-        self.blocking = blocking
+        self.max_retries = max_retries
+        self.journal_file = journal_file
+        self.journal = self._load_journal()
         assert self.parallel_devices is None or len(self.parallel_devices) == num_processes, \
             f'length of parallel_devices {self.parallel_devices} must match num_processes {num_processes}'
 
-    def enqueue(self, task):
-        self.queued_tasks.append(task)
+    def enqueue(self, task, task_id=None, cost=None, resume_task=None):
+        task_id = task_id if task_id is not None else str(len(self.queued_tasks))
+        self.queued_tasks.append(dict(task=task, task_id=task_id, cost=cost, resume_task=resume_task))
+
+    def is_task_done(self, task_id):
+        '''whether the journal records the task as done - by this or an earlier run'''
+        return self.journal.get(task_id, {}).get('status', None) == 'done'
 
     def run(self):
         assert len(self.queued_tasks) > 0, f'at least one task must be queued, got {len(self.queued_tasks)}'
         return self._run_parallel()
 
-    def _run_sequential(self):
-        result_list = []
-        for task_id, task in progress_step(self.queued_tasks, desc='tasks'):
-            result = task()
-            result_list.append(result)
+    def _run_parallel(self):
+        self.start()
+        result_list = list(self.resumed_results)
+        try:
+            while len(result_list) < len(self.resumed_results) + self.num_tasks:
+                self.start_pending_tasks()
+                # wait until a task sends its result or a process exits
+                multiprocessing.connection.wait(self.get_wait_list(), timeout=self.maxinterval)
+                for task_entry, result in self.collect_done_tasks():
+                    result_list.append(result)
+                #
+            #
+        finally:
+            # terminates the processes that are still running, if the loop is left by an exception
+            self.stop()
         #
         return result_list
 
-    def _run_parallel(self):
-        with NoDaeomonPool(self.num_processes) as process_pool:
-            results_iterator = process_pool.imap_unordered(self._worker, self.queued_tasks)
-            result_list = []
-            num_completed = num_completed_prev = 0
-            num_tasks = len(self.queued_tasks)
-            pbar_tasks = progress_step(iterable=range(num_tasks), desc=self.desc, position=1)
-            while num_completed < num_tasks:
-                # check if a result is available
-                try:
-                    result = results_iterator.__next__(timeout=self.maxinterval)
-                    result_list.append(result)
-                except multiprocessing.TimeoutError as e:
-                    pass
+    # the following functions run the tasks without blocking - for staged tasks (see PipelinedParallelRun)
+    def start(self, pbar_position=1, expected_tasks=0):
+        '''start the queued tasks. expected_tasks is the number of tasks that will be added while running -
+        each of them must be either added with add_task() or cancelled with cancel_expected_task().'''
+        self.mp_context = multiprocessing.get_context(_multiprocessing_default_context_type)
+        self.resumed_results = []
+        self.pending_tasks = collections.deque()
+        for task_entry in self._schedule_tasks():
+            result = self._resume_task(task_entry)
+            if result is not None:
+                self.resumed_results.append(result)
+            else:
+                self.pending_tasks.append(task_entry)
+            #
+        #
+        self.num_tasks = len(self.pending_tasks)
+        self.expected_tasks = expected_tasks
+        # each slot runs one task at a time in its worker - workers and running_tasks are indexed by the slot
+        self.workers = {}
+        self.running_tasks = {}
+        self.pbar_tasks = progress_step(iterable=range(self.num_tasks + self.expected_tasks), desc=self.desc,
+                                        position=pbar_position)
+
+    def stop(self):
+        self._terminate_tasks()
+        self._stop_workers()
+        self.pbar_tasks.close()
+        print('\n')
+
+    def _terminate_tasks(self):
+        # tasks that are still running when the run ends (only if it is interrupted) must not be left behind
+        for slot_index, running_task in self.running_tasks.items():
+            worker = self.workers.pop(slot_index)
+            if worker['process'].is_alive():
+                worker['process'].terminate()
+            #
+            worker['process'].join()
+            worker['task_conn'].close()
+            self._update_journal(running_task['task_entry']['task_id'], status='interrupted')
+        #
+        self.running_tasks = {}
+
+    def _stop_workers(self):
+        # the idle workers exit when they get None instead of a task
+        for worker in self.workers.values():
+            try:
+                worker['task_conn'].send(None)
+            except (OSError, ValueError):
+                pass
+            #
+        #
+        for worker in self.workers.values():
+            worker['process'].join(timeout=self.maxinterval)
+            if worker['process'].is_alive():
+                worker['process'].terminate()
+                worker['process'].join()
+            #
+            worker['task_conn'].close()
+        #
+        self.workers = {}
+
+    def _resume_task(self, task_entry):
+        # result of a task that was done by an earlier run - None if the task has to be run
+        resume_task = task_entry.get('resume_task', None)
+        if resume_task is None or not self.is_task_done(task_entry['task_id']):
+            return None
+        #
+        result = resume_task()
+        if result is not None:
+            print(log_color('\nINFO', 'task is done in an earlier run - will reuse', task_entry['task_id']))
+        #
+        return result
+
+    def add_task(self, task, task_id, cost=None):
+        '''add an expected task while running - it is placed among the pending tasks according to its cost'''
+        assert self.expected_tasks > 0, 'add_task() is called more times than the expected_tasks given in start()'
+        task_entry = self._schedule_tasks([dict(task=task, task_id=task_id, cost=cost)])[0]
+        self.pending_tasks.append(task_entry)
+        self.pending_tasks = collections.deque(sorted(self.pending_tasks, key=lambda t: t['cost'], reverse=True))
+        self.num_tasks += 1
+        self.expected_tasks -= 1
+
+    def cancel_expected_task(self):
+        '''an expected task will not be added - it is removed from the progress'''
+        assert self.expected_tasks > 0, 'no expected task is left to cancel'
+        self.expected_tasks -= 1
+        self.pbar_tasks.total = self.num_tasks + self.expected_tasks
+        self.pbar_tasks.refresh()
+
+    def start_pending_tasks(self):
+        # start tasks on the free slots
+        for slot_index in range(self.num_processes):
+            if slot_index not in self.running_tasks and len(self.pending_tasks) > 0:
+                self.running_tasks[slot_index] = self._start_task(slot_index, self.pending_tasks.popleft())
+            #
+        #
+
+    def get_wait_list(self):
+        '''the connections and sentinels of the running tasks - for multiprocessing.connection.wait()'''
+        return [self.workers[slot_index]['task_conn'] for slot_index in self.running_tasks] + \
+               [self.workers[slot_index]['process'].sentinel for slot_index in self.running_tasks]
+
+    def collect_done_tasks(self):
+        '''returns the tasks that are done and their results. crashed tasks are started again (if retries are left)'''
+        done_tasks = []
+        for slot_index, running_task in list(self.running_tasks.items()):
+            task_done, result = self._check_task(slot_index)
+            if not task_done:
+                continue
+            #
+            del self.running_tasks[slot_index]
+            task_entry = running_task['task_entry']
+            if result is not None:
+                self._update_journal(task_entry['task_id'], status='done', duration=time.time()-running_task['start_time'])
+                done_tasks.append((task_entry, result))
+                self.pbar_tasks.update(1)
+            elif task_entry['attempts'] <= self.max_retries:
+                print(log_color('\nWARNING', 'task process crashed - retrying', task_entry['task_id']))
+                self._update_journal(task_entry['task_id'], status='retrying')
+                self.pending_tasks.appendleft(task_entry)
+            else:
+                print(log_color('\nERROR', 'task process crashed', task_entry['task_id']))
+                self._update_journal(task_entry['task_id'], status='failed')
+                # same as what is returned when a task fails with an exception
+                done_tasks.append((task_entry, {}))
+                self.pbar_tasks.update(1)
+            #
+        #
+        return done_tasks
+
+    def _schedule_tasks(self, task_list=None):
+        # longest first. the durations in the journal are preferred to the given costs (which are estimates).
+        # tasks with unknown cost are given the median of the known costs (in the journal).
+        task_list = list(self.queued_tasks) if task_list is None else task_list
+        for task_entry in task_list:
+            task_entry['attempts'] = 0
+            journal_entry = self.journal.get(task_entry['task_id'], {})
+            task_entry['cost'] = journal_entry.get('duration', task_entry['cost'])
+        #
+        known_costs = [t['cost'] for t in task_list if t['cost'] is not None] or \
+                      [t['duration'] for t in self.journal.values() if isinstance(t, dict) and 'duration' in t]
+        known_costs = sorted(known_costs)
+        default_cost = known_costs[len(known_costs)//2] if len(known_costs) > 0 else 0.0
+        for task_entry in task_list:
+            task_entry['cost'] = task_entry['cost'] if task_entry['cost'] is not None else default_cost
+        #
+        # sorted() is stable, so tasks with equal cost remain in the order in which they were queued
+        task_list = sorted(task_list, key=lambda t: t['cost'], reverse=True)
+        return task_list
+
+    def _start_task(self, slot_index, task_entry):
+        worker = self._get_worker(slot_index)
+        worker['task_conn'].send(task_entry['task'])
+        task_entry['attempts'] += 1
+        self._update_journal(task_entry['task_id'], status='running', attempts=task_entry['attempts'],
+                             parallel_device=worker['parallel_device'])
+        return dict(task_entry=task_entry, start_time=time.time())
+
+    def _get_worker(self, slot_index):
+        # the worker of the slot - started if the slot does not have one yet (or it has crashed)
+        worker = self.workers.get(slot_index, None)
+        if worker is not None and worker['process'].is_alive():
+            return worker
+        elif worker is not None:
+            worker['process'].join()
+            worker['task_conn'].close()
+        #
+        parallel_device = self.parallel_devices[slot_index] if self.parallel_devices is not None else None
+        task_conn, worker_conn = self.mp_context.Pipe(duplex=True)
+        process = self.mp_context.Process(target=_run_task_worker, args=(parallel_device, worker_conn))
+        process.start()
+        # close the copy of the worker end in this process, so that a crash of the worker is seen as EOF
+        worker_conn.close()
+        worker = dict(process=process, task_conn=task_conn, parallel_device=parallel_device)
+        self.workers[slot_index] = worker
+        return worker
+
+    def _check_task(self, slot_index):
+        # returns (task_done, result). result is None if the worker exited without sending a result
+        worker = self.workers[slot_index]
+        try:
+            if worker['task_conn'].poll():
+                return True, worker['task_conn'].recv()
+            #
+        except (EOFError, OSError):
+            pass
+        #
+        if not worker['process'].is_alive():
+            # the worker has crashed - the slot gets a new one for its next task
+            worker['process'].join()
+            worker['task_conn'].close()
+            del self.workers[slot_index]
+            return True, None
+        #
+        return False, None
+
+    def _load_journal(self):
+        if self.journal_file is None or not os.path.exists(self.journal_file):
+            return {}
+        #
+        try:
+            with open(self.journal_file) as fp:
+                journal = yaml.safe_load(fp)
+            #
+        except (OSError, yaml.YAMLError):
+            journal = None
+        #
+        return journal if isinstance(journal, dict) else {}
+
+    def _update_journal(self, task_id, **kwargs):
+        if self.journal_file is None:
+            return
+        #
+        journal_entry = self.journal.get(task_id, {})
+        journal_entry.update({k:v for k, v in kwargs.items() if v is not None})
+        self.journal[task_id] = journal_entry
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_file)), exist_ok=True)
+        # write to a temporary file and rename - so that the journal is always complete
+        journal_file_tmp = self.journal_file + '.tmp'
+        with open(journal_file_tmp, 'w') as fp:
+            yaml.safe_dump(self.journal, fp, sort_keys=False)
+        #
+        os.replace(journal_file_tmp, self.journal_file)
+
+
+class PipelinedParallelRun:
+    """
+    Runs tasks that have two stages (eg. import and inference of a model), each stage in its own ParallelRun -
+    so that each stage has its own slots (number of processes, parallel_devices). The second stage of a task is
+    queued as soon as its first stage is done - so the second stage of a task runs while the first stage of the
+    next tasks are running. The second stage is not run if the first stage crashed or returned an empty result.
+    Returns the results of the second stage (or the empty result of the first stage), in the order of completion.
+    A task that the journal of the second stage records as done is not run again, if resume_task is given
+    (see ParallelRun) - the result of resume_task() is used instead.
+    """
+    def __init__(self, stage_runs, maxinterval=10.0):
+        assert len(stage_runs) == 2, f'two stages are supported, got {len(stage_runs)}'
+        self.stage_runs = stage_runs
+        self.maxinterval = maxinterval
+        self.second_stage_tasks = {}
+
+    def enqueue(self, stage_tasks, task_id=None, costs=None, resume_task=None):
+        task_id = task_id if task_id is not None else str(len(self.second_stage_tasks))
+        first_stage_task, second_stage_task = stage_tasks
+        first_stage_cost, second_stage_cost = costs if costs is not None else (None, None)
+        # the first stage resumes the task only if the second stage is also done
+        resume_task = functools.partial(self._resume_task, task_id, resume_task) if resume_task is not None else None
+        self.stage_runs[0].enqueue(first_stage_task, task_id=task_id, cost=first_stage_cost, resume_task=resume_task)
+        self.second_stage_tasks[task_id] = (second_stage_task, second_stage_cost)
+
+    def run(self):
+        first_run, second_run = self.stage_runs
+        assert len(first_run.queued_tasks) > 0, f'at least one task must be queued, got {len(first_run.queued_tasks)}'
+        first_run.start(pbar_position=1)
+        result_list = list(first_run.resumed_results)
+        num_tasks = len(first_run.resumed_results) + first_run.num_tasks
+        try:
+            second_run.start(pbar_position=2, expected_tasks=first_run.num_tasks)
+            while len(result_list) < num_tasks:
+                first_run.start_pending_tasks()
+                second_run.start_pending_tasks()
+                wait_list = first_run.get_wait_list() + second_run.get_wait_list()
+                multiprocessing.connection.wait(wait_list, timeout=self.maxinterval)
+                for task_entry, result in first_run.collect_done_tasks():
+                    if result:
+                        second_stage_task, second_stage_cost = self.second_stage_tasks[task_entry['task_id']]
+                        second_run.add_task(second_stage_task, task_entry['task_id'], cost=second_stage_cost)
+                    else:
+                        result_list.append(result)
+                        second_run.cancel_expected_task()
+                    #
                 #
-                num_completed = len(result_list)
-                if num_completed > num_completed_prev:
-                    pbar_tasks.update(num_completed-num_completed_prev)
-                    num_completed_prev = num_completed
+                for task_entry, result in second_run.collect_done_tasks():
+                    result_list.append(result)
                 #
             #
-            pbar_tasks.close()
-            print('\n')
-            return result_list
-
-    def _worker(self, task):
-        if self.parallel_devices is not None:
-            current_process = multiprocessing.current_process()
-            process_index = current_process._identity[0] - 1
-            # if a task crashes, the process will be re-created and will have a new id assigned
-            # hence, the process_index can be higher than num_processes
-            parallel_device = self.parallel_devices[process_index%self.num_processes]
-            os.environ['CUDA_VISIBLE_DEVICES'] = str(parallel_device)
-            print(log_color('\nINFO', 'starting process on parallel_device', parallel_device))
-        #
-        return task()
+        finally:
+            # terminates the processes that are still running, if the loop is left by an exception
+            if hasattr(second_run, 'pbar_tasks'):
+                second_run.stop()
+            #
+            first_run.stop()
+        #
+        return result_list
+
+    def _resume_task(self, task_id, resume_task):
+        return resume_task() if self.stage_runs[1].is_task_done(task_id) else None
+
+
+def _run_task_worker(parallel_device, task_conn):
+    if parallel_device is not None:
+        os.environ['CUDA_VISIBLE_DEVICES'] = str(parallel_device)
+        print(log_color('\nINFO', 'starting process on parallel_device', parallel_device))
+    #
+    # run the tasks given by ParallelRun until it gives None (or it is gone)
+    while True:
+        try:
+            task = task_conn.recv()
+        except EOFError:
+            break
+        #
+        if task is None:
+            break
+        #
+        result = task()
+        task_conn.send(result)
+    #
+    task_conn.close()
 
 
 class MultiProcessingTaskMaker:
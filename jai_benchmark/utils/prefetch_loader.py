@@ -0,0 +1,179 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import time
+import collections
+import itertools
+import multiprocessing
+import concurrent.futures
+from .parallel_run import _multiprocessing_default_context_type
+from .preprocess_cache import PreprocessCache
+
+
+# state held by each prefetch worker process.
+# it is filled once by the pool initializer, so that the dataset and the
+# transforms are not pickled again for every frame that is submitted.
+_prefetch_worker_state = {}
+
+
+def _prefetch_worker_init(dataset, transforms, cache):
+    _prefetch_worker_state['dataset'] = dataset
+    _prefetch_worker_state['transforms'] = transforms
+    _prefetch_worker_state['cache'] = cache
+
+
+def _prefetch_worker_load(data_index):
+    return load_frame(_prefetch_worker_state['dataset'], _prefetch_worker_state['transforms'], data_index,
+                      cache=_prefetch_worker_state['cache'])
+
+
+def load_frame(dataset, transforms, data_index, cache=None):
+    # the time taken to read and to preprocess the frame are returned in the info_dict
+    start_time = time.perf_counter()
+    data = dataset[data_index]
+    read_time = time.perf_counter() - start_time
+    if cache is not None:
+        cached_frame = cache.load(data)
+        if cached_frame is not None:
+            data, info_dict = cached_frame
+            info_dict.update(read_time=read_time, preprocess_time=time.perf_counter()-start_time-read_time)
+            return data, info_dict
+        #
+    #
+    data_path = data
+    info_dict = {}
+    if transforms is not None:
+        data, info_dict = transforms(data, info_dict)
+    #
+    if cache is not None:
+        cache.save(data_path, data, info_dict)
+    #
+    info_dict.update(read_time=read_time, preprocess_time=time.perf_counter()-start_time-read_time)
+    return data, info_dict
+
+
+class PrefetchLoader:
+    """
+    Reads and preprocesses frames of a dataset ahead of their use.
+    Frames are returned in the order of indices as (data_index, data, info_dict).
+
+    num_workers=0 reads the frames in the calling thread - same as a plain loop.
+    worker_type can be 'thread' or 'process'. 'thread' is sufficient when most of the time
+    is spent inside PIL/cv2/numpy calls that release the GIL. 'process' requires the dataset
+    and the transforms to be picklable.
+    prefetch_frames is the maximum number of frames that are kept ready in the queue.
+    cache is an optional PreprocessCache that is looked up before reading and preprocessing a frame.
+    """
+    def __init__(self, dataset, transforms, indices, num_workers=0, worker_type='thread', prefetch_frames=None,
+                 cache=None):
+        assert worker_type in ('thread', 'process'), f'worker_type must be one of thread or process. got {worker_type}'
+        self.dataset = dataset
+        self.transforms = transforms
+        self.indices = indices
+        self.num_workers = num_workers if num_workers is not None else 0
+        self.worker_type = worker_type
+        self.prefetch_frames = prefetch_frames if prefetch_frames is not None else 2*self.num_workers
+        self.cache = cache
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        if self.num_workers <= 0:
+            for data_index in self.indices:
+                data, info_dict = load_frame(self.dataset, self.transforms, data_index, cache=self.cache)
+                yield data_index, data, info_dict
+            #
+            return
+        #
+        executor = self._create_executor()
+        queued_frames = collections.deque()
+        try:
+            indices_iter = iter(self.indices)
+            for data_index in itertools.islice(indices_iter, max(self.prefetch_frames, 1)):
+                queued_frames.append((data_index, self._submit(executor, data_index)))
+            #
+            while len(queued_frames) > 0:
+                data_index, future = queued_frames.popleft()
+                # keep the queue full, before waiting for the current frame
+                for next_index in itertools.islice(indices_iter, 1):
+                    queued_frames.append((next_index, self._submit(executor, next_index)))
+                #
+                data, info_dict = future.result()
+                yield data_index, data, info_dict
+            #
+        finally:
+            # the consumer may stop early (or raise) - drop the frames that are not yet started
+            for _, future in queued_frames:
+                future.cancel()
+            #
+            executor.shutdown(wait=True)
+        #
+
+    def _create_executor(self):
+        if self.worker_type == 'process':
+            mp_context = multiprocessing.get_context(_multiprocessing_default_context_type)
+            return concurrent.futures.ProcessPoolExecutor(max_workers=self.num_workers, mp_context=mp_context,
+                        initializer=_prefetch_worker_init, initargs=(self.dataset, self.transforms, self.cache))
+        else:
+            return concurrent.futures.ThreadPoolExecutor(max_workers=self.num_workers)
+        #
+
+    def _submit(self, executor, data_index):
+        if self.worker_type == 'process':
+            return executor.submit(_prefetch_worker_load, data_index)
+        else:
+            return executor.submit(load_frame, self.dataset, self.transforms, data_index, cache=self.cache)
+        #
+
+
+class CalibrationData:
+    """
+    The first num_frames frames of a dataset, preprocessed with transforms - to be given as
+    calib_data to session.import_model(). The frames are streamed: they are read and preprocessed
+    by the workers of a PrefetchLoader while the session consumes them, so that they are not
+    all held in memory - except by TVMDLRSession, whose TIDL compiler takes the calibration data as a list.
+    The tensors can be persisted in cache_path (a PreprocessCache that stores only the tensors) -
+    the key is the input file and the transforms signature, so models that share a calibration
+    dataset and preprocessing reuse them without decoding the images again.
+
+    This can be iterated more than once - each iteration reads the frames again (or from the cache).
+    """
+    def __init__(self, dataset, transforms, num_frames, num_workers=0, worker_type='thread', prefetch_frames=None,
+                 cache_path=None):
+        cache = PreprocessCache(cache_path, transforms, save_info_dict=False) if cache_path is not None else None
+        self.loader = PrefetchLoader(dataset, transforms, range(num_frames), num_workers=num_workers,
+                                     worker_type=worker_type, prefetch_frames=prefetch_frames, cache=cache)
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for data_index, data, info_dict in self.loader:
+            yield data
+        #
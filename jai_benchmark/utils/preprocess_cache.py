@@ -0,0 +1,117 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+from .misc_utils import pretty_object, as_list
+
+
+def transforms_signature(transforms):
+    '''a string that describes the parameters of each transform in the chain.
+    two chains with the same signature produce the same tensor for the same input.'''
+    transforms_list = transforms.transforms if hasattr(transforms, 'transforms') else as_list(transforms)
+    signature_list = [[t.__class__.__name__, pretty_object(vars(t))] for t in transforms_list]
+    return json.dumps(signature_list, sort_keys=True, default=str)
+
+
+class PreprocessCache:
+    """
+    On-disk cache of preprocessed input tensors.
+
+    The key of each entry is a hash of the input file (path, size, modification time)
+    and of the transforms_signature() of the preprocess chain - so models that use
+    identical preprocessing share the entries. Tensors are stored as .npy files and
+    are loaded memory-mapped. Files are written to a temporary name and moved in place,
+    so several processes (for example ParallelRun workers) can share the same cache_path.
+
+    Only single tensor outputs are cached. The info_dict is stored without the decoded
+    image (info_dict['data']) - so this is suitable only when postprocess does not need it.
+    With save_info_dict=False only the tensors are stored (eg. for calibration, where the
+    info_dict is not used) - such a cache_path must not be shared with one that stores it.
+    """
+    def __init__(self, cache_path, transforms, mmap_mode='r', save_info_dict=True):
+        self.cache_path = os.path.abspath(cache_path)
+        self.mmap_mode = mmap_mode
+        self.save_info_dict = save_info_dict
+        self.transforms_hash = hashlib.sha1(transforms_signature(transforms).encode()).hexdigest()
+
+    def get_cache_file(self, data_path):
+        if not isinstance(data_path, str) or not os.path.isfile(data_path):
+            return None
+        #
+        data_path = os.path.abspath(data_path)
+        data_stat = os.stat(data_path)
+        key_str = f'{data_path}:{data_stat.st_size}:{data_stat.st_mtime_ns}:{self.transforms_hash}'
+        key = hashlib.sha1(key_str.encode()).hexdigest()
+        return os.path.join(self.cache_path, key[:2], key)
+
+    def load(self, data_path):
+        cache_file = self.get_cache_file(data_path)
+        if cache_file is None or not os.path.exists(cache_file + '.json'):
+            return None
+        #
+        try:
+            tensor = np.load(cache_file + '.npy', mmap_mode=self.mmap_mode)
+            with open(cache_file + '.json') as fp:
+                info_dict = json.load(fp)
+            #
+        except (OSError, ValueError):
+            return None
+        #
+        info_dict['data'] = None
+        return tensor, info_dict
+
+    def save(self, data_path, tensor, info_dict):
+        cache_file = self.get_cache_file(data_path)
+        if cache_file is None or not isinstance(tensor, np.ndarray):
+            return False
+        #
+        info_dict = {k:v for k, v in info_dict.items() if k != 'data'} if self.save_info_dict else {}
+        if any(isinstance(v, np.ndarray) for v in info_dict.values()):
+            return False
+        #
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        # the json file is written last, as its presence marks a complete entry
+        self._write_atomic(cache_file + '.npy', lambda fp: np.save(fp, np.ascontiguousarray(tensor)))
+        self._write_atomic(cache_file + '.json', lambda fp: fp.write(json.dumps(pretty_object(info_dict)).encode()))
+        return True
+
+    def _write_atomic(self, file_name, write_func):
+        fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(file_name), prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                write_func(fp)
+            #
+            os.replace(temp_name, file_name)
+        except:
+            os.remove(temp_name)
+            raise
+        #
@@ -0,0 +1,148 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import glob
+import pickle
+import sqlite3
+import yaml
+from .logger_utils import log_color
+
+
+class ResultsStore:
+    """
+    SQLite index of the result.yaml files in the run_dirs of a work_dir.
+
+    Each entry is keyed by the run_dir and holds the artifact_id, the modification time of
+    the result.yaml it was read from and the full result (params and result dict) pickled - as it is
+    read from result.yaml (eg. int dict keys remain int), so that results.yaml matches the result.yaml files.
+    AccuracyPipeline adds the entry when it writes result.yaml and update() imports the
+    result.yaml files that are new or modified since they were last read - so reading the
+    results of a work_dir need not parse every result.yaml again.
+
+    result.yaml remains the source of the results - the database file can be deleted
+    anytime and it will be re-created by update().
+    """
+    # increment this if the format of the entries changes - a database of another version is made again
+    schema_version = 2
+
+    def __init__(self, db_file, timeout=60.0):
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file, timeout=timeout)
+        # several processes (eg. ParallelRun workers) write into the same database
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            if self.connection.execute('PRAGMA user_version').fetchone()[0] != self.schema_version:
+                self.connection.execute('DROP TABLE IF EXISTS results')
+                self.connection.execute(f'PRAGMA user_version = {self.schema_version}')
+            #
+            self.connection.execute('CREATE TABLE IF NOT EXISTS results ('
+                'run_dir TEXT PRIMARY KEY, artifact_id TEXT, mtime_ns INTEGER, result BLOB)')
+        #
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        #
+
+    def put(self, run_dir, param_result, mtime_ns):
+        '''param_result must be as it is read from the result.yaml (see write_results_store)'''
+        run_dir = os.path.basename(run_dir)
+        session = param_result['session']
+        artifact_id = f"{session['model_id']}_{session['session_name']}"
+        result_bytes = pickle.dumps(param_result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO results (run_dir, artifact_id, mtime_ns, result) VALUES (?, ?, ?, ?)',
+                (run_dir, artifact_id, mtime_ns, result_bytes))
+        #
+
+    def update(self, work_dir):
+        '''import the result.yaml files of work_dir that are not in the database or have been modified.
+        entries of run_dirs that no longer have a result.yaml are removed.'''
+        mtime_dict = dict(self.connection.execute('SELECT run_dir, mtime_ns FROM results'))
+        run_dirs = glob.glob(f'{work_dir}/*')
+        run_dirs = [f for f in run_dirs if os.path.isdir(f)]
+        found_run_dirs = set()
+        for run_dir in run_dirs:
+            result_yaml = os.path.join(run_dir, 'result.yaml')
+            try:
+                mtime_ns = os.stat(result_yaml).st_mtime_ns
+            except OSError:
+                continue
+            #
+            run_dir_base = os.path.basename(run_dir)
+            found_run_dirs.add(run_dir_base)
+            if mtime_dict.get(run_dir_base, None) == mtime_ns:
+                continue
+            #
+            try:
+                with open(result_yaml) as fp:
+                    param_result = yaml.safe_load(fp)
+                #
+                self.put(run_dir, param_result, mtime_ns)
+            except:
+                pass
+            #
+        #
+        removed_run_dirs = [(run_dir,) for run_dir in mtime_dict.keys() if run_dir not in found_run_dirs]
+        if len(removed_run_dirs) > 0:
+            with self.connection:
+                self.connection.executemany('DELETE FROM results WHERE run_dir = ?', removed_run_dirs)
+            #
+        #
+
+    def get_results(self):
+        '''returns a dict of results, with artifact_id as the key'''
+        results = {}
+        for artifact_id, result_bytes in self.connection.execute('SELECT artifact_id, result FROM results ORDER BY run_dir'):
+            results[artifact_id] = pickle.loads(result_bytes)
+        #
+        return results
+
+
+def write_results_store(result_yaml, param_result):
+    '''add the result that has been written to result_yaml into the ResultsStore of its work_dir.
+    failure to write it is not fatal - update() will import the result.yaml later.'''
+    run_dir = os.path.dirname(result_yaml)
+    db_file = os.path.join(os.path.dirname(run_dir), 'results.db')
+    # the result as it is read back from result_yaml - eg. tuples become lists
+    param_result = yaml.safe_load(yaml.safe_dump(param_result, sort_keys=False))
+    try:
+        with ResultsStore(db_file) as results_store:
+            results_store.put(run_dir, param_result, os.stat(result_yaml).st_mtime_ns)
+        #
+    except (sqlite3.Error, KeyError, TypeError) as e:
+        print(log_color('WARNING', f'could not write the result to {db_file}', str(e)))
+    #
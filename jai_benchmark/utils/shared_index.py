@@ -0,0 +1,175 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import pickle
+import hashlib
+import tempfile
+import collections.abc
+import numpy as np
+
+__all__ = ['SharedStringList', 'SharedIndexStore']
+
+
+def _write_atomic(file_name, write_func):
+    fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(file_name), prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            write_func(fp)
+        #
+        os.replace(temp_name, file_name)
+    except:
+        os.remove(temp_name)
+        raise
+    #
+
+
+class SharedStringList(collections.abc.Sequence):
+    """
+    Read-only list of strings packed into memory-mapped files - the utf-8 bytes of all the strings
+    in one array and the offset of each string in another. Processes that open the same files
+    (eg. ParallelRun workers) read the same physical pages instead of each having a copy of the list.
+    It is pickled as the file name, so it is cheap to send to another process.
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._open()
+
+    @classmethod
+    def create(cls, file_name, strings):
+        encoded = [s.encode('utf-8', 'surrogateescape') for s in strings]
+        offsets = np.zeros((len(encoded)+1,), dtype=np.int64)
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        # the offsets are written last, as its presence marks complete files
+        _write_atomic(file_name + '.data.npy', lambda fp: np.save(fp, data))
+        _write_atomic(file_name + '.offsets.npy', lambda fp: np.save(fp, offsets))
+        return cls(file_name)
+
+    def _open(self):
+        self.offsets = np.load(self.file_name + '.offsets.npy', mmap_mode='r')
+        # an empty array cannot be memory-mapped
+        self.data = np.load(self.file_name + '.data.npy', mmap_mode='r') if self.offsets[-1] > 0 else \
+            np.zeros((0,), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        #
+        num_strings = len(self)
+        index = index + num_strings if index < 0 else index
+        if index < 0 or index >= num_strings:
+            raise IndexError('SharedStringList index out of range')
+        #
+        start, end = self.offsets[index], self.offsets[index+1]
+        return self.data[start:end].tobytes().decode('utf-8', 'surrogateescape')
+
+    def __getstate__(self):
+        return {'file_name': self.file_name}
+
+    def __setstate__(self, state):
+        self.file_name = state['file_name']
+        self._open()
+
+
+class SharedIndexStore:
+    """
+    Folder of the indices (eg. file lists) of objects such as datasets, shared by the processes that use them.
+
+    save() packs the attributes of the object that are lists of strings into SharedStringLists and stores
+    the rest of the object pickled - load() gives back the object with those lists memory-mapped. Only those
+    lists are shared - the other attributes (eg. the annotation dicts of COCO datasets, which the pycocotools
+    api needs as python objects) are unpickled into each process, which still saves parsing the annotations.
+    The key of an entry is a hash of the given key and of the modification times of the source_paths (eg. the
+    dataset folder), so that an entry is not used once its sources have changed. Each entry starts with its
+    format - the store, the type of the object and schema_version - and an entry of another format, or one that
+    cannot be unpickled (eg. the class has changed), is not used: load() returns None and the caller makes it again.
+    Files are written to a temporary name and moved in place, so several processes can share the same index_path.
+    """
+    # increment this if the layout of the entries changes
+    schema_version = 1
+
+    def __init__(self, index_path):
+        self.index_path = os.path.abspath(index_path)
+
+    def get_index_file(self, key, source_paths=None):
+        source_stats = []
+        for source_path in (source_paths or []):
+            source_mtime = os.stat(source_path).st_mtime_ns if os.path.exists(source_path) else None
+            source_stats.append(f'{os.path.abspath(source_path)}:{source_mtime}')
+        #
+        key_str = ':'.join([key, f'v{self.schema_version}'] + source_stats)
+        return os.path.join(self.index_path, hashlib.sha1(key_str.encode()).hexdigest())
+
+    def get_format(self, obj_type):
+        return dict(store=_get_qualname(type(self)), type=_get_qualname(obj_type), version=self.schema_version)
+
+    def load(self, key, source_paths=None, obj_type=None):
+        '''returns the stored object, or None if there is no usable entry. obj_type is the expected type of the object'''
+        index_file = self.get_index_file(key, source_paths)
+        if not os.path.exists(index_file + '.pkl'):
+            return None
+        #
+        try:
+            with open(index_file + '.pkl', 'rb') as fp:
+                entry_format = pickle.load(fp)
+                if not isinstance(entry_format, dict) or entry_format.get('store') != _get_qualname(type(self)) or \
+                        entry_format.get('version') != self.schema_version or \
+                        (obj_type is not None and entry_format.get('type') != _get_qualname(obj_type)):
+                    return None
+                #
+                obj = pickle.load(fp)
+            #
+        except Exception:
+            # eg. the class of the object has been changed or moved - the entry is made again
+            return None
+        #
+        return obj if (obj_type is None or isinstance(obj, obj_type)) else None
+
+    def save(self, key, obj, source_paths=None):
+        index_file = self.get_index_file(key, source_paths)
+        os.makedirs(self.index_path, exist_ok=True)
+        for attr_name, attr_value in list(vars(obj).items()):
+            if isinstance(attr_value, list) and len(attr_value) > 0 and all(isinstance(v, str) for v in attr_value):
+                setattr(obj, attr_name, SharedStringList.create(f'{index_file}.{attr_name}', attr_value))
+            #
+        #
+        def _write_entry(fp):
+            pickle.dump(self.get_format(type(obj)), fp, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(obj, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        #
+        # the pickled object is written last, as its presence marks a complete entry
+        _write_atomic(index_file + '.pkl', _write_entry)
+        return obj
+
+
+def _get_qualname(obj_type):
+    return f'{obj_type.__module__}.{obj_type.__qualname__}'
@@ -28,6 +28,8 @@
 
 import time
 import sys
+import math
+import numpy as np
 from colorama import Fore
 
 
@@ -93,3 +95,55 @@ def display_time_bar(desc, num_completed, total, start_time, end_time, file=None
                    f'[{time_taken_str}<{eta_str} {it_per_sec}]')
     #
     file.flush()
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies (in seconds) with logarithmically spaced bins - bins_per_decade bins in each decade
+    from min_value to max_value, so that the relative error of the percentiles is the same for all latencies
+    (about 12% with the default of 20 bins per decade). Values outside the range go into the first or the last bin.
+    The memory used does not depend on the number of values added.
+    """
+    def __init__(self, min_value=1e-6, max_value=1e3, bins_per_decade=20):
+        self.min_value = min_value
+        self.bins_per_decade = bins_per_decade
+        self.num_bins = int(math.ceil(math.log10(max_value/min_value)*bins_per_decade)) + 1
+        self.counts = np.zeros(self.num_bins, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        bin_index = int(math.log10(value/self.min_value)*self.bins_per_decade) + 1 if value > self.min_value else 0
+        self.counts[min(bin_index, self.num_bins-1)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def bin_edge(self, bin_index):
+        # upper edge of the bin
+        return self.min_value * 10.0**(bin_index/self.bins_per_decade)
+
+    def percentile(self, q):
+        if self.count == 0:
+            return None
+        #
+        rank = max(int(math.ceil(q*self.count/100.0)), 1)
+        bin_index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        # the last bin has no upper edge
+        return min(self.bin_edge(bin_index), self.max) if bin_index < self.num_bins-1 else self.max
+
+    def get_stats(self, scale=1000.0, precision=4):
+        '''mean, p50, p90, p99 and max - multiplied by scale (default: in ms)'''
+        if self.count == 0:
+            return {}
+        #
+        stats = {'mean': self.total/self.count, 'p50': self.percentile(50), 'p90': self.percentile(90),
+                 'p99': self.percentile(99), 'max': self.max}
+        return {k: round(v*scale, precision) for k, v in stats.items()}
+
+    def get_dict(self):
+        '''a compact description to be written out - only the non empty bins, with their upper edge (in ms) as the key'''
+        nonzero_bins = np.nonzero(self.counts)[0]
+        histogram = {float(f'{self.bin_edge(b)*1000.0:.4g}'): int(self.counts[b]) for b in nonzero_bins}
+        return {'count': self.count, 'stats_ms': self.get_stats(), 'histogram_ms': histogram}
@@ -29,7 +29,7 @@
 import os
 import sys
 import argparse
-from jai_benchmark import *
+from jai_benchmark import utils, config_settings, tools
 
 
 if __name__ == '__main__':
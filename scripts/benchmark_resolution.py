@@ -34,7 +34,7 @@ import warnings
 import copy
 import onnx
 import warnings
-from jai_benchmark import *
+from jai_benchmark import utils, config_settings, tools
 
 # the cwd must be the root of the respository
 if os.path.split(os.getcwd())[-1] == 'scripts':
@@ -0,0 +1,137 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# measures the time taken to import the modules of jai_benchmark (which each ParallelRun worker pays again)
+# each module is imported in a fresh python process with -X importtime, which also gives the cost of each
+# imported module. the results can be written to a yaml file and compared with those of an earlier run.
+# example: python3 ./scripts/benchmark_startup.py --output_file ./work_dirs/startup.yaml
+# example: python3 ./scripts/benchmark_startup.py --baseline_file ./work_dirs/startup.yaml
+
+import os
+import sys
+import re
+import argparse
+import subprocess
+import yaml
+
+
+default_modules = ['jai_benchmark', 'jai_benchmark.config_settings', 'jai_benchmark.tools',
+                   'jai_benchmark.datasets', 'jai_benchmark.pipelines', 'jai_benchmark.sessions']
+
+
+def measure_import(module_name, num_repeats):
+    '''returns the import time of module_name in ms (minimum over the repeats) and the cumulative import time
+    of each module that was imported by it (from the fastest run) - as reported by python -X importtime'''
+    best_time_ms = None
+    best_module_times = None
+    for _ in range(num_repeats):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        if proc.returncode != 0:
+            error_lines = [line for line in proc.stderr.splitlines() if not line.startswith('import time:')]
+            print(f'could not import {module_name}:\n' + '\n'.join(error_lines[-5:]))
+            return None, None
+        #
+        # lines are of the form - import time: self [us] | cumulative [us] | imported package
+        # a module is listed after the modules that it imported, which have a larger indentation.
+        import_lines = []
+        for line in proc.stderr.splitlines():
+            match = re.match(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)', line)
+            if match is not None:
+                import_lines.append((len(match.group(3)), match.group(4), int(match.group(2)) / 1000.0))
+            #
+        #
+        module_index = [i for i, (_, m, _) in enumerate(import_lines) if m == module_name][-1]
+        module_indent, _, time_ms = import_lines[module_index]
+        module_times = {}
+        for indent, m, t in reversed(import_lines[:module_index]):
+            if indent <= module_indent:
+                break
+            #
+            module_times[m] = max(t, module_times.get(m, 0.0))
+        #
+        if best_time_ms is None or time_ms < best_time_ms:
+            best_time_ms = time_ms
+            best_module_times = module_times
+        #
+    #
+    return best_time_ms, best_module_times
+
+
+if __name__ == '__main__':
+    # the cwd must be the root of the respository
+    if os.path.split(os.getcwd())[-1] == 'scripts':
+        os.chdir('../')
+    #
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', type=str, nargs='*', default=default_modules)
+    parser.add_argument('--num_repeats', type=int, default=3)
+    parser.add_argument('--num_top', type=int, default=10)
+    parser.add_argument('--output_file', type=str, default=None)
+    parser.add_argument('--baseline_file', type=str, default=None)
+    cmds = parser.parse_args()
+
+    baseline = None
+    if cmds.baseline_file is not None:
+        with open(cmds.baseline_file) as fp:
+            baseline = yaml.safe_load(fp)
+        #
+    #
+
+    # the modules are imported from the repository, not from an installed version
+    os.environ['PYTHONPATH'] = os.pathsep.join([os.getcwd()] + [p for p in [os.environ.get('PYTHONPATH')] if p])
+
+    results = {}
+    for module_name in cmds.modules:
+        time_ms, module_times = measure_import(module_name, cmds.num_repeats)
+        if time_ms is None:
+            continue
+        #
+        # the top level packages (other than jai_benchmark) imported by the module that take the most time
+        top_modules = {m:t for m,t in module_times.items() if '.' not in m and m != 'jai_benchmark'}
+        top_modules = dict(sorted(top_modules.items(), key=lambda kv:kv[1], reverse=True)[:cmds.num_top])
+        results[module_name] = {'import_time_ms': round(time_ms, 1), 'num_modules': len(module_times),
+                                'top_modules_ms': {m:round(t, 1) for m,t in top_modules.items()}}
+
+        time_str = f'{module_name}: {time_ms:.1f} ms, {len(module_times)} modules'
+        if baseline is not None and module_name in baseline:
+            baseline_ms = baseline[module_name]['import_time_ms']
+            time_str += f' (baseline: {baseline_ms:.1f} ms, change: {time_ms-baseline_ms:+.1f} ms)'
+        #
+        print(time_str)
+        for m, t in top_modules.items():
+            print(f'    {m}: {t:.1f} ms')
+        #
+    #
+
+    if cmds.output_file is not None:
+        with open(cmds.output_file, 'w') as fp:
+            yaml.safe_dump(results, fp, sort_keys=False)
+        #
+    #
@@ -0,0 +1,222 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# microbenchmark of the preprocess and postprocess transforms - on synthetic images and tensors,
+# so that no dataset, model or runtime is needed. each transform is timed on the input that it gets in
+# its chain, and each chain is also timed as a whole. the memory allocated by each call is measured with tracemalloc
+# as the peak of the memory allocated during the call (this covers numpy arrays, but not the internal buffers of PIL and cv2).
+# the results can be written to a yaml file and later runs compared against it, to catch regressions.
+# example: python3 ./scripts/benchmark_transforms.py --output_file ./work_dirs/transforms_baseline.yaml
+# example: python3 ./scripts/benchmark_transforms.py --baseline_file ./work_dirs/transforms_baseline.yaml
+# example: python3 ./scripts/benchmark_transforms.py --selection preprocess_*
+
+import os
+import sys
+import copy
+import time
+import fnmatch
+import argparse
+import tempfile
+import tracemalloc
+import yaml
+import numpy as np
+import PIL.Image
+from jai_benchmark import config_dict, preprocess, postprocess
+
+
+def synthetic_image(height, width, seed=0):
+    # smooth gradients with noise - closer to the compression ratio of natural images than pure noise
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:height, :width]
+    image = np.stack([xx*255.0/width, yy*255.0/height, (xx+yy)*127.0/(width+height)], axis=-1)
+    image = image + rng.normal(scale=8.0, size=image.shape)
+    return image.clip(0, 255).astype(np.uint8)
+
+
+def synthetic_keypoint_outputs(height, width, num_joints=17, num_people=5, seed=0):
+    # heatmaps with a gaussian peak for each joint of each person, followed by the tags (one per joint)
+    rng = np.random.default_rng(seed)
+    heatmaps = rng.random((1, num_joints, height, width), dtype=np.float32) * 0.05
+    tags = rng.normal(scale=0.3, size=(1, num_joints, height, width)).astype(np.float32)
+    yy, xx = np.mgrid[:height, :width]
+    for person in range(num_people):
+        tag = rng.normal() * 3
+        for joint in range(num_joints):
+            cy, cx = rng.uniform(0, height), rng.uniform(0, width)
+            peak = np.exp(-((yy-cy)**2 + (xx-cx)**2) / 4.0) * rng.uniform(0.2, 1.0)
+            heatmaps[0, joint] = np.maximum(heatmaps[0, joint], peak)
+            tags[0, joint][peak > 0.1] = tag
+        #
+    #
+    return [np.concatenate([heatmaps, tags], axis=1)]
+
+
+def get_benchmark_chains(settings, image_file, image, image_size):
+    '''returns a dict of name: (transforms, input, info_dict). the input and info_dict are copied for each call'''
+    height, width = image_size
+    resize, crop = 256, 224
+    preprocess_transforms = preprocess.PreProcessTransforms(settings)
+    postprocess_transforms = postprocess.PostProcessTransforms(settings)
+    rng = np.random.default_rng(0)
+
+    # the info_dict that postprocess gets from preprocess
+    image_info_dict = {'data': image, 'data_shape': image.shape, 'data_path': image_file,
+                       'resize_shape': (crop, crop, 3), 'resize_border': (0, 0, 0, 0), 'outputs_flip': None}
+
+    # detection outputs (onnx): boxes, labels, scores
+    num_boxes = 200
+    boxes = np.sort(rng.random((1, num_boxes, 4), dtype=np.float32).reshape(1, num_boxes, 2, 2), axis=2).reshape(1, num_boxes, 4)
+    labels = rng.integers(0, 80, size=(1, num_boxes, 1)).astype(np.float32)
+    scores = rng.random((1, num_boxes, 1), dtype=np.float32)
+    detection_outputs = [boxes, labels, scores]
+
+    # segmentation outputs: class scores at a quarter of the input size
+    segmentation_outputs = [rng.random((1, 21, crop//4, crop//4), dtype=np.float32)]
+    keypoint_outputs = synthetic_keypoint_outputs(crop//4, crop//4)
+
+    chains = {
+        'preprocess_pil': (preprocess_transforms.get_transform_onnx(resize=resize, crop=crop, backend='pil'),
+                           image_file, {}),
+        'preprocess_cv2': (preprocess_transforms.get_transform_onnx(resize=resize, crop=crop, backend='cv2'),
+                           image_file, {}),
+        'preprocess_tflite': (preprocess_transforms.get_transform_tflite(resize=resize, crop=crop),
+                              image_file, {}),
+        'postprocess_detection': (postprocess_transforms.get_transform_detection_onnx(),
+                                  detection_outputs, image_info_dict),
+        'postprocess_segmentation': (postprocess_transforms.get_transform_segmentation_onnx(),
+                                     segmentation_outputs, image_info_dict),
+        'postprocess_human_pose': (postprocess_transforms.get_transform_human_pose_estimation_onnx(),
+                                   keypoint_outputs, image_info_dict),
+    }
+    return chains
+
+
+def get_benchmark_cases(chains):
+    '''split each chain into its transforms - each transform gets the output of the previous one in the chain'''
+    cases = {}
+    for chain_name, (transforms, data, info_dict) in chains.items():
+        cases[f'{chain_name}/chain'] = (transforms, data, info_dict)
+        stage_data, stage_info_dict = copy.deepcopy(data), copy.deepcopy(info_dict)
+        for transform_index, transform in enumerate(transforms.transforms):
+            case_name = f'{chain_name}/{transform_index}_{transform.__class__.__name__}'
+            cases[case_name] = (transform, copy.deepcopy(stage_data), copy.deepcopy(stage_info_dict))
+            stage_data, stage_info_dict = transform(stage_data, stage_info_dict)
+        #
+    #
+    return cases
+
+
+def run_case(func, data, info_dict, num_repeats, num_rounds):
+    # the inputs are copied outside of the timed call, as some of the transforms modify them
+    round_times = []
+    for _ in range(num_rounds):
+        elapsed_time = 0.0
+        for _ in range(num_repeats):
+            call_data, call_info_dict = copy.deepcopy(data), copy.deepcopy(info_dict)
+            start_time = time.perf_counter()
+            func(call_data, call_info_dict)
+            elapsed_time += time.perf_counter() - start_time
+        #
+        round_times.append(elapsed_time / num_repeats)
+    #
+    # the fastest round is the least disturbed by the other activity in the system
+    time_per_call = min(round_times)
+    # allocations are measured in a separate call, as tracing slows down the call
+    call_data, call_info_dict = copy.deepcopy(data), copy.deepcopy(info_dict)
+    tracemalloc.start()
+    func(call_data, call_info_dict)
+    _, peak_size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'time_ms': round(time_per_call*1000.0, 4), 'calls_per_sec': round(1.0/max(time_per_call, 1e-9), 1),
+            'peak_alloc_kb': round(peak_size/1024.0, 1)}
+
+
+if __name__ == '__main__':
+    # the cwd must be the root of the respository
+    if os.path.split(os.getcwd())[-1] == 'scripts':
+        os.chdir('../')
+    #
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--image_size', type=int, nargs=2, default=(480, 640), help='height width of the synthetic image')
+    parser.add_argument('--num_repeats', type=int, default=20)
+    parser.add_argument('--num_rounds', type=int, default=3)
+    parser.add_argument('--selection', type=str, nargs='*', default=None, help='wild cards to select the cases by name')
+    parser.add_argument('--output_file', type=str, default=None)
+    parser.add_argument('--baseline_file', type=str, default=None)
+    parser.add_argument('--tolerance', type=float, default=0.2, help='slow down (fraction) that is reported as a regression')
+    cmds = parser.parse_args()
+
+    baseline = None
+    if cmds.baseline_file is not None:
+        with open(cmds.baseline_file) as fp:
+            baseline = yaml.safe_load(fp)
+        #
+    #
+
+    settings = config_dict.ConfigDict()
+    results = {}
+    regressions = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image = synthetic_image(*cmds.image_size)
+        image_file = os.path.join(temp_dir, 'image.jpg')
+        PIL.Image.fromarray(image).save(image_file, quality=90)
+
+        chains = get_benchmark_chains(settings, image_file, image, cmds.image_size)
+        cases = get_benchmark_cases(chains)
+        for case_name, (func, data, info_dict) in cases.items():
+            if cmds.selection is not None and not any(fnmatch.fnmatch(case_name, s) for s in cmds.selection):
+                continue
+            #
+            result = run_case(func, data, info_dict, cmds.num_repeats, cmds.num_rounds)
+            results[case_name] = result
+            result_str = f"{case_name:60s} {result['time_ms']:10.3f} ms {result['calls_per_sec']:10.1f} /s " \
+                         f"{result['peak_alloc_kb']:10.1f} KB peak alloc"
+            if baseline is not None and case_name in baseline:
+                baseline_ms = baseline[case_name]['time_ms']
+                ratio = result['time_ms'] / max(baseline_ms, 1e-9)
+                result_str += f'  x{ratio:.2f} of baseline'
+                if ratio > 1.0 + cmds.tolerance:
+                    result_str += ' - REGRESSION'
+                    regressions.append(case_name)
+                #
+            #
+            print(result_str)
+            sys.stdout.flush()
+        #
+    #
+
+    if cmds.output_file is not None:
+        with open(cmds.output_file, 'w') as fp:
+            yaml.safe_dump(results, fp, sort_keys=False)
+        #
+    #
+    if len(regressions) > 0:
+        print(f'{len(regressions)} regression(s) compared to {cmds.baseline_file}: {regressions}')
+        sys.exit(1)
+    #
@@ -28,7 +28,7 @@
 
 import os
 import argparse
-from jai_benchmark import *
+from jai_benchmark import config_settings, tools
 
 
 if __name__ == '__main__':
@@ -0,0 +1,117 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import contextlib
+import io
+import numpy as np
+import pytest
+
+pycocotools_coco = pytest.importorskip('pycocotools.coco')
+pycocotools_cocoeval = pytest.importorskip('pycocotools.cocoeval')
+
+from jai_benchmark import utils
+
+
+def _random_coco(seed, num_images=60, cat_ids=(1, 2, 3, 5, 7)):
+    rng = np.random.default_rng(seed)
+    images = [{'id': i*3+1, 'height': 200, 'width': 300, 'file_name': f'{i}.jpg'} for i in range(num_images)]
+    categories = [{'id': c, 'name': str(c)} for c in cat_ids]
+    annotations = []
+    for image in images:
+        for _ in range(rng.integers(0, 8)):
+            x, y = rng.uniform(0, 250), rng.uniform(0, 150)
+            # small, medium and large boxes - the ones outside an area range are ignored in that range
+            w, h = rng.choice([rng.uniform(1, 20), rng.uniform(20, 120)]), rng.uniform(1, 100)
+            x, y, w, h = [round(v, 1) if rng.random() < 0.5 else v for v in (x, y, w, h)]
+            annotation = {'id': len(annotations)+1, 'image_id': image['id'], 'category_id': int(rng.choice(cat_ids)),
+                          'bbox': [x, y, w, h], 'area': float(w*h*rng.uniform(0.5, 1)),
+                          'iscrowd': int(rng.random() < 0.1)}
+            if rng.random() < 0.1:
+                # for bbox, COCOeval replaces ignore by iscrowd
+                annotation['ignore'] = 1
+            #
+            annotations.append(annotation)
+        #
+    #
+    coco_gt = pycocotools_coco.COCO()
+    coco_gt.dataset = {'images': images, 'annotations': annotations, 'categories': categories}
+    with contextlib.redirect_stdout(io.StringIO()):
+        coco_gt.createIndex()
+    #
+    # a subset of the images is evaluated, as in COCODetection with num_frames
+    coco_gt.imgs = {image['id']: image for image in images[:int(num_images*0.8)]}
+    detections = []
+    for image_id in coco_gt.imgs:
+        image_anns = coco_gt.imgToAnns[image_id]
+        for _ in range(rng.integers(0, 40)):
+            if len(image_anns) > 0 and rng.random() < 0.5:
+                annotation = image_anns[rng.integers(len(image_anns))]
+                bbox = np.array(annotation['bbox']) + (rng.normal(0, 3, 4) if rng.random() < 0.8 else 0)
+                cat_id = annotation['category_id'] if rng.random() < 0.8 else int(rng.choice(cat_ids + (9,)))
+            else:
+                bbox = np.array([rng.uniform(0, 250), rng.uniform(0, 150), rng.uniform(1, 80), rng.uniform(1, 80)])
+                cat_id = int(rng.choice(cat_ids))
+            #
+            # repeated scores give ties in the sorting of the detections
+            score = float(rng.choice([0.5, 0.9, rng.random()]))
+            detections.append({'image_id': image_id, 'category_id': cat_id, 'bbox': [float(v) for v in bbox],
+                               'score': score})
+        #
+    #
+    return coco_gt, detections
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_coco_bbox_eval_is_identical_to_cocoeval(seed):
+    coco_gt, detections = _random_coco(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        coco_dt = coco_gt.loadRes(detections)
+        reference_eval = pycocotools_cocoeval.COCOeval(coco_gt, coco_dt, iouType='bbox')
+        reference_eval.evaluate()
+        reference_eval.accumulate()
+        reference_eval.summarize()
+    #
+    detections_array = np.zeros((len(detections),), dtype=utils.coco_bbox_detection_dtype)
+    for detection_index, detection in enumerate(detections):
+        detections_array[detection_index] = (detection['image_id'], detection['category_id'], detection['bbox'],
+                                             detection['score'])
+    #
+    img_ids = coco_gt.getImgIds()
+    cat_ids = coco_gt.getCatIds()
+    gt_anns = coco_gt.loadAnns(coco_gt.getAnnIds(imgIds=img_ids, catIds=cat_ids))
+    coco_eval = utils.COCOBBoxEval(gt_anns, detections_array, img_ids, cat_ids, num_workers=1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        coco_eval.evaluate()
+        coco_eval.accumulate()
+        coco_eval.summarize()
+    #
+    np.testing.assert_array_equal(coco_eval.stats, reference_eval.stats)
+    for key in ('precision', 'recall', 'scores'):
+        np.testing.assert_array_equal(coco_eval.eval[key], reference_eval.eval[key])
+    #
@@ -0,0 +1,87 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import zipfile
+
+from jai_benchmark import utils
+from jai_benchmark.utils.download_utils import _extract_zip
+
+
+def _write_item(output_path, item):
+    # the file is returned as it is written - with output_path in it, like the convert functions of the datasets
+    file_name = os.path.join(output_path, 'd', f'{item.replace("/", "-")}.txt')
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    with open(file_name, 'w') as fp:
+        fp.write(item)
+    #
+    return [file_name]
+
+
+def test_prepare_relative_output_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    output_path = './out_rel'
+    # these items would have the same marker, if it was named by the item with the separators replaced
+    items = ['a/b', 'a_b', 'c']
+    preparer = utils.DatasetPreparer(output_path, 'test', num_workers=2)
+    preparer.run(lambda item: _write_item(output_path, item), items)
+    assert preparer.verify(checksum=True)
+    assert sorted(os.listdir(os.path.join(output_path, 'd'))) == ['a-b.txt', 'a_b.txt', 'c.txt']
+
+    # everything is prepared - nothing is converted again
+    converted = []
+    preparer.run(lambda item: converted.append(item) or _write_item(output_path, item), items)
+    assert converted == []
+
+    # a modified file is converted again
+    with open(os.path.join(output_path, 'd', 'c.txt'), 'w') as fp:
+        fp.write('modified')
+    #
+    preparer.run(lambda item: converted.append(item) or _write_item(output_path, item), items)
+    assert converted == ['c']
+    assert preparer.verify(checksum=True)
+
+
+def test_extract_zip_relative_output_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with zipfile.ZipFile('data.zip', 'w') as z:
+        for i in range(10):
+            z.writestr(f'data/sub{i%3}/{i}.txt', str(i))
+        #
+    #
+    _extract_zip('data.zip', './extracted', 'r', files_per_item=3)
+    for i in range(10):
+        with open(os.path.join('extracted', 'data', f'sub{i%3}', f'{i}.txt')) as fp:
+            assert fp.read() == str(i)
+        #
+    #
+    preparer = utils.DatasetPreparer('./extracted', 'data.zip')
+    with open(preparer.manifest_file) as fp:
+        assert 'data/sub0/0.txt' in fp.read()
+    #
@@ -0,0 +1,118 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import numpy as np
+import pytest
+
+from jai_benchmark import utils
+
+
+# reference: the per frame computation of delta_1 in NYUDepthV2Evaluator before DepthEvaluator
+def _reference_compute_scale_and_shift(prediction, gt, mask):
+    a_00 = np.sum(mask * prediction * prediction)
+    a_01 = np.sum(mask * prediction)
+    a_11 = np.sum(mask)
+    b_0 = np.sum(mask * prediction * gt)
+    b_1 = np.sum(mask * gt)
+    det = a_00 * a_11 - a_01 * a_01
+    if det <= 0:
+        return 0, 0
+    else:
+        x_0 = (a_11 * b_0 - a_01 * b_1) / det
+        x_1 = (-a_01 * b_0 + a_00 * b_1) / det
+        return x_0, x_1
+
+
+def _reference_delta_1(predictions, labels, threshold=1.25, depth_cap_max=80, depth_cap_min=1e-3,
+                       disparity=False, scale_and_shift_needed=False):
+    delta_1 = 0.0
+    num_frames = 0
+    for prediction, label_img in zip(predictions, labels):
+        if scale_and_shift_needed:
+            mask = label_img != 0
+            disp_label = np.zeros_like(label_img)
+            disp_label[mask] = 1.0 / label_img[mask]
+            if not disparity:
+                disp_prediction = np.zeros_like(prediction)
+                disp_prediction[prediction != 0] = 1.0 / prediction[prediction != 0]
+            else:
+                disp_prediction = prediction
+            scale, shift = _reference_compute_scale_and_shift(disp_prediction, disp_label, mask)
+            prediction = scale * disp_prediction + shift
+            prediction[prediction < 1 / depth_cap_max] = 1 / depth_cap_max
+            prediction[prediction > 1 / depth_cap_min] = 1 / depth_cap_min
+        mask = np.minimum(label_img, prediction) != 0
+        if disparity:
+            disp_pred = prediction
+            prediction = np.zeros_like(disp_pred)
+            prediction[mask] = 1.0 / disp_pred[mask]
+        delta = np.maximum(prediction[mask] / label_img[mask], label_img[mask] / prediction[mask])
+        good_pixels_in_img = delta < threshold
+        delta_1 += good_pixels_in_img.sum() / mask.sum()
+        num_frames += 1
+    return delta_1 / num_frames * 100
+
+
+def _random_frames(seed, num_frames=6, shape=(48, 64), disparity=False):
+    rng = np.random.default_rng(seed)
+    labels, predictions = [], []
+    for _ in range(num_frames):
+        label = rng.uniform(0.5, 10.0, size=shape).astype(np.float32)
+        # pixels without depth in the label - as in the NYUDepthV2 labels
+        label[rng.random(shape) < 0.2] = 0
+        prediction = (label * rng.uniform(0.7, 1.4, size=shape)).astype(np.float32)
+        prediction[label == 0] = rng.uniform(0.5, 10.0, size=np.count_nonzero(label == 0))
+        if disparity:
+            prediction = (1.0 / prediction).astype(np.float32)
+        #
+        # zero and negative predictions
+        prediction[rng.random(shape) < 0.05] = 0
+        prediction[rng.random(shape) < 0.02] *= -1
+        labels.append(label)
+        predictions.append(prediction)
+    #
+    return predictions, labels
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('disparity', [False, True])
+@pytest.mark.parametrize('scale_shift', [False, True])
+def test_delta_1_is_identical_to_reference(seed, disparity, scale_shift):
+    predictions, labels = _random_frames(seed, disparity=disparity)
+    # a negative prediction where the label is 0 is a valid pixel in both - it divides by 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reference_delta_1 = _reference_delta_1([p.copy() for p in predictions], labels, disparity=disparity,
+                                               scale_and_shift_needed=scale_shift)
+        evaluator = utils.DepthEvaluator(len(labels), lambda frame_idx: labels[frame_idx], disparity=disparity,
+                                         scale_shift=scale_shift)
+        utils.run_evaluator(evaluator, predictions)
+        metric = evaluator.finalize()
+    #
+    assert metric['accuracy_delta_1%'] == reference_delta_1
+    assert np.isfinite(metric['abs_rel']) and np.isfinite(metric['rmse']) and np.isfinite(metric['log_rmse'])
@@ -0,0 +1,160 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import copy
+import numpy as np
+import pytest
+from numpy.lib.stride_tricks import as_strided
+
+pytest.importorskip('cv2')
+munkres = pytest.importorskip('munkres')
+
+from jai_benchmark.postprocess.transforms import HumanPoseHeatmapParser
+
+
+# reference: the per joint loops that HumanPoseHeatmapParser used before nms, top_k and match were vectorized
+def _reference_maxpool2d(parser, A):
+    A = np.pad(A, parser.nms_padding, mode='constant')
+    output_shape = (A.shape[0] - parser.nms_kernel + 1, A.shape[1] - parser.nms_kernel + 1)
+    kernel_size = (parser.nms_kernel, parser.nms_kernel)
+    A_w = as_strided(A, shape=output_shape + kernel_size, strides=A.strides + A.strides)
+    A_w = A_w.reshape(-1, *kernel_size)
+    return A_w.max(axis=(1,2)).reshape(output_shape)
+
+
+def _reference_nms(parser, heatmaps):
+    heatmaps_new = copy.deepcopy(heatmaps)
+    for i, heatmap in enumerate(heatmaps[0]):
+        maxm = np.equal(_reference_maxpool2d(parser, heatmap), heatmap)
+        heatmaps_new[0][i] = heatmap * maxm
+    #
+    return heatmaps_new
+
+
+def _reference_top_k(parser, heatmaps, tags):
+    heatmaps = _reference_nms(parser, heatmaps)
+    N, K, H, W = heatmaps.shape
+    heatmaps = np.reshape(heatmaps, [N, K, -1])
+    ind = np.zeros((N, K, parser.max_num_people), int)
+    val_k = np.zeros((N, K, parser.max_num_people))
+    for i, heatmap in enumerate(heatmaps[0]):
+        ind[0][i] = heatmap.argsort()[-parser.max_num_people:][::-1]
+        val_k[0][i] = heatmap[ind[0][i]]
+    #
+    tags = np.reshape(tags, (tags.shape[0], tags.shape[1], W * H, -1))
+    tag_k = np.concatenate([np.expand_dims(parser.gather(tags[..., i], 2, ind), axis=3)
+                            for i in range(tags.shape[3])], axis=3)
+    ind_k = np.concatenate((np.expand_dims(ind % W, axis=3), np.expand_dims(ind // W, axis=3)), axis=3)
+    return dict(tag_k=tag_k, loc_k=ind_k, val_k=val_k)
+
+
+def _reference_match_by_tag(parser, tag_k, loc_k, val_k):
+    default_ = np.zeros((parser.num_joints, 3 + tag_k.shape[2]), dtype=np.float32)
+    joint_dict = {}
+    tag_dict = {}
+    for i in range(parser.num_joints):
+        idx = parser.joint_order[i]
+        tags = tag_k[idx]
+        joints = np.concatenate((loc_k[idx], val_k[idx, :, None], tags), 1)
+        mask = joints[:, 2] > parser.detection_threshold
+        tags = tags[mask]
+        joints = joints[mask]
+        if joints.shape[0] == 0:
+            continue
+        #
+        if i == 0 or len(joint_dict) == 0:
+            for tag, joint in zip(tags, joints):
+                key = tag[0]
+                joint_dict.setdefault(key, np.copy(default_))[idx] = joint
+                tag_dict[key] = [tag]
+            #
+        else:
+            grouped_keys = list(joint_dict.keys())[:parser.max_num_people]
+            grouped_tags = [np.mean(tag_dict[i], axis=0) for i in grouped_keys]
+            diff = joints[:, None, 3:] - np.array(grouped_tags)[None, :, :]
+            diff_normed = np.linalg.norm(diff, ord=2, axis=2)
+            diff_saved = np.copy(diff_normed)
+            if parser.use_detection_val:
+                diff_normed = np.round(diff_normed) * 100 - joints[:, 2:3]
+            #
+            num_added = diff.shape[0]
+            num_grouped = diff.shape[1]
+            if num_added > num_grouped:
+                diff_normed = np.concatenate((diff_normed, np.zeros((num_added, num_added - num_grouped),
+                                              dtype=np.float32) + 1e10), axis=1)
+            #
+            pairs = np.array(munkres.Munkres().compute(diff_normed)).astype(int)
+            for row, col in pairs:
+                if row < num_added and col < num_grouped and diff_saved[row][col] < parser.tag_threshold:
+                    key = grouped_keys[col]
+                    joint_dict[key][idx] = joints[row]
+                    tag_dict[key].append(tags[row])
+                else:
+                    key = tags[row][0]
+                    joint_dict.setdefault(key, np.copy(default_))[idx] = joints[row]
+                    tag_dict[key] = [tags[row]]
+                #
+            #
+        #
+    #
+    return np.array([joint_dict[i] for i in joint_dict]).astype(np.float32)
+
+
+def _random_outputs(seed, size=64, quantize=False):
+    rng = np.random.default_rng(seed)
+    heatmaps = rng.random((1, 17, size, size)).astype(np.float32)
+    # the tags of a few people with some noise - quantized tags and heatmaps create equal costs in the matching
+    people_tags = rng.uniform(-3, 3, size=(8,))
+    tags = rng.choice(people_tags, size=(1, 17, size, size, 1)) + rng.normal(0, 0.3, size=(1, 17, size, size, 1))
+    tags = tags.astype(np.float32)
+    if quantize:
+        heatmaps = np.round(heatmaps * 8) / 8
+        tags = np.round(tags * 2) / 2
+    #
+    return heatmaps, tags
+
+
+@pytest.mark.parametrize('seed', range(12))
+@pytest.mark.parametrize('quantize', [False, True])
+def test_match_is_identical_to_reference(seed, quantize):
+    parser = HumanPoseHeatmapParser(use_udp=False)
+    heatmaps, tags = _random_outputs(seed, quantize=quantize)
+    np.testing.assert_array_equal(parser.nms(heatmaps), _reference_nms(parser, heatmaps))
+    top_k = parser.top_k(heatmaps, tags)
+    reference_top_k = _reference_top_k(parser, heatmaps, tags)
+    for key, value in reference_top_k.items():
+        np.testing.assert_array_equal(top_k[key], value)
+    #
+    ans = parser.match(**top_k)
+    reference_ans = [_reference_match_by_tag(parser, *inp) for inp in zip(reference_top_k['tag_k'],
+                     reference_top_k['loc_k'], reference_top_k['val_k'])]
+    assert len(ans) == len(reference_ans)
+    for people, reference_people in zip(ans, reference_ans):
+        assert people.dtype == reference_people.dtype
+        np.testing.assert_array_equal(people, reference_people)
+    #
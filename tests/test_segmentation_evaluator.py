@@ -0,0 +1,151 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import numpy as np
+import pytest
+
+from jai_benchmark import utils
+
+
+NUM_CLASSES = 19
+
+
+# reference: the per frame computation in the evaluate() of the segmentation datasets before SegmentationEvaluator
+def _reference_cmatrix(predictions, labels, num_classes, label_lut=None, label_offset_pred=0):
+    cmatrix = None
+    for output, label_img in zip(predictions, labels):
+        label_img = label_lut[label_img] if label_lut is not None else label_img
+        output = output+label_offset_pred
+        output = output.astype(np.uint8)
+        output = output[0] if (output.ndim > 2 and output.shape[0] == 1) else output
+        output = output[:2] if (output.ndim > 2 and output.shape[2] == 1) else output
+        cmatrix = utils.confusion_matrix(cmatrix, output, label_img, num_classes)
+    #
+    return cmatrix
+
+
+def _random_frames(seed, num_frames=6, shape=(24, 32), label_dtype=np.uint8, label_max=256, pred_max=NUM_CLASSES):
+    rng = np.random.default_rng(seed)
+    labels = []
+    predictions = []
+    for _ in range(num_frames):
+        label_img = rng.integers(0, NUM_CLASSES, size=shape)
+        # sprinkle invalid labels - the 255 ignore value and other out of range values
+        invalid = rng.random(shape) < 0.2
+        label_img[invalid] = rng.integers(NUM_CLASSES, label_max, size=int(invalid.sum()))
+        labels.append(label_img.astype(label_dtype))
+        predictions.append(rng.integers(0, pred_max, size=(1,)+shape))
+    #
+    return predictions, labels
+
+
+def _evaluate(predictions, labels, **kwargs):
+    evaluator = utils.SegmentationEvaluator(NUM_CLASSES, len(labels), lambda frame_idx: labels[frame_idx], **kwargs)
+    metric = utils.run_evaluator(evaluator, predictions)
+    return evaluator.cmatrix, metric
+
+
+def _check(predictions, labels, label_lut=None, label_offset_pred=0):
+    cmatrix, metric = _evaluate(predictions, labels, label_lut=label_lut, label_offset_pred=label_offset_pred)
+    reference_cmatrix = _reference_cmatrix(predictions, labels, NUM_CLASSES, label_lut=label_lut,
+                                           label_offset_pred=label_offset_pred)
+    np.testing.assert_array_equal(cmatrix, reference_cmatrix)
+    assert metric == utils.segmentation_accuracy(reference_cmatrix)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_segmentation_evaluator_matches_confusion_matrix(seed):
+    predictions, labels = _random_frames(seed)
+    _check(predictions, labels)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_segmentation_evaluator_label_lut(seed):
+    # a cityscapes like lut - some label values map to classes, the rest to the 255 ignore value
+    rng = np.random.default_rng(100+seed)
+    label_lut = np.full(256, 255, dtype=np.uint8)
+    mapped = rng.choice(256, size=2*NUM_CLASSES, replace=False)
+    label_lut[mapped] = rng.integers(0, NUM_CLASSES, size=len(mapped))
+    predictions, labels = _random_frames(seed)
+    labels = [mapped[rng.integers(0, len(mapped), size=l.shape)].astype(np.uint8) if f % 2 else l
+              for f, l in enumerate(labels)]
+    _check(predictions, labels, label_lut=label_lut)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_segmentation_evaluator_label_offset_pred(seed):
+    # a model trained without the background class - its predictions are offset by 1
+    predictions, labels = _random_frames(seed, pred_max=NUM_CLASSES-1)
+    _check(predictions, labels, label_offset_pred=1)
+
+
+@pytest.mark.parametrize('label_dtype', [np.int32, np.uint16])
+def test_segmentation_evaluator_fallback_label_dtype(label_dtype):
+    # labels that are not 8 bit take the confusion_matrix() path
+    predictions, labels = _random_frames(0, label_dtype=label_dtype, label_max=1000)
+    if np.issubdtype(label_dtype, np.signedinteger):
+        labels[0][:2] = -1
+    #
+    _check(predictions, labels)
+
+
+def _out_of_range_on_invalid_labels(predictions, labels, offset=NUM_CLASSES):
+    # predictions >= num_classes where the label is ignored - they do not reach the confusion matrix
+    return [np.where((l >= NUM_CLASSES)[None], p+offset, p) for p, l in zip(predictions, labels)]
+
+
+def test_segmentation_evaluator_fallback_prediction_range():
+    # predictions >= num_classes take the confusion_matrix() path - with and without label_lut
+    predictions, labels = _random_frames(1)
+    predictions = _out_of_range_on_invalid_labels(predictions, labels)
+    _check(predictions, labels)
+    label_lut = np.where(np.arange(256) < NUM_CLASSES, np.arange(256), 255).astype(np.uint8)
+    _check(predictions, labels, label_lut=label_lut)
+
+
+def test_segmentation_evaluator_fallback_mixed_frames():
+    # frames in the fast path and in the fallback path accumulate into the same confusion matrix
+    predictions, labels = _random_frames(2)
+    predictions[1:3] = _out_of_range_on_invalid_labels(predictions[1:3], labels[1:3])
+    predictions[3] = predictions[3][..., :0]
+    labels[3] = labels[3][:, :0]
+    _check(predictions, labels)
+
+
+def test_segmentation_evaluator_prediction_overflow_raises():
+    # an out of range prediction on a valid label of the last class overflows the confusion matrix -
+    # confusion_matrix() raises in that case and so does the evaluator
+    predictions, labels = _random_frames(3)
+    labels[0][0, 0] = NUM_CLASSES-1
+    predictions[0][0, 0, 0] = NUM_CLASSES
+    with pytest.raises(ValueError):
+        _reference_cmatrix(predictions, labels, NUM_CLASSES)
+    #
+    with pytest.raises(ValueError):
+        _evaluate(predictions, labels)
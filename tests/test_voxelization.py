@@ -0,0 +1,172 @@
+# Copyright (c) 2018-2021, Texas Instruments
+# All Rights Reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+
+from jai_benchmark.preprocess.transforms import Voxelization
+
+
+# reference: the per point loop that Voxelization used before it was vectorized. the only change is that the
+# voxels after the first nw_max_num_voxels are dropped - the loop raised an IndexError for those.
+def _reference_voxelization(voxelization, lidar_data):
+    self = voxelization
+    scratch_1 =[]
+    scratch_2 =[]
+    input0 = np.zeros((1, self.num_feat_per_voxel, self.max_points_per_voxel, self.nw_max_num_voxels),dtype='float32')
+    input1 = np.zeros((1, self.num_channel, (int)(self.num_voxel_x*self.num_voxel_y)),dtype='float32')
+    input2 = np.zeros((1, self.num_channel, self.nw_max_num_voxels),dtype='int32')
+    for i, data in enumerate(lidar_data):
+        x = data[0]
+        y = data[1]
+        z = data[2]
+        if ((x >= self.min_x) and (x < self.max_x) and (y >= self.min_y) and (y < self.max_y) and
+            (z >= self.min_z) and (z < self.max_z)):
+            x_id = (int)(((x - self.min_x) / self.voxel_size_x))
+            y_id = (int)(((y - self.min_y) / self.voxel_size_y))
+            scratch_1.append(y_id * self.num_voxel_x + x_id)
+        else:
+            scratch_1.append(-1 - i)
+        #
+    #
+    num_points = np.zeros(self.nw_max_num_voxels,dtype=int)
+    num_non_empty_voxels = 0
+    for i in range(len(lidar_data)):
+        if (scratch_1[i] >= 0):
+            find_voxel = scratch_1[i] in scratch_1[:i]
+            if find_voxel == False:
+                if num_non_empty_voxels < self.nw_max_num_voxels:
+                    scratch_2.append(num_non_empty_voxels)
+                    input2[0][0][num_non_empty_voxels] = scratch_1[i]
+                    num_non_empty_voxels += 1
+                else:
+                    scratch_2.append(None)
+                #
+            else:
+                k = scratch_1[:i].index(scratch_1[i])
+                scratch_2.append(scratch_2[k])
+            #
+        else:
+            scratch_2.append(None)
+        #
+    #
+    for i in range(len(lidar_data)):
+        if (scratch_1[i] >= 0) and scratch_2[i] is not None:
+            j = scratch_2[i]
+            if(num_points[j]<self.max_points_per_voxel):
+                input0[0][0][num_points[j]][j] = lidar_data[i][0] * self.scale_fact
+                input0[0][1][num_points[j]][j] = lidar_data[i][1] * self.scale_fact
+                input0[0][2][num_points[j]][j] = lidar_data[i][2] * self.scale_fact
+                input0[0][3][num_points[j]][j] = lidar_data[i][3] * self.scale_fact
+                num_points[j] = num_points[j] + 1
+            #
+        #
+    #
+    x_offset = self.voxel_size_x / 2 + self.min_x
+    y_offset = self.voxel_size_y / 2 + self.min_y
+    for i in range(num_non_empty_voxels):
+        x = 0
+        y = 0
+        z = 0
+        for j in range(num_points[i]):
+            x += input0[0][0][j][i]
+            y += input0[0][1][j][i]
+            z += input0[0][2][j][i]
+        #
+        x_avg = x / num_points[i]
+        y_avg = y / num_points[i]
+        z_avg = z / num_points[i]
+        voxel_center_y = (int)(input2[0][0][i] / self.num_voxel_x)
+        voxel_center_x = (int)(input2[0][0][i] - ((int)(voxel_center_y)) * self.num_voxel_x)
+        voxel_center_x *= self.voxel_size_x
+        voxel_center_x += x_offset
+        voxel_center_y *= self.voxel_size_y
+        voxel_center_y += y_offset
+        for j in range(num_points[i]):
+            input0[0][4][j][i] = input0[0][0][j][i] - x_avg
+            input0[0][5][j][i] = input0[0][1][j][i] - y_avg
+            input0[0][6][j][i] = input0[0][2][j][i] - z_avg
+            input0[0][7][j][i] = input0[0][0][j][i] - voxel_center_x * self.scale_fact
+            input0[0][8][j][i] = input0[0][1][j][i] - voxel_center_y * self.scale_fact
+        #
+        for j in range (num_points[i]):
+            input0[0][0][j][i] = input0[0][7][j][i]
+            input0[0][1][j][i] = input0[0][8][j][i]
+        #
+    #
+    input2[0][1:64] = input2[0][0]
+    return (input0,input2,input1), num_points[:num_non_empty_voxels]
+
+
+def _random_point_cloud(seed, num_points, dtype=np.float32):
+    rng = np.random.default_rng(seed)
+    # a part of the points are outside the range in x, y or z
+    low = np.array([-5.0, -45.0, -4.0, 0.0])
+    high = np.array([75.0, 45.0, 2.0, 1.0])
+    return rng.uniform(low, high, size=(num_points, 4)).astype(dtype)
+
+
+def _assert_identical(voxelization, lidar_data):
+    (input0, input2, input1), info_dict = voxelization(lidar_data, {})
+    (ref_input0, ref_input2, ref_input1), ref_num_points = _reference_voxelization(voxelization, lidar_data)
+    # voxels and coordinates
+    for output, ref_output in ((input0, ref_input0), (input2, ref_input2), (input1, ref_input1)):
+        assert output.dtype == ref_output.dtype and output.shape == ref_output.shape
+        np.testing.assert_array_equal(output, ref_output)
+    #
+    # number of points in each voxel - the slots after those are all zeros
+    num_voxels = len(ref_num_points)
+    num_points = np.count_nonzero(np.any(input0[0] != 0, axis=0), axis=0)[:num_voxels]
+    np.testing.assert_array_equal(num_points, ref_num_points)
+    return ref_num_points
+
+
+@pytest.mark.parametrize('num_points', [0, 1, 100, 2000, 8000])
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_voxelization_is_identical_to_reference(num_points, dtype):
+    _assert_identical(Voxelization(), _random_point_cloud(num_points, num_points, dtype))
+
+
+def test_voxelization_max_points_overflow():
+    # many points in a few voxels - each voxel keeps its first max_points_per_voxel points
+    rng = np.random.default_rng(1)
+    lidar_data = np.concatenate([rng.uniform([10.0, 5.0, -1.0, 0.0], [10.3, 5.3, 0.0, 1.0], size=(300, 4)),
+                                 _random_point_cloud(2, 200, np.float64)]).astype(np.float32)
+    voxelization = Voxelization()
+    ref_num_points = _assert_identical(voxelization, lidar_data)
+    assert ref_num_points.max() == voxelization.max_points_per_voxel
+
+
+def test_voxelization_max_voxels_overflow():
+    # more non empty voxels than nw_max_num_voxels - the voxels after the first nw_max_num_voxels are dropped
+    voxelization = Voxelization()
+    voxelization.nw_max_num_voxels = 50
+    ref_num_points = _assert_identical(voxelization, _random_point_cloud(3, 500))
+    assert len(ref_num_points) == voxelization.nw_max_num_voxels